@@ -1,5 +1,7 @@
 from django import forms
 from datetime import datetime
+from src.analysis.pattern_search import compile_pattern
+from src.database.setup_encoding import COLUMNS, ROWS
 
 class FilterForm(forms.Form):
     RESULT_CHOICES = [
@@ -129,4 +131,123 @@ class SetupForm(forms.Form):
             'class': 'form-control',
             'accept': 'image/*'
         })
-    )
\ No newline at end of file
+    )
+
+class HeatmapForm(forms.Form):
+    RESULT_CHOICES = [
+        ('', 'All Results'),
+        ('win', 'Win'),
+        ('draw', 'Draw'),
+        ('loss', 'Loss'),
+    ]
+
+    PIECE_CHOICES = [('', 'Most common piece')] + [
+        (piece, piece) for piece in ('1', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'B', 'F')
+    ]
+
+    opponent = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Enter opponent name (optional)'
+        })
+    )
+
+    result = forms.ChoiceField(
+        choices=RESULT_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+
+    piece = forms.ChoiceField(
+        choices=PIECE_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('opponent') and cleaned_data.get('result'):
+            raise forms.ValidationError('Choose either an opponent or a result, not both.')
+        return cleaned_data
+
+
+class OpponentProfileForm(forms.Form):
+    opponent = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Enter opponent name'
+        })
+    )
+
+
+class PatternSearchForm(forms.Form):
+    """
+    A partial 4x10 board: one optional field per square, named square_<row>_<col>.
+
+    Squares take the syntax of pattern_search ('F', 'B|F', '!B'); empty squares match any piece.
+    """
+    ORDER_CHOICES = [
+        ('games', 'Most games'),
+        ('win_rate', 'Highest win rate'),
+        ('newest', 'Newest'),
+    ]
+
+    order_by = forms.ChoiceField(
+        choices=ORDER_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        })
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for row in range(1, ROWS + 1):
+            for col in range(1, COLUMNS + 1):
+                self.fields[self.square_field_name(row, col)] = forms.CharField(
+                    max_length=40,
+                    required=False,
+                    widget=forms.TextInput(attrs={
+                        'class': 'square-input',
+                        'placeholder': '*',
+                        'title': f'Row {row}, column {col}'
+                    })
+                )
+
+    @staticmethod
+    def square_field_name(row, col):
+        return f'square_{row}_{col}'
+
+    def square_rows(self):
+        """The bound square fields, one list per row, in the order the setup grids are drawn."""
+        return [
+            [self[self.square_field_name(row, col)] for col in range(1, COLUMNS + 1)]
+            for row in range(1, ROWS + 1)
+        ]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        squares = {}
+        for row in range(1, ROWS + 1):
+            for col in range(1, COLUMNS + 1):
+                name = self.square_field_name(row, col)
+                token = (cleaned_data.get(name) or '').strip()
+                if not token:
+                    continue
+                try:
+                    compile_pattern({(row, col): token})
+                except ValueError as e:
+                    self.add_error(name, str(e))
+                else:
+                    squares[(row, col)] = token
+
+        cleaned_data['pattern'] = compile_pattern(squares)
+        cleaned_data['order_by'] = cleaned_data.get('order_by') or 'games'
+        return cleaned_data
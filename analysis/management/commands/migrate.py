@@ -0,0 +1,27 @@
+from django.core.management.commands.migrate import Command as MigrateCommand
+from django.db import connections
+
+from src.database.migrations import apply_migrations
+
+
+class Command(MigrateCommand):
+    """
+    Django's migrate, preceded by the raw migrations of src.database.migrations.
+
+    Databases created before the raw migrations reference GameSetups from GameRecords, which
+    SQLite rejects on any write while foreign keys are enforced, as they are on Django's
+    connections. Django could not even create its migration table in such a file, so the game
+    tables are brought up to date first, with foreign keys off while tables are rebuilt.
+    """
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor == 'sqlite':
+            connection.ensure_connection()
+            conn = connection.connection
+            conn.execute('PRAGMA foreign_keys = OFF')
+            try:
+                apply_migrations(conn)
+            finally:
+                conn.execute('PRAGMA foreign_keys = ON')
+        return super().handle(*args, **options)
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from src.database.migrations import apply_migrations
+
+
+def apply_raw_migrations(apps, schema_editor):
+    """Create or upgrade the tables with src.database.migrations, keeping the existing data."""
+    apply_migrations(schema_editor.connection.connection)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+    # apply_migrations runs every raw migration in its own transaction
+    atomic = False
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(apply_raw_migrations, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='Opponent',
+                    fields=[
+                        ('opponent_id', models.AutoField(primary_key=True, serialize=False)),
+                        ('opponent_name', models.TextField()),
+                    ],
+                    options={
+                        'db_table': 'Opponents',
+                    },
+                ),
+                migrations.CreateModel(
+                    name='Setup',
+                    fields=[
+                        ('setup_id', models.IntegerField(primary_key=True, serialize=False)),
+                        ('fingerprint', models.TextField(unique=True)),
+                    ],
+                    options={
+                        'db_table': 'Setups',
+                    },
+                ),
+                migrations.CreateModel(
+                    name='GameRecord',
+                    fields=[
+                        ('record_id', models.AutoField(primary_key=True, serialize=False)),
+                        ('date_played', models.TextField(null=True)),
+                        ('opponent_name', models.TextField(null=True)),
+                        ('result', models.TextField(null=True)),
+                        ('moves', models.IntegerField(null=True)),
+                        ('noob_killer', models.IntegerField(default=0, null=True)),
+                        ('opponent', models.ForeignKey(db_column='opponent_id', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='game_records', to='analysis.opponent')),
+                        ('setup', models.ForeignKey(db_column='setup_id', on_delete=django.db.models.deletion.DO_NOTHING, related_name='game_records', to='analysis.setup')),
+                    ],
+                    options={
+                        'db_table': 'GameRecords',
+                        'indexes': [models.Index(fields=['opponent_name', 'result', 'moves', 'date_played', 'setup'], name='idx_game_records_filters')],
+                    },
+                ),
+                migrations.CreateModel(
+                    name='SetupSquare',
+                    fields=[
+                        ('position_id', models.AutoField(primary_key=True, serialize=False)),
+                        ('row', models.IntegerField()),
+                        ('col', models.IntegerField()),
+                        ('piece', models.CharField(max_length=10)),
+                        ('setup', models.ForeignKey(db_column='setup_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='squares', to='analysis.setup')),
+                    ],
+                    options={
+                        'db_table': 'GameSetups',
+                        'indexes': [models.Index(fields=['setup', 'row', 'col', 'piece'], name='idx_setup_row_col_piece'), models.Index(fields=['row', 'col', 'piece', 'setup'], name='idx_square_piece_setup')],
+                        'constraints': [models.UniqueConstraint(fields=('setup', 'row', 'col'), name='unique_position')],
+                    },
+                ),
+            ],
+        ),
+    ]
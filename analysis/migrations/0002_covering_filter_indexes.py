@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+from src.database.migrations import apply_migrations
+
+
+def apply_raw_migrations(apps, schema_editor):
+    """Create the indexes with src.database.migrations (migration 7)."""
+    apply_migrations(schema_editor.connection.connection)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(apply_raw_migrations, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='gamerecord',
+                    name='idx_game_records_filters',
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['opponent_name', 'result', 'noob_killer', 'moves', 'date_played', 'setup'], name='idx_game_records_filters'),
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['result', 'noob_killer', 'moves', 'date_played', 'opponent_name', 'setup'], name='idx_game_records_result'),
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['noob_killer', 'moves', 'date_played', 'opponent_name', 'result', 'setup'], name='idx_game_records_noob_killer'),
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['moves', 'date_played', 'opponent_name', 'result', 'noob_killer', 'setup'], name='idx_game_records_moves'),
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['date_played', 'moves', 'opponent_name', 'result', 'noob_killer', 'setup'], name='idx_game_records_date'),
+                ),
+                migrations.AddIndex(
+                    model_name='gamerecord',
+                    index=models.Index(fields=['setup'], name='idx_game_records_setup'),
+                ),
+            ],
+        ),
+    ]
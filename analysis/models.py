@@ -1,3 +1,105 @@
+"""
+Django models for the game data in data/sqlite_database.db.
+
+The tables are created and migrated by src.database.migrations, which the command line tools
+and the upload workers use without Django. The Django migrations of this app only record the
+models and apply those raw migrations (see management/commands/migrate.py), so both share one
+schema and one database file.
+"""
 from django.db import models
 
-# Create your models here.
+
+class Opponent(models.Model):
+    opponent_id = models.AutoField(primary_key=True)
+    opponent_name = models.TextField()
+
+    class Meta:
+        db_table = 'Opponents'
+
+    def __str__(self):
+        return self.opponent_name
+
+
+class Setup(models.Model):
+    """A distinct stored setup with its canonical fingerprint (see setup_encoding)."""
+    # Setup ids are assigned by setup_to_sql when a setup is stored, not by the database
+    setup_id = models.IntegerField(primary_key=True)
+    fingerprint = models.TextField(unique=True)
+
+    class Meta:
+        db_table = 'Setups'
+
+    def __str__(self):
+        return f"Setup {self.setup_id}"
+
+
+class SetupSquare(models.Model):
+    """The piece on one square of a setup, with 1-based row and column."""
+    position_id = models.AutoField(primary_key=True)
+    # GameSetups predates Setups and has no foreign key to it
+    setup = models.ForeignKey(Setup, models.DO_NOTHING, db_column='setup_id', db_constraint=False,
+                              related_name='squares')
+    row = models.IntegerField()
+    col = models.IntegerField()
+    piece = models.CharField(max_length=10)
+
+    class Meta:
+        db_table = 'GameSetups'
+        constraints = [
+            models.UniqueConstraint(fields=['setup', 'row', 'col'], name='unique_position'),
+        ]
+        indexes = [
+            models.Index(fields=['setup', 'row', 'col', 'piece'], name='idx_setup_row_col_piece'),
+            models.Index(fields=['row', 'col', 'piece', 'setup'], name='idx_square_piece_setup'),
+        ]
+
+
+class GameRecordQuerySet(models.QuerySet):
+
+    def filter_params(self, filter_params):
+        """
+        Apply the filters built by views.build_filter_params.
+
+        Matches build_conditions_and_params: exact filters apply when their value is not None,
+        range filters only when both bounds are given.
+        """
+        lookups = {}
+        for key, field in (('opponent', 'opponent_name'), ('result', 'result'), ('noob_killer', 'noob_killer')):
+            if filter_params.get(key) is not None:
+                lookups[field] = filter_params[key]
+        for min_key, max_key, field in (('min_moves', 'max_moves', 'moves'), ('start_date', 'end_date', 'date_played')):
+            if filter_params.get(min_key) and filter_params.get(max_key):
+                lookups[f'{field}__range'] = (filter_params[min_key], filter_params[max_key])
+        return self.filter(**lookups)
+
+
+class GameRecord(models.Model):
+    record_id = models.AutoField(primary_key=True)
+    setup = models.ForeignKey(Setup, models.DO_NOTHING, db_column='setup_id', related_name='game_records')
+    # Dates are stored as entered, which is not always ISO format, so they are compared as text
+    date_played = models.TextField(null=True)
+    opponent_name = models.TextField(null=True)
+    result = models.TextField(null=True)
+    moves = models.IntegerField(null=True)
+    noob_killer = models.IntegerField(null=True, default=0)
+    opponent = models.ForeignKey(Opponent, models.DO_NOTHING, db_column='opponent_id', null=True,
+                                 related_name='game_records')
+
+    objects = GameRecordQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'GameRecords'
+        # See migrations.GAME_RECORD_FILTER_INDEXES
+        indexes = [
+            models.Index(fields=['opponent_name', 'result', 'noob_killer', 'moves', 'date_played', 'setup'],
+                         name='idx_game_records_filters'),
+            models.Index(fields=['result', 'noob_killer', 'moves', 'date_played', 'opponent_name', 'setup'],
+                         name='idx_game_records_result'),
+            models.Index(fields=['noob_killer', 'moves', 'date_played', 'opponent_name', 'result', 'setup'],
+                         name='idx_game_records_noob_killer'),
+            models.Index(fields=['moves', 'date_played', 'opponent_name', 'result', 'noob_killer', 'setup'],
+                         name='idx_game_records_moves'),
+            models.Index(fields=['date_played', 'moves', 'opponent_name', 'result', 'noob_killer', 'setup'],
+                         name='idx_game_records_date'),
+            models.Index(fields=['setup'], name='idx_game_records_setup'),
+        ]
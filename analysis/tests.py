@@ -1,3 +1,588 @@
-from django.test import TestCase
+"""
+Tests for the database layer and the stores and pipelines built on it.
 
-# Create your tests here.
+Query plans: every combination of the filters of build_conditions_and_params is run through the filter view's
+ORM queries and through StrategoDatabase, and the executed statements are checked with
+EXPLAIN QUERY PLAN. A filtered query must only search indexes; an unfiltered one may scan an
+index in order, but never read a whole table. The pattern search must find its candidate setups
+in the piece index of one square, and its statistics walk the bound list of matching setup ids
+and must find each setup and its games through indexes.
+
+The other tests that need a database run against a temporary one migrated by
+src.database.migrations, never data/sqlite_database.db, and store games through the regular
+ingest path.
+"""
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from contextlib import closing
+from unittest import mock
+
+import numpy as np
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from src.analysis.opponent_profile import get_opponent_profile
+from src.analysis.pattern_search import compile_pattern, find_matching_setups, query_matching_setups
+from src.api.transcription_cache import TranscriptionCache
+from src.benchmarks.synthetic_data import random_setup
+from src.checks.setup_repair import auto_repair, repair_setup
+from src.checks.similarity_check import find_most_similar_setups
+from src.database.bulk_import import BulkImporter, parse_date, read_checkpoint
+from src.database.filter_cache import filter_result_cache
+from src.database.migrations import apply_migrations
+from src.database.setup_encoding import COLUMNS, PIECES, SQUARES, encode_setup, setup_to_pieces, square_mask
+from src.database.setup_matrix import SetupMatrix, get_setup_matrix, reset_setup_matrices
+from src.database.setup_to_sql import SetupProcessor
+from src.database.sqlite_database import (
+    SETUP_RESULT_ORDERINGS,
+    StrategoDatabase,
+    close_thread_connections,
+    get_db_connection,
+)
+from src.imaging.piece_classifier import (
+    MIN_EXAMPLES_PER_PIECE,
+    BoardClassification,
+    PieceClassifier,
+    classify_screenshot,
+    few_shot_training_examples,
+)
+from src.imaging.preprocess import load_image
+from src.jobs.upload_jobs import STATUS_DONE, STATUS_FAILED, STATUS_NEEDS_REVIEW, UploadJobQueue, process_upload_job
+from src.parsing.parse_setup import SetupParseError, parse_setup, parse_setup_stream
+
+from .models import GameRecord, Setup
+from .views import FilteredSetupList, handle_json_edit
+
+FILTER_VALUES = {
+    'opponent': {'opponent': 'ConKord'},
+    'result': {'result': 'win'},
+    'noob_killer': {'noob_killer': 1},
+    'moves': {'min_moves': 50, 'max_moves': 400},
+    'dates': {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+}
+
+# A plan step that reads every row of a table, e.g. "SCAN GameRecords" or "SCAN r"
+FULL_TABLE_SCAN = re.compile(r'^SCAN \w+( AS \w+)?$')
+
+
+def filter_combinations():
+    """Yield (names, filter_params) for every combination of FILTER_VALUES, including no filters."""
+    for size in range(len(FILTER_VALUES) + 1):
+        for names in itertools.combinations(FILTER_VALUES, size):
+            filter_params = {}
+            for name in names:
+                filter_params.update(FILTER_VALUES[name])
+            yield names, filter_params
+
+
+def query_plan(execute, sql):
+    """Return the details of the EXPLAIN QUERY PLAN steps of a statement with inlined parameters."""
+    return [row[3] for row in execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+
+class QueryPlanAssertions:
+
+    def assertUsesIndexes(self, plan, sql, filtered=True):
+        """Fail on full table scans, and on any scan at all if the query is filtered."""
+        if filtered:
+            scans = [detail for detail in plan if detail.startswith('SCAN ')]
+        else:
+            scans = [detail for detail in plan if FULL_TABLE_SCAN.match(detail)]
+        self.assertFalse(scans, f"{sql}\nscans: {scans}")
+
+
+class FilterViewQueryPlanTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # A game that matches every filter, so every combination loads a page
+        setup = Setup.objects.create(setup_id=1, fingerprint='F' + 'B' * (SQUARES - 1))
+        GameRecord.objects.create(setup=setup, date_played='2024-06-01', opponent_name='ConKord',
+                                  result='win', moves=100, noob_killer=1)
+
+    def setUp(self):
+        filter_result_cache.clear()
+        patcher = mock.patch('analysis.views.get_cache_generation', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_filter_combinations_use_indexes(self):
+        with connection.cursor() as cursor:
+            for names, filter_params in filter_combinations():
+                with self.subTest(filters=names):
+                    with CaptureQueriesContext(connection) as queries:
+                        filtered = FilteredSetupList(filter_params)
+                        filtered.count()
+                        filtered[0:10]
+                    # The count, and the page joined with its setups
+                    self.assertEqual(len(queries), 2)
+                    for query in queries:
+                        plan = query_plan(cursor.execute, query['sql'])
+                        self.assertUsesIndexes(plan, query['sql'], filtered=bool(names))
+
+
+class TemporaryDatabaseMixin:
+    """A migrated, empty database file per test, used through StrategoDatabase."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'stratego.db')
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            apply_migrations(conn)
+        self.addCleanup(close_thread_connections, self.db_path)
+        self.database = StrategoDatabase(self.db_path)
+
+    def store_game(self, setup, **details):
+        """Store a game through the regular ingest path and return its setup_id."""
+        setup_details = {'date_played': '2024-06-01', 'opponent_name': 'ConKord', 'result': 'win',
+                         'moves': 100, 'noob_killer': 0, 'setup': setup}
+        setup_details.update(details)
+        return SetupProcessor(self.database).process_setup(setup_details)
+
+
+class StrategoDatabaseQueryPlanTests(TemporaryDatabaseMixin, QueryPlanAssertions, SimpleTestCase):
+
+    def executed_statements(self, call):
+        """Run call and return the statements it executed on the pooled connection."""
+        statements = []
+        with get_db_connection(self.db_path) as conn:
+            conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            with get_db_connection(self.db_path) as conn:
+                conn.set_trace_callback(None)
+        return [statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]
+
+    def assertStatementsUseIndexes(self, call, filtered=True):
+        statements = self.executed_statements(call)
+        self.assertTrue(statements)
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        for sql in statements:
+            self.assertUsesIndexes(query_plan(conn.execute, sql), sql, filtered)
+
+    def test_filter_combinations_use_indexes(self):
+        for names, filter_params in filter_combinations():
+            with self.subTest(filters=names):
+                self.assertStatementsUseIndexes(
+                    lambda: self.database.count_setups_with_game_record_filters(**filter_params), bool(names))
+                self.assertStatementsUseIndexes(
+                    lambda: self.database.get_setup_id_page_with_game_record_filters(10, 20, **filter_params),
+                    bool(names))
+                self.assertStatementsUseIndexes(
+                    lambda: self.database.get_setup_id_with_game_record_filters(**filter_params), bool(names))
+
+    def test_square_lookups_use_indexes(self):
+        self.assertStatementsUseIndexes(lambda: self.database.get_pieces_at_position(2, 3))
+        self.assertStatementsUseIndexes(lambda: self.database.get_pieces_at_position_for_opponent('ConKord', 2, 3))
+        self.assertStatementsUseIndexes(lambda: self.database.get_setups_with_setup_ids([3, 1, 2]))
+        self.assertStatementsUseIndexes(lambda: self.database.get_setup_fingerprints_after(2))
+        self.assertStatementsUseIndexes(lambda: self.database.get_opponent_setup_results('ConKord'))
+        self.assertStatementsUseIndexes(lambda: self.database.get_setup_ids_by_flag_and_bombs(3, square_mask([2, 4, 13])))
+
+    def test_pattern_search_uses_indexes(self):
+        # The setups come from the piece index of one square, the bitboards are checked per setup
+        for pattern in ({(4, 1): 'F', (3, 1): 'B', (4, 2): 'B'}, {(1, 5): '2|3', (2, 5): '!B|F'}):
+            with self.subTest(pattern=pattern):
+                self.assertStatementsUseIndexes(lambda: query_matching_setups(pattern, self.database))
+
+    def test_pattern_search_results_use_indexes(self):
+        # The ids are read through json_each, any other table must be searched
+        self.assertStatementsUseIndexes(lambda: self.database.get_setup_result_totals([3, 1, 2]), filtered=False)
+        for order_by in SETUP_RESULT_ORDERINGS:
+            with self.subTest(order_by=order_by):
+                self.assertStatementsUseIndexes(
+                    lambda: self.database.get_setup_results_page([3, 1, 2], 10, 0, order_by), filtered=False)
+
+
+class SetupMatrixSyncTests(TemporaryDatabaseMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_setup_matrices()
+        self.addCleanup(reset_setup_matrices)
+        self.rng = random.Random(0)
+
+    def test_setups_stored_after_loading_are_appended(self):
+        first_id = self.store_game(random_setup(self.rng))
+        setup_matrix = get_setup_matrix(self.database)
+        self.assertEqual(setup_matrix.setup_ids.tolist(), [first_id])
+
+        # Only the cache generation tells the loaded matrix about it, as for a bulk import or another worker
+        setup = random_setup(self.rng)
+        second_id = self.store_game(setup)
+
+        self.assertIs(get_setup_matrix(self.database), setup_matrix)
+        self.assertEqual(setup_matrix.setup_ids.tolist(), [first_id, second_id])
+        self.assertTrue(np.array_equal(setup_matrix.get(second_id), encode_setup(setup)))
+
+    def test_pattern_search_finds_setups_stored_after_loading(self):
+        setup = random_setup(self.rng)
+        pattern = {(int(row), col): piece for row, pieces in setup.items()
+                   for col, piece in enumerate(pieces, start=1) if piece in ('F', 'B')}
+        first_id = self.store_game(setup)
+        self.assertEqual(find_matching_setups(pattern, database=self.database), [first_id])
+
+        # The same flag and bombs with two other pieces swapped
+        pieces = setup_to_pieces(setup)
+        marshal, general = pieces.index('10'), pieces.index('9')
+        pieces[marshal], pieces[general] = '9', '10'
+        variant = {str(row + 1): pieces[row * COLUMNS:(row + 1) * COLUMNS] for row in range(len(setup))}
+        variant_id = self.store_game(variant)
+        self.store_game(random_setup(self.rng))
+
+        self.assertEqual(find_matching_setups(pattern, database=self.database), [first_id, variant_id])
+
+    def test_indexed_query_matches_the_bitboards(self):
+        setups = [random_setup(self.rng) for _ in range(40)]
+        for setup in setups:
+            self.store_game(setup)
+        pieces = setup_to_pieces(setups[0])
+        patterns = [
+            {(4, 1): 'F'},
+            {(int(row), col): piece for row, row_pieces in setups[0].items()
+             for col, piece in enumerate(row_pieces, start=1) if piece in ('F', 'B')},
+            {(1, 1): '2|3', (2, 1): '!B', (3, 3): '!2|3|4'},
+            {(4, col): '!F' for col in range(1, COLUMNS + 1)},
+            {(1, 1): pieces[0], (4, 10): pieces[-1]},
+        ]
+        for pattern in patterns:
+            with self.subTest(pattern=pattern):
+                self.assertIsNotNone(compile_pattern(pattern).indexed_square)
+                self.assertEqual(query_matching_setups(pattern, self.database),
+                                 find_matching_setups(pattern, database=self.database))
+
+    def test_unchanged_generation_reads_no_setups(self):
+        self.store_game(random_setup(self.rng))
+        get_setup_matrix(self.database)
+        with mock.patch.object(StrategoDatabase, 'get_setup_fingerprints_after') as fingerprints_after:
+            get_setup_matrix(self.database)
+        fingerprints_after.assert_not_called()
+
+
+class SetupParserTests(SimpleTestCase):
+
+    def setUp(self):
+        self.setup = random_setup(random.Random(0))
+        self.rows = {row: str(pieces) for row, pieces in self.setup.items()}
+
+    def assertParses(self, text):
+        self.assertEqual(parse_setup(text).setup, self.setup)
+        # Streamed a character at a time, it stops at the end of the setup
+        self.assertEqual(parse_setup_stream(iter(text)).setup, self.setup)
+
+    def test_code_fences(self):
+        self.assertParses(f"```json\n{json.dumps(self.rows, indent=2)}\n```")
+
+    def test_missing_commas_between_rows(self):
+        self.assertParses('{' + '\n'.join(f'"{row}": {json.dumps(pieces)}' for row, pieces in self.setup.items()) + '}')
+
+    def test_trailing_braces(self):
+        self.assertParses(json.dumps(self.setup) + '}}')
+
+    def test_prose_with_braces_before_the_setup(self):
+        self.assertParses(f'Here is the setup in the {{"row": pieces}} format {{}} you asked for: {json.dumps(self.rows)}')
+
+    def test_single_quoted_keys(self):
+        self.assertParses(repr(self.setup))
+
+    def test_string_rows_without_brackets(self):
+        rows = [f'"{row}": "{", ".join(pieces)}"' for row, pieces in self.setup.items()]
+        rows[1] = f"'2': '{' '.join(self.setup['2'])}'"
+        self.assertParses('{' + ', '.join(rows) + '}')
+
+    def test_errors_after_the_first_row_number_are_reported(self):
+        with self.assertRaisesRegex(SetupParseError, "Row 1 has 9 pieces"):
+            parse_setup(json.dumps({**self.setup, '1': self.setup['1'][:9]}))
+        with self.assertRaisesRegex(SetupParseError, "No JSON object found"):
+            parse_setup("I cannot read this {screenshot}.")
+
+
+class SetupRepairTests(SimpleTestCase):
+
+    def setUp(self):
+        self.setup = random_setup(random.Random(0))
+        self.pieces = setup_to_pieces(self.setup)
+
+    def test_misread_piece_is_ranked_first(self):
+        marshal = self.pieces.index('10')
+        transcription = list(self.pieces)
+        transcription[marshal] = '9'
+        confidences = np.ones(SQUARES)
+        confidences[marshal] = 0.2
+        transcribed_setup = {row: transcription[(int(row) - 1) * COLUMNS:int(row) * COLUMNS] for row in self.setup}
+
+        suggestions = repair_setup(transcribed_setup, confidences)
+        self.assertEqual(suggestions[0].pieces, self.pieces)
+        self.assertEqual([suggestion.cost for suggestion in suggestions],
+                         sorted(suggestion.cost for suggestion in suggestions))
+        # Changing the real general costs more
+        self.assertGreater(suggestions[1].cost, suggestions[0].cost)
+        self.assertEqual(auto_repair(transcribed_setup, confidences).pieces, self.pieces)
+
+    def test_missed_piece_is_ranked_first(self):
+        row, column = '4', 5
+        transcribed_setup = dict(self.setup)
+        transcribed_setup[row] = self.setup[row][:column] + self.setup[row][column + 1:]
+        # The screenshot clearly shows the true pieces
+        square_costs = np.ones((SQUARES, len(PIECES)))
+        square_costs[np.arange(SQUARES), encode_setup(self.setup)] = 0.0
+
+        suggestions = repair_setup(transcribed_setup, square_costs=square_costs)
+        self.assertEqual(suggestions[0].pieces, self.pieces)
+        self.assertIn(f"Row {row}: missed piece at column {column + 1}", suggestions[0].changes)
+        self.assertTrue(all(suggestion.cost > suggestions[0].cost for suggestion in suggestions[1:]))
+        self.assertEqual(auto_repair(transcribed_setup, square_costs=square_costs).pieces, self.pieces)
+
+
+class SimilaritySearchTests(SimpleTestCase):
+
+    def test_ties_at_the_cutoff_prefer_the_most_recent_setups(self):
+        setup = random_setup(random.Random(0))
+        setup_matrix = SetupMatrix()
+        # Many identical setups, so every candidate ties with the same score
+        for setup_id in random.Random(1).sample(range(1, 1001), 200):
+            setup_matrix.append(setup_id, setup)
+
+        expected = sorted(setup_matrix.setup_ids.tolist(), reverse=True)[:5]
+        self.assertEqual(find_most_similar_setups(setup, top_k=5, setup_matrix=setup_matrix),
+                         [(setup_id, SQUARES) for setup_id in expected])
+
+
+class OpponentProfileCacheTests(TemporaryDatabaseMixin, SimpleTestCase):
+
+    def test_profile_is_rebuilt_after_any_ingest(self):
+        rng = random.Random(0)
+        self.store_game(random_setup(rng), opponent_name='Tester')
+        profile = get_opponent_profile('Tester', self.database)
+        self.assertEqual(profile['games'], 1)
+        self.assertIs(get_opponent_profile('Tester', self.database), profile)
+
+        self.store_game(random_setup(rng), opponent_name='Tester', result='loss')
+
+        profile = get_opponent_profile('Tester', self.database)
+        self.assertEqual(profile['games'], 2)
+        self.assertEqual(profile['results'], {'win': 1, 'draw': 0, 'loss': 1})
+
+
+class UploadJobTests(TemporaryDatabaseMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.queue = UploadJobQueue(self.database)
+        self.setup_details = {'date_played': '2024-06-01', 'opponent_id': None, 'opponent_name': 'ConKord',
+                              'result': 'win', 'moves': 100, 'noob_killer': 0}
+        self.setup = random_setup(random.Random(0))
+
+    def game_count(self):
+        with get_db_connection(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM GameRecords").fetchone()[0]
+
+    def store(self, setup_details, setup, job_id=None):
+        return SetupProcessor(self.database).process_setup({**setup_details, 'setup': setup}, job_id)
+
+    def process(self, job, transcription, learn=lambda image_path, setup: None):
+        return process_upload_job(self.queue, job, transcribe=lambda image_path: transcription, store=self.store,
+                                  repair=lambda image_path, setup: self.setup, learn=learn)
+
+    def submit_review(self, job_id, setup):
+        request = RequestFactory().post('/add-setup/', {
+            **{key: '' if value is None else value for key, value in self.setup_details.items()},
+            'opponent_name_input': 'ConKord', 'edited_json': json.dumps(setup), 'job_id': job_id,
+        })
+        request._messages = CookieStorage(request)
+        with mock.patch('analysis.views.UploadJobQueue', lambda: UploadJobQueue(self.database)), \
+                mock.patch('analysis.views.process_game_setup',
+                           lambda details, upload_job_id=None: self.store(details, details['setup'], upload_job_id)), \
+                mock.patch('analysis.views.learn_confirmed_image') as learn:
+            handle_json_edit(request)
+        return learn
+
+    def test_submitting_a_review_twice_stores_one_game(self):
+        job_id = self.queue.create_job('/nonexistent/screenshot.png', self.setup_details)
+        self.queue.finish_job(job_id, STATUS_NEEDS_REVIEW, transcribed_setup=self.setup, error='Too many bombs')
+
+        self.submit_review(job_id, self.setup).assert_called_once()
+        self.submit_review(job_id, self.setup).assert_not_called()
+
+        self.assertEqual(self.game_count(), 1)
+        job = self.queue.get_job(job_id)
+        self.assertEqual(job['status'], STATUS_DONE)
+        self.assertIsNotNone(job['setup_id'])
+
+    def test_rejected_review_can_be_submitted_again(self):
+        job_id = self.queue.create_job('/nonexistent/screenshot.png', self.setup_details)
+        self.queue.finish_job(job_id, STATUS_NEEDS_REVIEW, transcribed_setup=self.setup, error='Too many bombs')
+        invalid_setup = {row: ['B'] * len(pieces) for row, pieces in self.setup.items()}
+
+        self.submit_review(job_id, invalid_setup).assert_not_called()
+        self.assertEqual(self.queue.get_job(job_id)['status'], STATUS_NEEDS_REVIEW)
+
+        self.submit_review(job_id, self.setup).assert_called_once()
+        self.assertEqual(self.game_count(), 1)
+
+    def test_only_unrepaired_transcriptions_are_offered_to_the_classifier(self):
+        invalid_setup = {row: ['B'] * len(pieces) for row, pieces in self.setup.items()}
+        for transcription, expected_learned in ((self.setup, [self.setup]), (invalid_setup, [])):
+            job_id = self.queue.create_job('/nonexistent/screenshot.png', self.setup_details)
+            learned = []
+            status = self.process(self.queue.claim_next_job(), transcription,
+                                  learn=lambda image_path, setup: learned.append(setup))
+            self.assertEqual(status, STATUS_DONE)
+            self.assertEqual(self.queue.get_job(job_id)['transcribed_setup'], self.setup)
+            self.assertEqual(learned, expected_learned)
+
+    def test_worker_dying_after_the_commit_stores_the_game_once(self):
+        job_id = self.queue.create_job('/nonexistent/screenshot.png', self.setup_details)
+        job = self.queue.claim_next_job()
+        # The game is committed, then the worker dies before anything else happens
+        with self.assertRaises(SystemExit):
+            self.process(job, self.setup, learn=mock.Mock(side_effect=SystemExit))
+        self.assertEqual(self.game_count(), 1)
+        self.assertEqual(self.queue.get_job(job_id)['status'], STATUS_DONE)
+
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("UPDATE UploadJobs SET updated_at = datetime('now', '-1 day')")
+            conn.commit()
+        self.assertEqual(self.queue.requeue_stale_jobs(), 0)
+        # Running the job again anyway stores nothing
+        self.assertEqual(self.process(job, self.setup), STATUS_DONE)
+        self.assertEqual(self.game_count(), 1)
+
+    def test_failed_status_update_stores_no_game(self):
+        job_id = self.queue.create_job('/nonexistent/screenshot.png', self.setup_details)
+        with get_db_connection(self.db_path) as conn:
+            conn.execute(f"""
+                         CREATE TRIGGER fail_job_done BEFORE UPDATE ON UploadJobs WHEN NEW.status = '{STATUS_DONE}'
+                         BEGIN SELECT RAISE(ABORT, 'database is locked'); END
+                         """)
+            conn.commit()
+
+        self.assertEqual(self.process(self.queue.claim_next_job(), self.setup), STATUS_FAILED)
+        self.assertEqual(self.game_count(), 0)
+        self.assertEqual(self.queue.get_job(job_id)['setup_id'], None)
+
+
+class TranscriptionCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = TranscriptionCache(directory.name)
+        self.setup = random_setup(random.Random(0))
+
+    def test_overwriting_an_entry_counts_its_size_once(self):
+        self.cache.put('ab01', {'1': ['B']})
+        for _ in range(3):
+            self.cache.put('ab02', self.setup)
+        self.cache.put('ab01', self.setup)
+        self.assertEqual(self.cache._size, self.cache._scan_size())
+
+
+class PieceClassifierTests(SimpleTestCase):
+
+    def setUp(self):
+        self.setup = random_setup(random.Random(0))
+        self.image = Image.new('RGB', (100, 40))
+
+    def classify(self, scores):
+        """Run classify_screenshot with a trained classifier that scores the cells as given."""
+        classifier = PieceClassifier(counts=np.full(len(PIECES), MIN_EXAMPLES_PER_PIECE))
+        classifier.classify = lambda image: BoardClassification(scores)
+        with mock.patch('src.imaging.piece_classifier.get_piece_classifier', return_value=classifier):
+            return classify_screenshot(self.image)
+
+    def test_few_examples_per_piece_are_not_enough(self):
+        counts = np.full(len(PIECES), MIN_EXAMPLES_PER_PIECE)
+        self.assertTrue(PieceClassifier(counts=counts).is_trained)
+        counts[PIECES.index('F')] -= 1
+        self.assertFalse(PieceClassifier(counts=counts).is_trained)
+
+    def test_a_screenshot_is_learned_once(self):
+        image_path, setup = next(iter(few_shot_training_examples()))
+        classifier = PieceClassifier()
+        self.assertTrue(classifier.add_example(load_image(image_path), setup))
+        counts = classifier.counts.copy()
+        # The same pixels from another encoding, and after the templates were saved and loaded
+        with open(image_path, 'rb') as file:
+            self.assertFalse(classifier.add_example(load_image(file.read()), setup))
+        with tempfile.TemporaryDirectory() as directory:
+            model_path = os.path.join(directory, 'piece_templates.npz')
+            classifier.save(model_path)
+            classifier = PieceClassifier.load(model_path)
+        self.assertFalse(classifier.add_example(load_image(image_path), setup))
+        self.assertTrue(np.array_equal(classifier.counts, counts))
+
+    def test_confident_consistent_board_is_accepted(self):
+        scores = np.zeros((SQUARES, len(PIECES)))
+        scores[np.arange(SQUARES), encode_setup(self.setup)] = 1.0
+        self.assertEqual(self.classify(scores), self.setup)
+
+    def test_board_that_needs_repair_falls_back_to_the_model(self):
+        codes = encode_setup(self.setup)
+        scores = np.zeros((SQUARES, len(PIECES)))
+        scores[np.arange(SQUARES), codes] = 1.0
+        # One cell is read, confidently, as a second flag
+        flag = PIECES.index('F')
+        square = int(np.flatnonzero(codes != flag)[0])
+        scores[square] = 0.0
+        scores[square, flag] = 1.0
+        self.assertIsNone(self.classify(scores))
+
+
+class BulkImportTests(TemporaryDatabaseMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.games_path = os.path.join(os.path.dirname(self.db_path), 'games.jsonl')
+        rng = random.Random(0)
+        with open(self.games_path, 'w', encoding='utf-8') as file:
+            for index in range(7):
+                file.write(json.dumps({
+                    'date_played': f'2024-06-0{index + 1} 18:30:05.123', 'opponent_name': 'ConKord',
+                    'result': 'win', 'moves': 100 + index, 'noob_killer': 0, 'setup': random_setup(rng),
+                }) + '\n')
+
+    def game_moves(self):
+        with get_db_connection(self.db_path) as conn:
+            return sorted(moves for (moves,) in conn.execute("SELECT moves FROM GameRecords"))
+
+    def test_resume_after_a_crash_following_a_commit_imports_no_game_twice(self):
+        # The second batch commits, then the process dies before anything else happens
+        with mock.patch.object(BulkImporter, '_log_progress', side_effect=[None, SystemExit]):
+            with self.assertRaises(SystemExit):
+                BulkImporter(self.database, batch_size=3).import_file(self.games_path)
+        self.assertEqual(self.game_moves(), list(range(100, 106)))
+
+        stats = BulkImporter(self.database, batch_size=3).import_file(self.games_path)
+        self.assertEqual(stats['imported'], 1)
+        self.assertEqual(self.game_moves(), list(range(100, 107)))
+
+        # A finished file imports nothing
+        self.assertEqual(BulkImporter(self.database).import_file(self.games_path)['imported'], 0)
+
+    def test_failed_batch_does_not_advance_the_checkpoint(self):
+        with mock.patch('src.database.bulk_import.game_record_row', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                BulkImporter(self.database, batch_size=3).import_file(self.games_path)
+        self.assertEqual(read_checkpoint(self.database, os.path.abspath(self.games_path)), 0)
+
+        BulkImporter(self.database, batch_size=3).import_file(self.games_path)
+        self.assertEqual(self.game_moves(), list(range(100, 107)))
+
+    def test_parse_date_accepts_timestamps(self):
+        self.assertEqual(parse_date('2024-06-01 18:30:05.123'), '2024-06-01')
+        self.assertEqual(parse_date('2024/06/01'), '2024-06-01')
+        with self.assertRaises(ValueError):
+            parse_date('June 1, 2024')
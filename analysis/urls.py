@@ -4,5 +4,10 @@ from . import views
 urlpatterns = [
     path('', views.hello_world, name='hello_world'),
     path('add-setup/', views.add_setup, name='add_setup'),
+    path('uploads/<int:job_id>/', views.upload_status, name='upload_status'),
+    path('uploads/<int:job_id>/status/', views.upload_job_status, name='upload_job_status'),
     path('filter-setups/', views.filter_setups, name='filter_setups'),
+    path('heatmap/', views.piece_heatmap, name='piece_heatmap'),
+    path('opponent-profile/', views.opponent_profile, name='opponent_profile'),
+    path('pattern-search/', views.pattern_search, name='pattern_search'),
 ]
\ No newline at end of file
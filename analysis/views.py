@@ -1,71 +1,43 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.contrib import messages
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.core.paginator import Paginator
-from .forms import SetupForm, FilterForm
+from .forms import SetupForm, FilterForm, HeatmapForm, OpponentProfileForm, PatternSearchForm
+from .models import GameRecord
+import logging
+import mimetypes
 import os
 import sys
 from dotenv import load_dotenv
-from src.api.grok_api import transcribe_setup
+from src.analysis.opponent_profile import get_opponent_profile
+from src.analysis.pattern_search import query_matching_setups
+from src.analysis.piece_heatmap import get_piece_heatmap, heatmap_grid
 from src.checks.check_for_opponent import check_for_opponent
+from src.checks.setup_repair import repair_setup
+from src.checks.staging_consistency_checks import is_setup_configuration_error
 from src.database.setup_to_sql import process_game_setup
-from src.database.sqlite_database import get_setup_id_with_game_record_filters, get_setups_with_setup_ids
-from PIL import Image, ImageEnhance
+from src.database.filter_cache import filter_result_cache
+from src.database.setup_encoding import COLUMNS, ROWS, fingerprint_to_pieces
+from src.database.sqlite_database import get_cache_generation, get_setup_result_totals, get_setup_results_page
+from src.imaging.piece_classifier import transcription_square_costs
+from src.imaging.preprocess import preprocess_image
+from src.jobs.upload_jobs import (
+    FINISHED_STATUSES,
+    STATUS_NEEDS_REVIEW,
+    UploadJobQueue,
+    learn_confirmed_image,
+    remove_job_image,
+    submit_upload,
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-
-def enhance_image_contrast(image_path, brightness_factor=1.2, contrast_factor=1.3):
-    """
-    Enhance the brightness and contrast of an image for better OCR results.
-    
-    Args:
-        image_path: Path to the input image
-        brightness_factor: Factor to increase brightness (1.0 = no change, >1.0 = brighter)
-        contrast_factor: Factor to increase contrast (1.0 = no change, >1.0 = higher contrast)
-    
-    Returns:
-        Tuple of (enhanced_path, enhanced_base64_data_url)
-    """
-    try:
-        # Open the image
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Enhance brightness
-            brightness_enhancer = ImageEnhance.Brightness(img)
-            img = brightness_enhancer.enhance(brightness_factor)
-            
-            # Enhance contrast
-            contrast_enhancer = ImageEnhance.Contrast(img)
-            img = contrast_enhancer.enhance(contrast_factor)
-            
-            # Save the enhanced image
-            enhanced_path = image_path.replace('.', '_enhanced.')
-            img.save(enhanced_path, 'JPEG', quality=95)
-            
-            # Create base64 data URL for browser display
-            import base64
-            import io
-            
-            # Convert enhanced image to base64
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='JPEG', quality=95)
-            img_buffer.seek(0)
-            enhanced_base64 = base64.b64encode(img_buffer.read()).decode('utf-8')
-            enhanced_data_url = f"data:image/jpeg;base64,{enhanced_base64}"
-            
-            return enhanced_path, enhanced_data_url
-    except Exception as e:
-        print(f"Error enhancing image: {e}")
-        return image_path, None  # Return original path if enhancement fails
+logger = logging.getLogger(__name__)
 
 
 def hello_world(request):
@@ -86,12 +58,18 @@ def hello_world(request):
             <a href="/">Home</a>
             <a href="/add-setup/">Add Setup</a>
             <a href="/filter-setups/">Filter Setups</a>
+            <a href="/heatmap/">Heatmap</a>
+            <a href="/opponent-profile/">Opponent Profile</a>
+            <a href="/pattern-search/">Pattern Search</a>
         </div>
         <h1>Welcome to Stratego Setup Analysis</h1>
         <p>This application helps you analyze and track your Stratego game setups.</p>
         <ul>
             <li><a href="/add-setup/">Add a new setup</a> - Upload an image and add game details</li>
             <li><a href="/filter-setups/">Filter setups</a> - Filter and view existing setups</li>
+            <li><a href="/heatmap/">Heatmap</a> - See which pieces are placed on each square</li>
+            <li><a href="/opponent-profile/">Opponent profile</a> - Scout an opponent before a game</li>
+            <li><a href="/pattern-search/">Pattern search</a> - Find the setups that match a partial board</li>
         </ul>
     </body>
     </html>
@@ -108,28 +86,9 @@ def add_setup(request):
         if form.is_valid():
             try:
                 # Get form data
-                date_played = form.cleaned_data['date_played']
                 opponent_name_input = form.cleaned_data['opponent_name']
-                result = form.cleaned_data['result']
-                moves = form.cleaned_data['moves']
-                noob_killer = form.cleaned_data['noob_killer']
                 setup_image = form.cleaned_data['setup_image']
                 
-                # Save the uploaded image temporarily
-                file_name = default_storage.save(f'temp/{setup_image.name}', ContentFile(setup_image.read()))
-                file_path = default_storage.path(file_name)
-                
-                # Enhance image contrast and brightness for better OCR
-                enhanced_file_path, enhanced_data_url = enhance_image_contrast(file_path)
-                
-                # Convert image to base64 for error display
-                import base64
-                setup_image.seek(0)
-                image_data = setup_image.read()
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-                image_mimetype = setup_image.content_type or 'image/jpeg'
-                error_image_url = f"data:{image_mimetype};base64,{image_base64}"
-                
                 # Process opponent details
                 opponent_details = check_for_opponent(opponent_name_input)
                 opponent_id = opponent_details[0]
@@ -138,92 +97,108 @@ def add_setup(request):
                 # Check if API key is loaded
                 api_key = os.getenv("XAI_API_KEY")
                 if not api_key:
-                    raise ValueError("XAI_API_KEY not found in environment variables")
+                    raise ValueError("xAI API key is not set")
                 
-                # Transcribe the setup from the enhanced image
-                transcribed_setup = transcribe_setup(enhanced_file_path)
+                # Store the upload until a worker has transcribed it
+                file_name = default_storage.save(f'uploads/{setup_image.name}', ContentFile(setup_image.read()))
+                file_path = default_storage.path(file_name)
                 
-                # Create the user input dictionary (similar to original add_setup.py)
-                user_input_dict = {
-                    "date_played": date_played,
+                # Queue the transcription; the setup is stored by the worker once it is transcribed
+                setup_details = {
+                    "date_played": form.cleaned_data['date_played'],
                     "opponent_id": opponent_id,
                     "opponent_name": opponent_name,
-                    "result": result,
-                    "moves": moves,
-                    "noob_killer": noob_killer,
-                    "setup": transcribed_setup
+                    "result": form.cleaned_data['result'],
+                    "moves": form.cleaned_data['moves'],
+                    "noob_killer": form.cleaned_data['noob_killer'],
                 }
+                job_id = submit_upload(file_path, setup_details)
                 
-                # Clean up temporary files (keep error file for potential display)
-                default_storage.delete(file_name)
-                # Also clean up the enhanced image file
-                try:
-                    if enhanced_file_path != file_path and os.path.exists(enhanced_file_path):
-                        os.remove(enhanced_file_path)
-                except:
-                    pass
-                
-                # Process and save to database
-                setup_id = process_game_setup(user_input_dict)
-                
-                # No need to clean up error file since we're using base64
-                
-                # Add success message
-                messages.success(request, f'Setup added successfully! Opponent: {opponent_name}, Result: {result}, Setup ID: {setup_id}')
-                
-                return redirect('add_setup')
+                return redirect('upload_status', job_id=job_id)
                 
             except Exception as e:
                 error_msg = str(e)
                 if "xAI API key is not set" in error_msg:
                     messages.error(request, 'xAI API key is not configured. Please set the XAI_API_KEY environment variable or add it to your .env file.')
-                    return render(request, 'analysis/add_setup.html', {'form': form})
-                elif any(keyword in error_msg for keyword in ['piece', 'count', 'Incorrect count', 'Invalid piece type', 'Amount of pieces']):
-                    # This is a piece configuration error - allow JSON editing
-                    import json
-                    transcribed_setup = locals().get('transcribed_setup', {})
-                    transcribed_setup_json = format_setup_json(transcribed_setup)
-                    
-                    # Clean up main temp file and enhanced image
-                    try:
-                        default_storage.delete(file_name)
-                        if enhanced_file_path != file_path and os.path.exists(enhanced_file_path):
-                            os.remove(enhanced_file_path)
-                    except:
-                        pass
-                    
-                    # Use the pre-saved error image URL or enhanced image URL
-                    setup_image_url = locals().get('error_image_url', None)
-                    enhanced_image_url = locals().get('enhanced_data_url', None)
-                    
-                    context = {
-                        'form': form,
-                        'json_error': True,
-                        'error_message': error_msg,
-                        'transcribed_setup': transcribed_setup,
-                        'transcribed_setup_json': transcribed_setup_json,
-                        'form_data': {
-                            'date_played': date_played,
-                            'opponent_name_input': opponent_name_input,
-                            'result': result,
-                            'moves': moves,
-                            'noob_killer': noob_killer,
-                            'opponent_id': opponent_id,
-                            'opponent_name': opponent_name,
-                            'setup_image_url': setup_image_url,
-                            'enhanced_image_url': enhanced_image_url,
-                        }
-                    }
-                    return render(request, 'analysis/add_setup.html', context)
                 else:
                     messages.error(request, f'Error processing setup: {error_msg}')
-                    return render(request, 'analysis/add_setup.html', {'form': form})
+                return render(request, 'analysis/add_setup.html', {'form': form})
     else:
         form = SetupForm()
     
     return render(request, 'analysis/add_setup.html', {'form': form})
 
 
+def upload_status(request, job_id):
+    """Show the progress of a queued upload, or the JSON editor if the transcription needs fixing."""
+    job = UploadJobQueue().get_job(job_id)
+    if job is None:
+        raise Http404("Upload not found")
+    
+    if job['status'] == STATUS_NEEDS_REVIEW:
+        return render(request, 'analysis/add_setup.html', create_job_review_context(job))
+    
+    return render(request, 'analysis/upload_status.html', {'job': job})
+
+
+def upload_job_status(request, job_id):
+    """Polling endpoint for the status of a queued upload."""
+    job = UploadJobQueue().get_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    
+    return JsonResponse({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'finished': job['status'] in FINISHED_STATUSES,
+        'setup_id': job['setup_id'],
+        'error': job['error'],
+    })
+
+
+def create_job_review_context(job):
+    """Create context for the JSON editor of an upload whose transcription failed the piece checks"""
+    import base64
+    
+    setup_image_url = None
+    enhanced_image_url = None
+    square_costs = None
+    if os.path.exists(job['image_path']):
+        with open(job['image_path'], 'rb') as image_file:
+            image_bytes = image_file.read()
+        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        image_mimetype = mimetypes.guess_type(job['image_path'])[0] or 'image/jpeg'
+        setup_image_url = f"data:{image_mimetype};base64,{image_base64}"
+        
+        try:
+            enhanced_image_url = preprocess_image(image_bytes).data_url
+        except Exception as e:
+            logger.warning(f"Could not enhance the screenshot of upload job {job['job_id']}: {e}")
+        square_costs = transcription_square_costs(image_bytes)
+    
+    details = job['setup_details']
+    return {
+        'form': SetupForm(),
+        'json_error': True,
+        'error_message': job['error'],
+        'transcribed_setup': job['transcribed_setup'],
+        'transcribed_setup_json': format_setup_json(job['transcribed_setup']),
+        'repair_suggestions': create_repair_suggestions(job['transcribed_setup'], square_costs),
+        'form_data': {
+            'job_id': job['job_id'],
+            'date_played': details['date_played'],
+            'opponent_name_input': details['opponent_name'],
+            'result': details['result'],
+            'moves': details['moves'],
+            'noob_killer': details['noob_killer'],
+            'opponent_id': details['opponent_id'],
+            'opponent_name': details['opponent_name'],
+            'setup_image_url': setup_image_url,
+            'enhanced_image_url': enhanced_image_url,
+        }
+    }
+
+
 def handle_json_edit(request):
     """Handle the JSON edit resubmission"""
     import json
@@ -255,8 +230,24 @@ def handle_json_edit(request):
             "setup": edited_setup
         }
         
-        # Process and save to database
-        setup_id = process_game_setup(user_input_dict)
+        # Claim the upload job the JSON came from, if any, so submitting it twice stores one game
+        job = None
+        if request.POST.get('job_id'):
+            job = UploadJobQueue().claim_review_job(int(request.POST['job_id']))
+            if job is None:
+                messages.info(request, 'This upload has already been stored.')
+                return redirect('add_setup')
+        
+        # Process and save to database, marking the upload job done in the same transaction
+        try:
+            setup_id = process_game_setup(user_input_dict, upload_job_id=job['job_id'] if job is not None else None)
+        except Exception:
+            if job is not None:
+                return_job_to_review(job)
+            raise
+        
+        if job is not None:
+            complete_reviewed_job(job, edited_setup)
         
         # Add success message
         messages.success(request, f'Setup added successfully with edited JSON! Opponent: {form_data["opponent_name"]}, Result: {form_data["result"]}, Setup ID: {setup_id}')
@@ -272,7 +263,7 @@ def handle_json_edit(request):
     except Exception as e:
         error_msg = str(e)
         # Check if it's a piece configuration error
-        if any(keyword in error_msg for keyword in ['piece', 'count', 'Incorrect count', 'Invalid piece type', 'Amount of pieces']):
+        if is_setup_configuration_error(error_msg):
             # Show the JSON editor again with the current JSON and new error message
             context = create_json_error_context(request, error_msg, edited_json_str)
             return render(request, 'analysis/add_setup.html', context)
@@ -282,6 +273,18 @@ def handle_json_edit(request):
             return redirect('add_setup')
 
 
+def complete_reviewed_job(job, edited_setup):
+    """Learn the pieces of an upload whose fixed transcription was stored and delete its screenshot"""
+    learn_confirmed_image(job['image_path'], edited_setup)
+    remove_job_image(job)
+
+
+def return_job_to_review(job):
+    """Let a claimed upload be reviewed again after its corrected setup could not be stored"""
+    UploadJobQueue().finish_job(job['job_id'], STATUS_NEEDS_REVIEW, transcribed_setup=job['transcribed_setup'],
+                                error=job['error'])
+
+
 def create_json_error_context(request, error_message, json_str):
     """Create context for JSON error display"""
     import json
@@ -291,6 +294,7 @@ def create_json_error_context(request, error_message, json_str):
         parsed_json = json.loads(json_str)
         formatted_json = format_setup_json(parsed_json)
     except:
+        parsed_json = None
         formatted_json = json_str
     
     # Get image URLs from hidden fields if available
@@ -302,7 +306,9 @@ def create_json_error_context(request, error_message, json_str):
         'json_error': True,
         'error_message': error_message,
         'transcribed_setup_json': formatted_json,
+        'repair_suggestions': create_repair_suggestions(parsed_json),
         'form_data': {
+            'job_id': request.POST.get('job_id', ''),
             'date_played': request.POST.get('date_played', ''),
             'opponent_name_input': request.POST.get('opponent_name_input', ''),
             'result': request.POST.get('result', ''),
@@ -316,6 +322,23 @@ def create_json_error_context(request, error_message, json_str):
     }
 
 
+def create_repair_suggestions(setup, square_costs=None):
+    """Ranked valid setups close to a setup that failed the piece checks, for the JSON editor"""
+    try:
+        suggestions = repair_setup(setup, square_costs=square_costs)
+    except Exception:
+        # Not a 4-row setup, the user has to fix it by hand
+        return []
+    
+    return [
+        {
+            'changes': suggestion.changes,
+            'setup_json': format_setup_json(suggestion.setup),
+        }
+        for suggestion in suggestions if suggestion.changes
+    ]
+
+
 def format_setup_json(setup_dict):
     """Format setup JSON in the compact single-line array format"""
     import json
@@ -358,25 +381,13 @@ def filter_setups(request):
     
     if filter_params:
         try:
-            # Get setup IDs that match the filters
-            setup_ids = get_setup_id_with_game_record_filters(**filter_params)
-            total_count = len(setup_ids)
+            # Only the setups on the requested page are fetched and converted to grids
+            filtered_setups = FilteredSetupList(filter_params)
+            total_count = filtered_setups.count()
             
-            if setup_ids:
-                # Get the actual setup data
-                setup_data = get_setups_with_setup_ids(setup_ids)
-                
-                # Convert setup data to 4x10 grids
-                all_setups = []
-                for i, setup in enumerate(setup_data):
-                    grid = convert_setup_to_grid(setup)
-                    all_setups.append({
-                        'setup_id': setup_ids[i],
-                        'grid': grid
-                    })
-                
+            if total_count:
                 # Implement pagination (10 setups per page)
-                paginator = Paginator(all_setups, 10)
+                paginator = Paginator(filtered_setups, 10)
                 page_number = request.GET.get('page', 1)
                 page_obj = paginator.get_page(page_number)
                 setups = page_obj.object_list
@@ -398,6 +409,64 @@ def filter_setups(request):
     return render(request, 'analysis/filter_setups.html', context)
 
 
+class FilteredSetupList:
+    """
+    Lazy sequence of the setups matching the filters, for use with Django's Paginator.
+
+    The Paginator only needs count() and a slice for the current page, so the matching records
+    are counted in SQL and only the requested slice is loaded and converted to grids, in one
+    query for the records of the page joined with the one-row fingerprints of their setups.
+    Counts and pages are kept in the filter result cache until the next insert bumps the cache
+    generation.
+    """
+
+    def __init__(self, filter_params):
+        self.filter_params = filter_params
+        self.generation = get_cache_generation()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = filter_result_cache.get_count(
+                self.filter_params, self.generation,
+                lambda: self._records().count()
+            )
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, _ = index.indices(self.count())
+        if stop <= start:
+            return []
+
+        return filter_result_cache.get_page(
+            self.filter_params, self.generation, start, stop,
+            lambda: self._load_setups(start, stop)
+        )
+
+    def _records(self):
+        return GameRecord.objects.filter_params(self.filter_params)
+
+    def _load_setups(self, start, stop):
+        records = (
+            self._records()
+            .order_by('-setup_id', '-record_id')
+            .select_related('setup')
+            .only('setup', 'setup__fingerprint')
+        )[start:stop]
+
+        # Convert setup data to 4x10 grids
+        return [
+            {'setup_id': record.setup_id, 'grid': fingerprint_to_grid(record.setup.fingerprint)}
+            for record in records
+        ]
+
+
 def build_filter_params(form):
     """Build filter parameters from form data."""
     filter_params = {}
@@ -430,15 +499,169 @@ def build_filter_params(form):
     return filter_params
 
 
-def convert_setup_to_grid(setup_data):
-    """Convert setup data from database to 4x10 grid format."""
-    # Initialize 4x10 grid with empty spaces
-    grid = [['.' for _ in range(10)] for _ in range(4)]
+def pieces_to_grid(pieces):
+    """Split a setup's 40 pieces into 4x10 grid format."""
+    return [pieces[row * COLUMNS:(row + 1) * COLUMNS] for row in range(ROWS)]
+
+
+def fingerprint_to_grid(fingerprint):
+    """Convert a setup fingerprint to 4x10 grid format."""
+    return pieces_to_grid(fingerprint_to_pieces(fingerprint))
+
+
+def pattern_search(request):
+    """View for finding the setups that match a partial board, with the results of their games."""
+    form = PatternSearchForm()
+    setups = []
+    totals = None
+    page_obj = None
+    search_data = None
     
-    # Fill the grid with pieces from setup_data
-    # Database uses 1-based indexing, so convert to 0-based
-    for row, col, piece in setup_data:
-        if 1 <= row <= 4 and 1 <= col <= 10:
-            grid[row-1][col-1] = piece
+    # The search is kept in the session for pagination, like the filters of filter_setups
+    if request.method == 'POST':
+        form = PatternSearchForm(request.POST)
+        if form.is_valid():
+            search_data = {name: value for name, value in form.cleaned_data.items() if name != 'pattern' and value}
+            request.session['pattern_search'] = search_data
+    elif 'pattern_search' in request.session:
+        search_data = request.session['pattern_search']
+        form = PatternSearchForm(search_data)
+        if not form.is_valid():
+            search_data = None
+    
+    if search_data is not None:
+        try:
+            # The piece index selects the matching setups, their games are aggregated one page at a time
+            results = PatternSearchResults(query_matching_setups(form.cleaned_data['pattern']),
+                                           form.cleaned_data['order_by'])
+            totals = results.totals()
+            
+            if results.count():
+                paginator = Paginator(results, 10)
+                page_number = request.GET.get('page', 1)
+                page_obj = paginator.get_page(page_number)
+                setups = page_obj.object_list
+            elif request.method == 'POST':
+                messages.info(request, 'No setups found matching your pattern.')
+                
+        except Exception as e:
+            messages.error(request, f'Error searching setups: {str(e)}')
+    
+    context = {
+        'form': form,
+        'setups': setups,
+        'totals': totals,
+        'page_obj': page_obj
+    }
     
-    return grid
+    return render(request, 'analysis/pattern_search.html', context)
+
+
+class PatternSearchResults:
+    """
+    Lazy sequence of the setups matching a pattern and the results of their games, for Paginator.
+
+    The matching setup ids come from an indexed query on the stored bitboards; the games of a page are counted,
+    sorted and sliced in SQL, so only the setups shown are loaded and converted to grids.
+    """
+
+    def __init__(self, setup_ids, order_by='games'):
+        self.setup_ids = setup_ids
+        self.order_by = order_by
+
+    def count(self):
+        return len(self.setup_ids)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, _ = index.indices(self.count())
+        if stop <= start:
+            return []
+
+        return [
+            dict(setup_results(games, wins, draws, losses),
+                 setup_id=setup_id, grid=fingerprint_to_grid(fingerprint))
+            for setup_id, fingerprint, games, wins, draws, losses
+            in get_setup_results_page(self.setup_ids, stop - start, start, self.order_by)
+        ]
+
+    def totals(self):
+        """The results of all games played with the matching setups."""
+        return dict(setup_results(*get_setup_result_totals(self.setup_ids)), setups=self.count())
+
+
+def setup_results(games, wins, draws, losses):
+    """Game counts with the win rate in percent, or None without games."""
+    return {
+        'games': games,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'win_rate': round(100 * wins / games, 1) if games else None,
+    }
+
+
+def piece_heatmap(request):
+    """View showing the piece distribution on every square, overall or per opponent / result."""
+    form = HeatmapForm(request.GET or None)
+    grid = None
+    total = 0
+    selected_piece = None
+
+    if form.is_bound and not form.is_valid():
+        return render(request, 'analysis/heatmap.html', {'form': form, 'grid': None, 'total': 0})
+
+    filters = form.cleaned_data if form.is_bound else {}
+    selected_piece = filters.get('piece') or None
+
+    try:
+        counts = get_piece_heatmap(opponent=filters.get('opponent') or None, result=filters.get('result') or None)
+        # Every square is counted once per setup or game, so any square gives the total
+        total = int(counts[0].sum())
+        if total:
+            grid = heatmap_grid(counts, selected_piece)
+    except Exception as e:
+        messages.error(request, f'Error retrieving heatmap: {str(e)}')
+
+    context = {
+        'form': form,
+        'grid': grid,
+        'total': total,
+        'selected_piece': selected_piece,
+        'unit': 'game' if filters.get('opponent') or filters.get('result') else 'setup',
+    }
+    return render(request, 'analysis/heatmap.html', context)
+
+
+def opponent_profile(request):
+    """View with a scouting report of the games against one opponent."""
+    form = OpponentProfileForm(request.GET or None)
+    context = {'form': form, 'profile': None}
+
+    if form.is_bound and form.is_valid():
+        opponent = form.cleaned_data['opponent']
+        try:
+            profile = get_opponent_profile(opponent)
+            if profile['games']:
+                counts = profile['piece_counts']
+                context.update({
+                    'profile': profile,
+                    'piece_grid': heatmap_grid(counts),
+                    'flag_grid': heatmap_grid(counts, 'F'),
+                    'bomb_grid': heatmap_grid(counts, 'B'),
+                    'most_used_setups': [
+                        dict(setup, grid=pieces_to_grid(setup['pieces']))
+                        for setup in profile['most_used_setups']
+                    ],
+                })
+            else:
+                messages.info(request, f'No games found against {opponent}.')
+        except Exception as e:
+            messages.error(request, f'Error building opponent profile: {str(e)}')
+
+    return render(request, 'analysis/opponent_profile.html', context)
@@ -0,0 +1,119 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.database.setup_encoding import (
+    COLUMNS,
+    PIECES,
+    ROWS,
+    SQUARES,
+    encode_setup,
+    fingerprint_to_pieces,
+)
+from src.database.sqlite_database import StrategoDatabase
+
+RESULTS = ('win', 'draw', 'loss')
+MOST_USED_SETUPS = 5
+MAX_CACHED_PROFILES = 256
+
+_profile_cache: "OrderedDict[Tuple[str, str], Tuple[int, Dict[str, Any]]]" = OrderedDict()
+_profile_cache_lock = threading.Lock()
+
+
+def build_opponent_profile(opponent: str, database: Optional[StrategoDatabase] = None) -> Dict[str, Any]:
+    """
+    Build a scouting report for an opponent from a single aggregated query.
+
+    Returns:
+        Dictionary with:
+            opponent, games, results ({'win': n, 'draw': n, 'loss': n}) and win_rate (percentage),
+            piece_counts: 40 x 12 array of how often each piece stood on each square (see get_piece_heatmap),
+            piece_counts_by_result: the same per result,
+            flag_bombed_in: number of games where every square next to the flag held a bomb,
+            most_used_setups: the setups played most often against the opponent, each with
+                setup_id, games, results and its 40 pieces.
+    """
+    database = database or StrategoDatabase()
+    rows = database.get_opponent_setup_results(opponent)
+
+    setups: Dict[int, Dict[str, Any]] = {}
+    for setup_id, fingerprint, result, games in rows:
+        setup = setups.setdefault(setup_id, {'fingerprint': fingerprint, 'results': dict.fromkeys(RESULTS, 0)})
+        setup['results'][result] = setup['results'].get(result, 0) + games
+
+    piece_counts_by_result = {result: np.zeros((SQUARES, len(PIECES)), dtype=np.int64) for result in RESULTS}
+    flag_bombed_in = 0
+    squares = np.arange(SQUARES)
+    for setup in setups.values():
+        setup['pieces'] = fingerprint_to_pieces(setup['fingerprint'])
+        codes = encode_setup(setup['pieces'])
+        for result, games in setup['results'].items():
+            if games and result in piece_counts_by_result:
+                piece_counts_by_result[result][squares, codes] += games
+        setup['games'] = sum(setup['results'].values())
+        if is_flag_bombed_in(setup['pieces']):
+            flag_bombed_in += setup['games']
+
+    results = {result: sum(setup['results'].get(result, 0) for setup in setups.values()) for result in RESULTS}
+    games = sum(setup['games'] for setup in setups.values())
+
+    most_used = sorted(setups.items(), key=lambda item: (-item[1]['games'], -item[0]))[:MOST_USED_SETUPS]
+
+    return {
+        'opponent': opponent,
+        'games': games,
+        'results': results,
+        'win_rate': results['win'] * 100.0 / games if games else 0.0,
+        'piece_counts': sum(piece_counts_by_result.values()),
+        'piece_counts_by_result': piece_counts_by_result,
+        'flag_bombed_in': flag_bombed_in,
+        'most_used_setups': [
+            {'setup_id': setup_id, 'games': setup['games'], 'results': setup['results'], 'pieces': setup['pieces']}
+            for setup_id, setup in most_used
+        ],
+    }
+
+
+def is_flag_bombed_in(pieces: List[str]) -> bool:
+    """Return whether every square orthogonally next to the flag holds a bomb."""
+    flag_square = pieces.index('F')
+    row, col = divmod(flag_square, COLUMNS)
+    neighbours = [(row + dr, col + dc) for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                  if 0 <= row + dr < ROWS and 0 <= col + dc < COLUMNS]
+    return all(pieces[r * COLUMNS + c] == 'B' for r, c in neighbours)
+
+
+def get_opponent_profile(opponent: str, database: Optional[StrategoDatabase] = None) -> Dict[str, Any]:
+    """
+    Return the cached profile of an opponent, building it on first use.
+
+    Profiles are tagged with the cache generation that every ingest bumps, so a profile is
+    rebuilt once games have been stored by this process, a bulk import or another worker. The
+    returned dictionary is shared between callers and must not be modified.
+    """
+    database = database or StrategoDatabase()
+    key = (os.path.abspath(database.db_path), opponent)
+    # Read before building, so a game ingested during the build tags the profile as outdated
+    generation = database.get_cache_generation()
+
+    with _profile_cache_lock:
+        entry = _profile_cache.get(key)
+        if entry is not None and entry[0] == generation:
+            _profile_cache.move_to_end(key)
+            return entry[1]
+
+    profile = build_opponent_profile(opponent, database)
+
+    with _profile_cache_lock:
+        entry = _profile_cache.get(key)
+        if entry is not None and entry[0] > generation:
+            # Built before a newer ingest that another request has already seen; keep the newer profile
+            return profile
+        _profile_cache[key] = (generation, profile)
+        _profile_cache.move_to_end(key)
+        while len(_profile_cache) > MAX_CACHED_PROFILES:
+            _profile_cache.popitem(last=False)
+    return profile
@@ -0,0 +1,273 @@
+"""
+Find stored setups that match a partial board.
+
+Every setup is represented by 12 bitboards, one 40-bit mask per piece type where bit i is set
+when square i (see setup_encoding.square_index) holds the piece. A pattern is compiled into
+groups of (allowed pieces, squares), and a setup matches when, for every group, the union of the
+bitboards of the allowed pieces covers all squares of the group, or the union of the excluded
+pieces covers none of them. That is one bitwise OR, AND and comparison per group over contiguous
+uint64 arrays of all setups.
+
+The bitboards are kept in memory next to the SetupMatrix. Every search through
+get_setup_bitboards syncs the matrix with the cache generation of the database first, so setups
+stored by any process since the last search are appended and found.
+
+The bitboards are also stored on Setups as generated columns (migrations.PIECE_MASK_COLUMNS),
+which query_matching_setups checks without loading anything. It looks up the setups that hold
+the right pieces on the most selective square of the pattern in the GameSetups piece index,
+and checks only those against the bitboard columns.
+
+Pattern squares are given as:
+    '*', '?', '.', '' or None  any piece
+    'B', '10', 'f'             exactly that piece
+    'B|F'                      any of the listed pieces
+    '!B'                       any piece but the listed ones, e.g. '!B|F'
+"""
+import os
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.checks.staging_consistency_checks import correct_piece_configuration
+from src.database.setup_encoding import COLUMNS, PIECE_CODES, PIECES, ROWS, SQUARES, square_index
+from src.database.setup_matrix import SetupMatrix, get_setup_matrix
+from src.database.sqlite_database import StrategoDatabase
+
+WILDCARDS = frozenset({'*', '?', '.', ''})
+
+PatternLike = Union[Mapping[Any, Any], Sequence[Optional[str]]]
+
+
+class SetupPattern:
+    """
+    A compiled partial board.
+
+    Args:
+        groups: (piece codes, squares mask) pairs; a setup matches when every square of a mask
+            holds one of the pieces of its group
+    """
+
+    def __init__(self, groups: List[Tuple[Tuple[int, ...], int]]):
+        self.groups = groups
+
+    @property
+    def piece_masks(self) -> List[Tuple[Tuple[str, ...], int]]:
+        """The groups with piece names instead of codes, as taken by get_setup_ids_by_piece_masks."""
+        return [(tuple(PIECES[code] for code in codes), mask) for codes, mask in self.groups]
+
+    @property
+    def indexed_square(self) -> Optional[Tuple[int, Tuple[str, ...]]]:
+        """
+        The square expected to match the fewest setups, with its allowed pieces, or None for an empty pattern.
+
+        A square is expected to match as many setups as there are allowed pieces in a setup: a
+        square allowing only the flag matches one setup in 40, one allowing the scouts eight.
+        """
+        if not self.groups:
+            return None
+        codes, mask = min(self.groups, key=lambda group: sum(correct_piece_configuration[PIECES[code]]
+                                                              for code in group[0]))
+        square = (mask & -mask).bit_length() - 1
+        return square, tuple(PIECES[code] for code in codes)
+
+
+def _parse_square(token: Optional[str]) -> Optional[Tuple[int, ...]]:
+    """Return the allowed piece codes of a pattern square, or None for a wildcard."""
+    token = '' if token is None else str(token).strip().upper()
+    if token in WILDCARDS:
+        return None
+
+    negated = token.startswith('!')
+    pieces = token[1:].split('|') if negated else token.split('|')
+    try:
+        codes = {PIECE_CODES[piece.strip()] for piece in pieces}
+    except KeyError as e:
+        raise ValueError(f"Invalid piece type in pattern: {e.args[0]!r}") from None
+
+    if negated:
+        codes = set(range(len(PIECES))) - codes
+    if not codes:
+        raise ValueError(f"Pattern square {token!r} allows no piece")
+    return tuple(sorted(codes)) if len(codes) < len(PIECES) else None
+
+
+def _pattern_squares(pattern: PatternLike) -> Dict[int, Optional[str]]:
+    """Map the square indexes of a pattern to their tokens."""
+    if isinstance(pattern, Mapping):
+        keys = list(pattern)
+        if keys and isinstance(keys[0], tuple):
+            return {square_index(row, col): token for (row, col), token in pattern.items()}
+
+        squares = {}
+        for row, tokens in pattern.items():
+            if isinstance(tokens, str):
+                tokens = tokens.split()
+            if not 1 <= int(row) <= ROWS or len(tokens) != COLUMNS:
+                raise ValueError(f"Pattern row {row!r} must be 1 to {ROWS} with {COLUMNS} squares")
+            for col, token in enumerate(tokens, start=1):
+                squares[square_index(int(row), col)] = token
+        return squares
+
+    tokens = list(pattern)
+    if len(tokens) != SQUARES:
+        raise ValueError(f"Pattern must have exactly {SQUARES} squares, got {len(tokens)}")
+    return dict(enumerate(tokens))
+
+
+def compile_pattern(pattern: PatternLike) -> SetupPattern:
+    """
+    Compile a partial board into a SetupPattern.
+
+    Args:
+        pattern: Rows in the transcribed JSON format ({'4': ['F', 'B', '*', ...]}; missing rows
+            are wildcards, rows may also be whitespace separated strings), a dictionary of
+            (row, col) -> square for the constrained squares only, or a sequence of 40 squares
+
+    Raises:
+        ValueError: If the pattern has the wrong shape or an unknown piece
+    """
+    masks: Dict[Tuple[int, ...], int] = {}
+    for square, token in _pattern_squares(pattern).items():
+        if not 0 <= square < SQUARES:
+            raise ValueError(f"Pattern square {square} is outside the board")
+        codes = _parse_square(token)
+        if codes is not None:
+            masks[codes] = masks.get(codes, 0) | (1 << square)
+    # Single pieces first: they are the cheapest and usually the most selective groups
+    return SetupPattern(sorted(masks.items(), key=lambda group: (len(group[0]), group[0])))
+
+
+def encode_bitboards(encoded_setups: np.ndarray) -> np.ndarray:
+    """
+    Compute the bitboards of encoded setups.
+
+    Args:
+        encoded_setups: K x 40 array of piece codes
+
+    Returns:
+        12 x K uint64 array; row c holds the squares of piece code c of every setup.
+    """
+    encoded_setups = np.asarray(encoded_setups, dtype=np.uint8).reshape(-1, SQUARES)
+    boards = np.zeros((len(PIECES), len(encoded_setups)), dtype=np.uint64)
+    packed = np.zeros((len(encoded_setups), 8), dtype=np.uint8)
+    for code in range(len(PIECES)):
+        # Little-endian bit order puts square i at bit i of the 64-bit word
+        packed[:, :(SQUARES + 7) // 8] = np.packbits(encoded_setups == code, axis=1, bitorder='little')
+        boards[code] = packed.view('<u8')[:, 0]
+    return boards
+
+
+class SetupBitboards:
+    """
+    Bitboards of all setups of a SetupMatrix, in the order of its rows.
+
+    The boards are computed when first needed and extended with the rows appended to the
+    matrix since, so setups stored by an ingest are found by the next query.
+    """
+
+    def __init__(self, setup_matrix: SetupMatrix):
+        self.setup_matrix = setup_matrix
+        self._boards = np.zeros((len(PIECES), 0), dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._boards.shape[1]
+
+    @property
+    def boards(self) -> np.ndarray:
+        """12 x N uint64 array of bitboards, one column per row of the matrix."""
+        with self._lock:
+            size = len(self.setup_matrix)
+            if self._boards.shape[1] < size:
+                new_boards = encode_bitboards(self.setup_matrix.matrix[self._boards.shape[1]:size])
+                self._boards = np.concatenate((self._boards, new_boards), axis=1)
+            return self._boards
+
+    def match(self, pattern: Union[SetupPattern, PatternLike]) -> np.ndarray:
+        """Return a boolean array of the matrix rows that match a pattern."""
+        pattern = pattern if isinstance(pattern, SetupPattern) else compile_pattern(pattern)
+        boards = self.boards
+        selected = np.ones(boards.shape[1], dtype=bool)
+        for codes, mask in pattern.groups:
+            mask = np.uint64(mask)
+            excluded = [code for code in range(len(PIECES)) if code not in codes]
+            if len(excluded) < len(codes):
+                # e.g. '!B': no square of the mask may hold an excluded piece, fewer boards to combine
+                selected &= (self._union(boards, excluded) & mask) == 0
+            else:
+                selected &= (self._union(boards, codes) & mask) == mask
+        return selected
+
+    @staticmethod
+    def _union(boards: np.ndarray, codes: Sequence[int]) -> np.ndarray:
+        return boards[codes[0]] if len(codes) == 1 else np.bitwise_or.reduce(boards[list(codes)], axis=0)
+
+
+_loaded_bitboards: Dict[str, SetupBitboards] = {}
+_loaded_bitboards_lock = threading.Lock()
+
+
+def get_setup_bitboards(database: Optional[StrategoDatabase] = None) -> SetupBitboards:
+    """
+    Return the process-wide SetupBitboards of the SetupMatrix of a database.
+
+    The matrix is synced through get_setup_matrix on every call: if the cache generation moved,
+    the setups above the highest loaded ID are appended, and the bitboards are extended with
+    them on their next use.
+    """
+    database = database or StrategoDatabase()
+    setup_matrix = get_setup_matrix(database)
+    key = os.path.abspath(database.db_path)
+
+    with _loaded_bitboards_lock:
+        bitboards = _loaded_bitboards.get(key)
+        # A reloaded matrix gets new bitboards
+        if bitboards is None or bitboards.setup_matrix is not setup_matrix:
+            bitboards = _loaded_bitboards[key] = SetupBitboards(setup_matrix)
+        return bitboards
+
+
+def find_matching_setups(pattern: Union[SetupPattern, PatternLike], bitboards: Optional[SetupBitboards] = None,
+                         database: Optional[StrategoDatabase] = None) -> List[int]:
+    """
+    Find the stored setups that match a partial board.
+
+    Example: the flag in the left back corner, with bombs on both neighbours:
+        find_matching_setups({(4, 1): 'F', (3, 1): 'B', (4, 2): 'B'})
+
+    Args:
+        pattern: A SetupPattern or any pattern accepted by compile_pattern
+        bitboards: Bitboards to search, as they are. Defaults to those of the process-wide
+            SetupMatrix of the database, synced first.
+        database: Database whose setups are searched if no bitboards are given
+
+    Returns:
+        The IDs of the matching setups, in the order of the matrix (ascending for a loaded database).
+
+    Raises:
+        ValueError: If the pattern is invalid
+    """
+    bitboards = bitboards if bitboards is not None else get_setup_bitboards(database)
+    selected = bitboards.match(pattern)
+    return bitboards.setup_matrix.setup_ids[:len(selected)][selected].tolist()
+
+
+def query_matching_setups(pattern: Union[SetupPattern, PatternLike],
+                          database: Optional[StrategoDatabase] = None) -> List[int]:
+    """
+    Find the stored setups that match a partial board with one indexed query, without loading any setups.
+
+    Args:
+        pattern: A SetupPattern or any pattern accepted by compile_pattern
+        database: Database to search
+
+    Returns:
+        The IDs of the matching setups in ascending order.
+
+    Raises:
+        ValueError: If the pattern is invalid
+    """
+    pattern = pattern if isinstance(pattern, SetupPattern) else compile_pattern(pattern)
+    database = database or StrategoDatabase()
+    return database.get_setup_ids_by_piece_masks(pattern.piece_masks, pattern.indexed_square)
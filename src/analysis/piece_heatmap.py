@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.database.setup_encoding import COLUMNS, PIECE_CODES, PIECES, ROWS, SQUARES, square_index
+from src.database.sqlite_database import StrategoDatabase
+
+
+def get_piece_heatmap(opponent: Optional[str] = None, result: Optional[str] = None,
+                      database: Optional[StrategoDatabase] = None) -> np.ndarray:
+    """
+    Return the piece counts for every square of the board.
+
+    The counts are materialized in the PieceHeatmap table and kept up to date on ingest, so
+    this is a single primary-key range read. Without filters every distinct setup counts once;
+    for an opponent or result every game counts once.
+
+    Args:
+        opponent: Only count games against this opponent
+        result: Only count games with this result ('win', 'draw' or 'loss')
+        database: Optional database instance
+
+    Returns:
+        40 x 12 array of counts. Rows are squares in row-major order (see square_index),
+        columns are pieces in the order of PIECES.
+
+    Raises:
+        ValueError: If both opponent and result are given
+    """
+    if opponent and result:
+        raise ValueError("Heatmaps are kept per opponent or per result, not for both at once")
+
+    if opponent:
+        scope, scope_value = 'opponent', opponent
+    elif result:
+        scope, scope_value = 'result', result
+    else:
+        scope, scope_value = 'all', ''
+
+    database = database or StrategoDatabase()
+    counts = np.zeros((SQUARES, len(PIECES)), dtype=np.int64)
+    for square, piece, count in database.get_piece_heatmap_counts(scope, scope_value):
+        counts[square, PIECE_CODES[piece]] = count
+    return counts
+
+
+def heatmap_percentages(counts: np.ndarray) -> np.ndarray:
+    """Convert heatmap counts to the percentage of each piece per square (0 where there is no data)."""
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts * 100.0, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+
+def piece_distribution_at(counts: np.ndarray, row: int, col: int) -> Dict[str, float]:
+    """Return the percentage of each piece at a 1-based (row, col), most frequent first."""
+    percentages = heatmap_percentages(counts)[square_index(row, col)]
+    return {PIECES[code]: float(percentages[code]) for code in np.argsort(-percentages, kind='stable')
+            if percentages[code] > 0}
+
+
+def heatmap_grid(counts: np.ndarray, piece: Optional[str] = None) -> List[List[Dict[str, object]]]:
+    """
+    Summarize a heatmap as a 4x10 grid for display.
+
+    Each cell holds the piece shown and its percentage on that square: the given piece,
+    or the most frequent piece when no piece is given. 'intensity' scales the percentage
+    to 0.3-1.0 for shading.
+    """
+    percentages = heatmap_percentages(counts)
+    if piece is not None:
+        codes = np.full(SQUARES, PIECE_CODES[piece])
+    else:
+        codes = np.argmax(counts, axis=1)
+
+    grid = []
+    for row in range(ROWS):
+        cells = []
+        for col in range(COLUMNS):
+            square = row * COLUMNS + col
+            has_data = counts[square].sum() > 0
+            percentage = float(percentages[square, codes[square]])
+            cells.append({
+                'piece': PIECES[codes[square]] if has_data or piece is not None else '.',
+                'percentage': round(percentage, 1),
+                'intensity': 0.3 + 0.7 * percentage / 100,
+            })
+        grid.append(cells)
+    return grid
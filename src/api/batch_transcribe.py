@@ -0,0 +1,164 @@
+"""
+Transcribe many setup screenshots in one run.
+
+Usage:
+    python -m src.api.batch_transcribe screenshots/ [more.png ...] [--output setups.jsonl]
+        [--metadata games.csv] [--workers 4] [--retries 3] [--no-few-shot] [--no-enhance] [--no-cache]
+
+All screenshots share one ChatXAI client and one prebuilt prompt prefix, and are transcribed
+by a bounded thread pool. Failed calls are retried with exponential backoff. Every transcribed
+screenshot becomes a JSONL row {"image": ..., "setup": {...}}, written as soon as it is done;
+screenshots that still fail are written to <output>.errors.jsonl. Images already present in the
+output are skipped, so an interrupted run can simply be started again.
+
+With --metadata (CSV or JSONL with an "image" column holding the file name and the game fields
+date_played, opponent_name, result, moves and noob_killer) the game fields are merged into the
+rows, so the output can be passed straight to python -m src.database.bulk_import.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.api.grok_api import transcribe_screenshot, transcribe_setup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def find_images(paths: Iterable[str]) -> List[str]:
+    """Expand directories to the screenshots they contain, in name order."""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            images.append(path)
+    return images
+
+
+def read_metadata(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read the game fields per screenshot file name from a CSV or JSONL file."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(file))
+        else:
+            rows = [json.loads(line) for line in file if line.strip()]
+    return {os.path.basename(row.pop('image')): row for row in rows}
+
+
+def read_done_images(output_path: str) -> set:
+    """Return the screenshots already written to the output by an earlier run."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, encoding='utf-8') as file:
+        return {json.loads(line)['image'] for line in file if line.strip()}
+
+
+def with_retries(function: Callable[[], Any], retries: int = DEFAULT_RETRIES, backoff_base: float = BACKOFF_BASE) -> Any:
+    """Call function, retrying failures with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(BACKOFF_MAX, backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+
+
+def transcribe_file(path: str, use_few_shot: bool = True, enhance: bool = True,
+                    use_cache: bool = True) -> Dict[str, List[str]]:
+    """Transcribe one screenshot, enhancing it in memory first like the upload flow does."""
+    if enhance:
+        return transcribe_screenshot(path, use_few_shot=use_few_shot, use_cache=use_cache)
+    return transcribe_setup(path, use_few_shot=use_few_shot, use_cache=use_cache)
+
+
+def transcribe_batch(images: List[str], output_path: str, metadata: Optional[Dict[str, Dict[str, Any]]] = None,
+                     workers: int = DEFAULT_WORKERS, retries: int = DEFAULT_RETRIES,
+                     transcribe: Callable[[str], Dict[str, List[str]]] = transcribe_file) -> Dict[str, int]:
+    """
+    Transcribe screenshots concurrently and append the results to a JSONL file.
+
+    Args:
+        images: Screenshot paths
+        output_path: JSONL file for the transcribed setups
+        metadata: Optional game fields per screenshot file name, merged into the rows
+        workers: Maximum number of concurrent transcriptions
+        retries: Retries per screenshot after the first failure
+        transcribe: Function turning a screenshot path into a setup
+
+    Returns:
+        Counts of transcribed, failed and skipped screenshots.
+    """
+    metadata = metadata or {}
+    done = read_done_images(output_path)
+    pending = [image for image in images if image not in done]
+    stats = {'transcribed': 0, 'failed': 0, 'skipped': len(images) - len(pending)}
+    write_lock = threading.Lock()
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            open(f"{output_path}.errors.jsonl", 'a', encoding='utf-8') as errors, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(with_retries, lambda image=image: transcribe(image), retries): image
+                   for image in pending}
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                row = {**metadata.get(os.path.basename(image), {}), 'image': image, 'setup': future.result()}
+                target, key = output, 'transcribed'
+            except Exception as e:
+                logger.error(f"Could not transcribe {image}: {e}")
+                row = {'image': image, 'error': str(e)}
+                target, key = errors, 'failed'
+
+            with write_lock:
+                target.write(json.dumps(row) + "\n")
+                target.flush()
+                stats[key] += 1
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe setup screenshots to JSONL.")
+    parser.add_argument("paths", nargs="+", help="Screenshots or directories of screenshots")
+    parser.add_argument("--output", default="setups.jsonl", help="JSONL file for the results (appended)")
+    parser.add_argument("--metadata", help="CSV or JSONL with the game fields per screenshot")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent transcriptions")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries per screenshot")
+    parser.add_argument("--no-few-shot", action="store_true", help="Do not send the few-shot examples")
+    parser.add_argument("--no-enhance", action="store_true", help="Send the screenshots without enhancing them")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse or store cached transcriptions")
+    args = parser.parse_args()
+
+    images = find_images(args.paths)
+    metadata = read_metadata(args.metadata) if args.metadata else None
+    start = time.perf_counter()
+    stats = transcribe_batch(
+        images, args.output, metadata, workers=args.workers, retries=args.retries,
+        transcribe=lambda path: transcribe_file(path, use_few_shot=not args.no_few_shot,
+                                                enhance=not args.no_enhance, use_cache=not args.no_cache)
+    )
+    elapsed = time.perf_counter() - start
+    print(f"Transcribed {stats['transcribed']} screenshots, {stats['failed']} failed, "
+          f"{stats['skipped']} already done ({elapsed:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Few-shot examples for the transcription prompt.
+
+The examples are listed in few_shot/examples.json, with their screenshots in few_shot/images.
+They are downscaled, JPEG-encoded and base64-encoded once into few_shot/bundle.json, which is
+rebuilt automatically when the manifest or an image is newer than the bundle:
+    python -m src.api.few_shot
+
+Each example also stores a small grayscale thumbnail, so the examples most similar to a
+screenshot can be sent instead of all of them.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FEW_SHOT_DIR = os.path.join(os.path.dirname(__file__), 'few_shot')
+MANIFEST_PATH = os.path.join(FEW_SHOT_DIR, 'examples.json')
+IMAGES_DIR = os.path.join(FEW_SHOT_DIR, 'images')
+BUNDLE_PATH = os.path.join(FEW_SHOT_DIR, 'bundle.json')
+
+# Longest side of a bundled example; the board stays readable at this size
+EXAMPLE_MAX_SIDE = 768
+EXAMPLE_JPEG_QUALITY = 85
+# Thumbnail used for similarity, with the 10:4 aspect ratio of the board
+SIGNATURE_SIZE = (40, 16)
+
+_bundle: Optional[Dict[str, Any]] = None
+_bundle_lock = threading.Lock()
+
+
+def image_signature(image: Image.Image) -> np.ndarray:
+    """Return a normalized grayscale thumbnail, so the dot product of two signatures is their similarity."""
+    thumbnail = np.asarray(image.convert('L').resize(SIGNATURE_SIZE, Image.BILINEAR), dtype=np.float32).ravel()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    return thumbnail / norm if norm else thumbnail
+
+
+def encode_example_image(image: Image.Image) -> str:
+    """Downscale an example screenshot and return it as a base64 JPEG."""
+    image = image.convert('RGB')
+    image.thumbnail((EXAMPLE_MAX_SIDE, EXAMPLE_MAX_SIDE), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=EXAMPLE_JPEG_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def build_bundle(manifest_path: str = MANIFEST_PATH, images_dir: str = IMAGES_DIR,
+                 bundle_path: str = BUNDLE_PATH) -> Dict[str, Any]:
+    """
+    Encode the examples of the manifest and write the bundle.
+
+    Examples whose screenshot is missing are left out with a warning.
+
+    Returns:
+        The bundle: {'version': ..., 'examples': [{'name', 'output', 'image_base64', 'signature'}]}
+    """
+    with open(manifest_path, encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    examples = []
+    for example in manifest['examples']:
+        image_path = os.path.join(images_dir, example['image'])
+        if not os.path.exists(image_path):
+            logger.warning(f"Few-shot image {example['image']} not found, leaving the example out")
+            continue
+        with Image.open(image_path) as image:
+            examples.append({
+                'name': example['image'],
+                'output': example['output'],
+                'image_base64': encode_example_image(image),
+                'signature': [round(float(value), 5) for value in image_signature(image)],
+            })
+
+    content = json.dumps(examples, sort_keys=True)
+    bundle = {'version': hashlib.sha256(content.encode('utf-8')).hexdigest()[:16], 'examples': examples}
+
+    temp_path = f"{bundle_path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(bundle, file)
+        os.replace(temp_path, bundle_path)
+        logger.info(f"Wrote {len(examples)} few-shot examples to {bundle_path}")
+    except OSError as e:
+        # A read-only install still works, it just encodes the examples once per process
+        logger.warning(f"Could not write the few-shot bundle: {e}")
+    return bundle
+
+
+def _bundle_is_stale() -> bool:
+    if not os.path.exists(BUNDLE_PATH):
+        return True
+    bundle_time = os.path.getmtime(BUNDLE_PATH)
+    sources = [MANIFEST_PATH]
+    if os.path.isdir(IMAGES_DIR):
+        sources.extend(entry.path for entry in os.scandir(IMAGES_DIR))
+    return any(os.path.getmtime(path) > bundle_time for path in sources)
+
+
+def load_bundle() -> Dict[str, Any]:
+    """Return the few-shot bundle, building it first if it is missing or out of date."""
+    global _bundle
+    with _bundle_lock:
+        if _bundle is None:
+            if _bundle_is_stale():
+                _bundle = build_bundle()
+            else:
+                with open(BUNDLE_PATH, encoding='utf-8') as file:
+                    _bundle = json.load(file)
+            for example in _bundle['examples']:
+                example['signature'] = np.asarray(example['signature'], dtype=np.float32)
+        return _bundle
+
+
+def select_examples(max_examples: int, image_bytes: Optional[bytes] = None) -> List[Dict[str, Any]]:
+    """
+    Choose the few-shot examples to send with a screenshot.
+
+    Args:
+        max_examples: Maximum number of examples
+        image_bytes: The screenshot. If given, the most similar examples are chosen;
+            otherwise the first ones of the manifest.
+
+    Returns:
+        The chosen examples, in manifest order so equal selections give identical prompts.
+    """
+    examples = load_bundle()['examples']
+    if max_examples <= 0:
+        return []
+    if image_bytes is None or len(examples) <= max_examples:
+        return examples[:max_examples]
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft('L', (SIGNATURE_SIZE[0] * 4, SIGNATURE_SIZE[1] * 4))  # Decode JPEGs at reduced size
+        signature = image_signature(image)
+    similarities = np.array([example['signature'] @ signature for example in examples])
+    chosen = sorted(np.argsort(-similarities)[:max_examples])
+    return [examples[index] for index in chosen]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_bundle()
@@ -2,7 +2,15 @@ from langchain_xai import ChatXAI
 from dotenv import load_dotenv
 import os
 import base64
-from src.parsing.parse_setup import string_to_json
+import hashlib
+import json
+import mimetypes
+import threading
+from src.api.few_shot import load_bundle, select_examples
+from src.api.transcription_cache import transcription_cache, transcription_cache_key
+from src.imaging.piece_classifier import classify_screenshot
+from src.imaging.preprocess import load_image, preprocess_image
+from src.parsing.parse_setup import parse_setup_stream
 
 # Load environment variables
 load_dotenv()
@@ -15,111 +23,7 @@ if not XAI_API_KEY:
     load_dotenv(env_path)
     XAI_API_KEY = os.getenv("XAI_API_KEY")
 
-# Few-shot examples - stored as data structure for efficiency
-FEW_SHOT_EXAMPLES = [
-    {
-        "image_path": "C:/Users/Daniel/Pictures/Screenshots/Screenshot 2025-07-15 120650.png",
-        "output": {
-            "1": "['4', 'B', '4', '10', '4', '6', '2', '8', '5', '3']",
-            "2": "['6', '2', '7', '2', '7', '2', '2', '1', '9', '6']",
-            "3": "['8', '2', '5', 'B', '3', 'B', '4', '7', '2', '2']",
-            "4": "['3', '3', 'B', 'F', 'B', 'B', '5', '5', '3', '6']"
-        }
-    },
-    {
-        "image_path": "C:/Users/Daniel/Pictures/Screenshots/Screenshot 2025-07-15 120950.png",
-        "output": {
-            "1": "['2', '6', '4', '2', '2', '5', '7', '2', '6', '2']",
-            "2": "['8', '2', '4', 'B', '2', '9', '1', '3', '10', '7']",
-            "3": "['5', '2', '7', 'B', '3', '8', 'B', '6', '4', 'B']",
-            "4": "['3', '5', '3', '4', '6', '3', 'B', '5', 'B', 'F']"
-        }
-    },
-    {
-        "image_path": "C:/Users/Daniel/Pictures/Screenshots/Screenshot 2025-07-15 151053.png",
-        "output": {
-            "1": "['6', '2', '4', '8', '2', '5', '2', '4', '2', 'B']",
-            "2": "['2', '9', '2', '1', '7', '2', '4', '5', '6', '5']",
-            "3": "['4', 'B', 'B', '7', '3', '10', '6', '8', '3', '7']",
-            "4": "['B', 'F', 'B', '3', 'B', '5', '3', '6', '3', '2']"
-        }
-    },
-    {
-        "image_path": "C:/Users/Daniel/Pictures/Screenshots/Screenshot 2025-07-15 150646.png",
-        "output": {
-            "1": "['5', '2', '2', '6', '5', '2', '6', '4', '5', '2']",
-            "2": "['8', '6', '9', '3', '7', '2', '10', '2', '8', '2']",
-            "3": "['6', '1', '3', 'B', '4', '4', '7', '3', 'B', '5']",
-            "4": "['7', '4', 'B', 'F', 'B', 'B', '3', 'B', '3', '2']"
-        }
-    }
-]
-
-# Cache for encoded images to avoid re-encoding
-_image_cache = {}
-
-def encode_image(image_path):
-    """Encode image to base64 with caching"""
-    if image_path in _image_cache:
-        return _image_cache[image_path]
-    
-    with open(image_path, "rb") as image_file:
-        encoded = base64.b64encode(image_file.read()).decode('utf-8')
-        _image_cache[image_path] = encoded
-        return encoded
-
-def format_json_output(output_dict):
-    """Format output dictionary as JSON string matching the original format"""
-    lines = ["{"]
-    for i, (key, value) in enumerate(output_dict.items()):
-        comma = "," if i < len(output_dict) - 1 else ""
-        lines.append(f'  "{key}": "{value}"{comma}')
-    lines.append("}")
-    return "\n".join(lines)
-
-def build_few_shot_messages(examples, task_prompt):
-    """Build few-shot messages efficiently"""
-    messages = []
-    
-    for example in examples:
-        # User message with image
-        messages.append({
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": task_prompt
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{encode_image(example['image_path'])}",
-                        "detail": "high"
-                    }
-                }
-            ]
-        })
-        
-        # Assistant response
-        messages.append({
-            "role": "assistant",
-            "content": format_json_output(example['output'])
-        })
-    
-    return messages
-
-
-def transcribe_setup(path, use_few_shot=True, max_examples=4):
-    """
-    Transcribe a Stratego setup image to JSON format.
-    
-    Args:
-        path: Path to the user's input image
-        use_few_shot: Whether to use few-shot examples (default: True)
-        max_examples: Maximum number of few-shot examples to use (default: 3)
-    """
-    # Define the task prompt
-    task_prompt = """
+TASK_PROMPT = """
     Transcribe a Stratego setup and place it in a JSON object, like in the example below.
     
     Example:
@@ -131,22 +35,7 @@ def transcribe_setup(path, use_few_shot=True, max_examples=4):
     }
     """
 
-    # Initialize ChatXAI
-    chat = ChatXAI(
-        api_key=XAI_API_KEY,
-        model="grok-2-vision-1212",
-        temperature=0.1
-    )
-
-
-    # Build messages
-    messages = [
-        {
-            "role": "system",
-            "content": [
-                {
-                    "type": "text",
-                    "text": """
+SYSTEM_PROMPT = """
             Ensure the transcription is precise and follows the grid structure.
             Use numbers (1-10) for piece ranks, 'B' for bombs, and 'F' for the flag.
             Make sure to double-check your results, as mismatches can happen. Here are some examples of mismatches: 
@@ -165,19 +54,30 @@ def transcribe_setup(path, use_few_shot=True, max_examples=4):
             - B seen as 3
             - F seen as 8
             """
-                }
-            ]
-        }
-    ]
 
-    # Add few-shot examples if enabled
-    if use_few_shot:
-        examples_to_use = FEW_SHOT_EXAMPLES[:max_examples]
-        few_shot_messages = build_few_shot_messages(examples_to_use, task_prompt)
-        messages.extend(few_shot_messages)
+MODEL = os.getenv("XAI_MODEL", "grok-2-vision-1212")
+# The most similar examples help most; every extra example adds an image to each request
+DEFAULT_FEW_SHOT_EXAMPLES = 2
+# Point at another OpenAI-compatible server, e.g. src/api/stub_model_server.py for testing
+XAI_API_BASE = os.getenv("XAI_API_BASE")
 
-    # Add user's input image
-    messages.append({
+_chat_clients = {}
+_chat_clients_lock = threading.Lock()
+_prompt_prefixes = {}
+_prompt_prefixes_lock = threading.Lock()
+
+def format_json_output(output_dict):
+    """Format output dictionary as JSON string matching the original format"""
+    lines = ["{"]
+    for i, (key, value) in enumerate(output_dict.items()):
+        comma = "," if i < len(output_dict) - 1 else ""
+        lines.append(f'  "{key}": "{value}"{comma}')
+    lines.append("}")
+    return "\n".join(lines)
+
+def build_image_message(task_prompt, image_base64, mime_type="image/png"):
+    """Build a user message with the task prompt and an image"""
+    return {
         "role": "user",
         "content": [
             {
@@ -187,16 +87,158 @@ def transcribe_setup(path, use_few_shot=True, max_examples=4):
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{encode_image(path)}",
+                    "url": f"data:{mime_type};base64,{image_base64}",
                     "detail": "high"
                 }
             }
         ]
-    })
+    }
+
+def build_few_shot_messages(examples, task_prompt):
+    """Build few-shot messages from the pre-encoded examples of the few-shot bundle"""
+    messages = []
+    
+    for example in examples:
+        # User message with image
+        messages.append(build_image_message(task_prompt, example['image_base64'], "image/jpeg"))
+        
+        # Assistant response
+        messages.append({
+            "role": "assistant",
+            "content": format_json_output(example['output'])
+        })
+    
+    return messages
+
+
+def get_chat_client(api_key=None, api_base=None):
+    """
+    Return a shared ChatXAI client, created on first use.
+    
+    The client is safe to use from several threads, so every transcription reuses its
+    HTTP connections instead of creating a new client per call.
+    """
+    api_key = api_key or XAI_API_KEY
+    api_base = api_base or XAI_API_BASE
+    key = (api_key, api_base)
+    with _chat_clients_lock:
+        if key not in _chat_clients:
+            options = {"xai_api_base": api_base} if api_base else {}
+            _chat_clients[key] = ChatXAI(
+                api_key=api_key,
+                model=MODEL,
+                temperature=0.1,
+                **options
+            )
+        return _chat_clients[key]
+
+
+def get_prompt_prefix(examples=()):
+    """
+    Return the system prompt and few-shot messages for the given examples, built once per process.
+    
+    The returned list is shared; callers copy it before appending their own messages.
+    """
+    key = tuple(example['name'] for example in examples)
+    with _prompt_prefixes_lock:
+        if key not in _prompt_prefixes:
+            messages = [
+                {
+                    "role": "system",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": SYSTEM_PROMPT
+                        }
+                    ]
+                }
+            ]
+            messages.extend(build_few_shot_messages(examples, TASK_PROMPT))
+            _prompt_prefixes[key] = messages
+        return _prompt_prefixes[key]
+
 
-    # Invoke the chat model and get the response
-    response = chat.invoke(messages)
+def get_prompt_version(examples=()):
+    """Hash of everything in the prompt besides the user's image, used to key cached transcriptions"""
+    bundle_version = load_bundle()['version'] if examples else ''
+    prompt = json.dumps([SYSTEM_PROMPT, TASK_PROMPT, bundle_version, [example['name'] for example in examples]])
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
 
-    setup = string_to_json(response.content)
+
+def transcribe_image_bytes(image_bytes, mime_type="image/png", use_few_shot=True,
+                           max_examples=DEFAULT_FEW_SHOT_EXAMPLES, use_cache=True):
+    """
+    Transcribe an encoded Stratego setup image to JSON format.
+    
+    The few-shot examples most similar to the image are sent along. Transcriptions are cached
+    on disk by the hash of the image bytes, the model and the prompt, so the same screenshot is
+    only sent to the model once.
+    
+    Args:
+        image_bytes: The encoded image
+        mime_type: MIME type of the encoding (default: image/png)
+        use_few_shot: Whether to use few-shot examples (default: True)
+        max_examples: Maximum number of few-shot examples to use (default: 2)
+        use_cache: Whether to use the transcription cache (default: True)
+    """
+    examples = select_examples(max_examples, image_bytes) if use_few_shot else []
+    cache_key = transcription_cache_key(image_bytes, MODEL, get_prompt_version(examples))
+    if use_cache:
+        cached_setup = transcription_cache.get(cache_key)
+        if cached_setup is not None:
+            return cached_setup
+    
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    messages = get_prompt_prefix(examples) + [build_image_message(TASK_PROMPT, image_base64, mime_type)]
+    
+    # Parse the answer while it streams in: a malformed answer fails on its first bad character,
+    # and the rest of the answer is not waited for once the setup is complete
+    stream = get_chat_client().stream(messages)
+    try:
+        setup = parse_setup_stream((chunk.content for chunk in stream), exact_rows=False).setup
+    finally:
+        stream.close()
+    if use_cache:
+        transcription_cache.put(cache_key, setup)
     return setup
 
+
+def transcribe_setup(path, use_few_shot=True, max_examples=DEFAULT_FEW_SHOT_EXAMPLES, use_cache=True):
+    """
+    Transcribe a Stratego setup image file to JSON format, as it is.
+    
+    Args:
+        path: Path to the user's input image
+        use_few_shot: Whether to use few-shot examples (default: True)
+        max_examples: Maximum number of few-shot examples to use (default: 2)
+        use_cache: Whether to use the transcription cache (default: True)
+    """
+    with open(path, "rb") as image_file:
+        image_bytes = image_file.read()
+    
+    mime_type = mimetypes.guess_type(path)[0] or "image/png"
+    return transcribe_image_bytes(image_bytes, mime_type, use_few_shot, max_examples, use_cache)
+
+
+def transcribe_screenshot(source, use_few_shot=True, max_examples=DEFAULT_FEW_SHOT_EXAMPLES, use_cache=True,
+                          use_local_classifier=True):
+    """
+    Transcribe a screenshot with the local piece classifier, or with the model if it is not sure.
+    
+    For the model, the screenshot is cropped to the setup grid and enhanced in memory.
+    
+    Args:
+        source: Path or encoded bytes of the screenshot
+        use_few_shot: Whether to use few-shot examples (default: True)
+        max_examples: Maximum number of few-shot examples to use (default: 2)
+        use_cache: Whether to use the transcription cache (default: True)
+        use_local_classifier: Whether to try the local piece classifier first (default: True)
+    """
+    image = load_image(source)
+    if use_local_classifier:
+        setup = classify_screenshot(image)
+        if setup is not None:
+            return setup
+    
+    enhanced = preprocess_image(image, crop_to_board=True)
+    return transcribe_image_bytes(enhanced.data, enhanced.mime_type, use_few_shot, max_examples, use_cache)
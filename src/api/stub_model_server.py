@@ -0,0 +1,141 @@
+"""
+Minimal OpenAI-compatible chat completions server for testing transcription without the xAI API.
+
+Every request is answered with the same setup after an optional delay; a share of the requests
+can fail with HTTP 503 to exercise retries. Streaming requests get the answer in small chunks,
+optionally spaced out to imitate generation.
+
+Usage:
+    python -m src.api.stub_model_server [--port 8765] [--delay 0.5] [--chunk-delay 0.01] [--failure-rate 0.1]
+    XAI_API_BASE=http://127.0.0.1:8765/v1 python -m src.api.batch_transcribe screenshots/
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.api.grok_api import format_json_output
+
+STUB_SETUP = {
+    "1": "['6', '2', '6', '4', '8', '2', '5', '2', '2', '5']",
+    "2": "['3', '5', '2', '9', '7', '5', '2', 'B', '4', '8']",
+    "3": "['B', '2', '7', '1', '6', '2', '7', '10', '6', '3']",
+    "4": "['B', '4', 'B', '3', 'B', '3', 'B', '4', '3', 'F']"
+}
+
+
+# Characters per streamed chunk, roughly one token
+STREAM_CHUNK_SIZE = 4
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    chunk_delay = 0.0
+    failure_rate = 0.0
+    requests_served = 0
+    _counter_lock = threading.Lock()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self._counter_lock:
+            type(self).requests_served += 1
+
+        time.sleep(self.delay)
+        if random.random() < self.failure_rate:
+            self._send_json(503, {"error": {"message": "Stub server overloaded", "type": "server_error"}})
+            return
+
+        if request.get("stream"):
+            self._send_stream(format_json_output(STUB_SETUP))
+            return
+
+        self._send_json(200, {
+            "id": f"stub-{self.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": format_json_output(STUB_SETUP)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, content):
+        """Send the answer as server-sent chat.completion.chunk events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        chunks = [content[start:start + STREAM_CHUNK_SIZE] for start in range(0, len(content), STREAM_CHUNK_SIZE)]
+        events = []
+        for chunk in chunks + [None]:
+            events.append(json.dumps({
+                "id": f"stub-{self.requests_served}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": chunk} if chunk is not None else {},
+                    "finish_reason": None if chunk is not None else "stop",
+                }],
+            }))
+        events.append("[DONE]")
+
+        for event in events:
+            try:
+                self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading, e.g. after the end of the setup
+                return
+            time.sleep(self.chunk_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, delay=0.0, failure_rate=0.0, chunk_delay=0.0):
+    """
+    Start the stub server in a background thread.
+
+    Returns:
+        Tuple of (server, base URL to use as XAI_API_BASE)
+    """
+    handler = type("ConfiguredStubModelHandler", (StubModelHandler,),
+                   {"delay": delay, "failure_rate": failure_rate, "chunk_delay": chunk_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fixed transcription over the chat completions API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.delay, args.failure_rate, args.chunk_delay)
+    print(f"Stub model server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
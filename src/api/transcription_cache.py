@@ -0,0 +1,121 @@
+"""
+On-disk cache of transcribed setups, addressed by the hash of the image that was sent.
+
+The key combines the image bytes with the model and a version of the prompt, so changing
+either makes old entries unreachable; they are evicted like any other entry. Every entry is a
+small JSON file. When the total size exceeds the limit, the least recently used entries are
+removed.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "STRATEGO_TRANSCRIPTION_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'transcription_cache')
+)
+DEFAULT_MAX_BYTES = int(os.getenv("STRATEGO_TRANSCRIPTION_CACHE_BYTES", str(50 * 1024 * 1024)))
+# Evict down to this share of the limit, so eviction does not run on every write
+EVICTION_TARGET = 0.8
+
+
+def transcription_cache_key(image_bytes: bytes, model: str, prompt_version: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    digest.update(b"\0" + model.encode("utf-8") + b"\0" + prompt_version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """Maps cache keys to transcribed setups, stored as <directory>/<key[:2]>/<key>.json."""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, List[str]]]:
+        """Return the cached setup, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                setup = json.load(file)
+            os.utime(path)  # Mark as recently used for eviction
+            return setup
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, setup: Dict[str, List[str]]) -> None:
+        """Store a setup, evicting the least recently used entries if the cache is full."""
+        path = self._path(key)
+        payload = json.dumps(setup).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(handle, "wb") as file:
+                file.write(payload)
+            try:
+                replaced_size = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache transcription: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                # Overwriting an entry only changes the size by the difference
+                self._size += len(payload) - replaced_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in self._entries():
+                os.remove(path)
+            self._size = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, size, last use) for every cached entry."""
+        if not os.path.isdir(self.directory):
+            return
+        for subdirectory in os.scandir(self.directory):
+            if subdirectory.is_dir():
+                for entry in os.scandir(subdirectory.path):
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache is below the eviction target."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * EVICTION_TARGET
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,83 @@
+"""
+Benchmark cropping screenshots to the setup grid before transcription.
+
+Two inputs are compared: the sample screenshot, which is already close to the board, and the same
+board pasted into a synthetic 1920 x 1080 full-screen capture. For each, the enhanced image is
+sent whole and cropped to the grid. The report shows the payload, an estimate of the image tokens
+and the end-to-end time of a transcription against the local stub model server (with
+--delay, the stub adds a fixed model latency).
+
+Run from the project root:
+    python -m src.benchmarks.bench_board_crop [--delay 0.0] [--repeat 10]
+"""
+import argparse
+import math
+import os
+
+from PIL import Image, ImageDraw
+
+from src.api import grok_api
+from src.api.stub_model_server import start_stub_server
+from src.benchmarks.timing import time_call
+from src.imaging.board import find_board
+from src.imaging.preprocess import preprocess_image
+
+SAMPLE_SCREENSHOT = os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'temp', 'Screenshot 2025-07-08 175652.png')
+
+
+def full_screen_capture(board: Image.Image) -> Image.Image:
+    """Paste the board into a 1920 x 1080 capture with some bright UI around it."""
+    canvas = Image.new('RGB', (1920, 1080), (20, 22, 30))
+    draw = ImageDraw.Draw(canvas)
+    draw.rectangle((0, 0, 1920, 60), fill=(230, 230, 230))
+    draw.rectangle((1500, 300, 1800, 900), fill=(200, 200, 210))
+    draw.text((100, 150), "Opponent: someone    Rating: 1500", fill=(255, 255, 255))
+    canvas.paste(board, (400, 420))
+    return canvas
+
+
+def estimated_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the tokens of an image sent with detail=high, using the published OpenAI tiling rule.
+
+    The image is fit into 2048 x 2048, its short side scaled down to 768, and every 512 x 512 tile
+    costs 170 tokens on top of a base of 85. xAI does not document its rule; this is a proxy.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def main(delay: float, repeat: int):
+    server, base_url = start_stub_server(delay=delay)
+    grok_api.XAI_API_BASE = base_url
+    grok_api.XAI_API_KEY = grok_api.XAI_API_KEY or "stub"
+
+    board = Image.open(SAMPLE_SCREENSHOT).convert('RGB')
+    inputs = {"board screenshot": board, "full-screen capture": full_screen_capture(board)}
+
+    print(f"{'input':>20} {'mode':>6} {'size':>11} {'payload (KB)':>13} {'est. tokens':>12} "
+          f"{'preprocess (ms)':>16} {'end-to-end (ms)':>16}")
+    for name, image in inputs.items():
+        for mode, crop in (("whole", False), ("crop", True)):
+            enhanced = preprocess_image(image, crop_to_board=crop)
+            preprocess_ms = time_call(lambda: preprocess_image(image, crop_to_board=crop), repeat=repeat)
+            end_to_end_ms = time_call(lambda: grok_api.transcribe_image_bytes(
+                preprocess_image(image, crop_to_board=crop).data, 'image/jpeg', use_few_shot=False, use_cache=False), repeat)
+            size = f"{enhanced.size[0]}x{enhanced.size[1]}"
+            print(f"{name:>20} {mode:>6} {size:>11} {len(enhanced.base64) / 1024:>13.1f} "
+                  f"{estimated_image_tokens(*enhanced.size):>12} {preprocess_ms:>16.1f} {end_to_end_ms:>16.1f}")
+
+    find_ms = time_call(lambda: find_board(inputs["full-screen capture"]), repeat=repeat)
+    print(f"find_board on the full-screen capture: {find_ms:.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--delay", type=float, default=0.0, help="Simulated model latency of the stub server")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    main(args.delay, args.repeat)
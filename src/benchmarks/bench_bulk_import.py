@@ -0,0 +1,66 @@
+"""
+Benchmark the bulk importer on a synthetic JSONL file.
+
+Run from the project root:
+    python -m src.benchmarks.bench_bulk_import [number_of_games]
+"""
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.benchmarks.synthetic_data import RESULTS, create_benchmark_database, random_setup, remove_benchmark_database
+from src.database.bulk_import import BulkImporter
+from src.database.setup_encoding import setup_fingerprint
+from src.database.sqlite_database import StrategoDatabase
+
+DEFAULT_GAMES = 100_000
+# Share of games that reuse a setup from earlier in the file
+REPEAT_RATE = 0.2
+
+
+def write_games(path: str, num_games: int, rng: random.Random) -> None:
+    setups = []
+    with open(path, 'w', encoding='utf-8') as file:
+        for game in range(num_games):
+            if setups and rng.random() < REPEAT_RATE:
+                setup = rng.choice(setups)
+            else:
+                setup = random_setup(rng)
+                setups.append(setup)
+            row = {
+                'date_played': f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+                'opponent_name': f"opponent_{rng.randrange(200)}",
+                'result': rng.choice(RESULTS),
+                'moves': rng.randrange(50, 1500),
+                'noob_killer': int(rng.random() < 0.1),
+                # Alternate between the two setup formats the importer accepts
+                'setup': setup_fingerprint(setup) if game % 2 else setup,
+            }
+            file.write(json.dumps(row) + "\n")
+
+
+def main(num_games: int):
+    logging.getLogger('src.database.bulk_import').setLevel(logging.WARNING)
+    db_path = create_benchmark_database(0)
+    handle, games_path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(handle)
+    try:
+        write_games(games_path, num_games, random.Random(42))
+
+        start = time.perf_counter()
+        stats = BulkImporter(StrategoDatabase(db_path)).import_file(games_path)
+        elapsed = time.perf_counter() - start
+
+        print(f"Imported {stats['imported']} games ({stats['new_setups']} new setups) "
+              f"in {elapsed:.2f} s: {stats['imported'] / elapsed:.0f} games/s")
+    finally:
+        remove_benchmark_database(db_path)
+        os.remove(games_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_GAMES)
@@ -0,0 +1,112 @@
+"""
+Benchmark read latency while a bulk import is writing, with and without pooled WAL connections.
+
+"legacy" opens a new rollback-journal connection for every call, like get_db_connection used to;
+"pooled" reuses per-thread WAL connections. Reader threads load pages of setups, like the
+filter view does for a cached page, with a short pause between requests for as long as the
+import takes. Blocked readers show up in the p99 and max latencies.
+
+Run from the project root:
+    python -m src.benchmarks.bench_concurrent_reads [number_of_games] [number_of_readers]
+"""
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from src.benchmarks.bench_bulk_import import write_games
+from src.benchmarks.synthetic_data import create_benchmark_database, remove_benchmark_database
+from src.database import sqlite_database
+from src.database.bulk_import import BulkImporter
+from src.database.sqlite_database import StrategoDatabase, close_thread_connections
+
+DEFAULT_GAMES = 50_000
+DEFAULT_READERS = 4
+BASE_SETUPS = 20_000
+BATCH_SIZE = 5_000
+PAGE_SIZE = 10
+THINK_TIME = 0.005
+
+MODES = {
+    "legacy": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "MAX_IDLE_CONNECTIONS": 0},
+    "pooled": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL", "MAX_IDLE_CONNECTIONS": 4},
+}
+
+
+def read_setup_page(database: StrategoDatabase, rng: random.Random) -> None:
+    database.get_cache_generation()
+    database.get_setups_with_setup_ids(rng.sample(range(1, BASE_SETUPS + 1), PAGE_SIZE))
+
+
+def reader(database: StrategoDatabase, seed: int, stop: threading.Event, latencies: List[float]) -> None:
+    rng = random.Random(seed)
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            read_setup_page(database, rng)
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(THINK_TIME)
+    finally:
+        close_thread_connections()
+
+
+def run(mode: str, games_path: str, num_readers: int) -> Dict[str, float]:
+    for name, value in MODES[mode].items():
+        setattr(sqlite_database, name, value)
+
+    db_path = create_benchmark_database(BASE_SETUPS)
+    try:
+        database = StrategoDatabase(db_path)
+        read_setup_page(database, random.Random(0))  # warm up before timing
+
+        stop = threading.Event()
+        latencies: List[float] = []
+        readers = [threading.Thread(target=reader, args=(database, seed, stop, latencies)) for seed in range(num_readers)]
+        for thread in readers:
+            thread.start()
+
+        start = time.perf_counter()
+        BulkImporter(database, batch_size=BATCH_SIZE).import_file(games_path)
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for thread in readers:
+            thread.join()
+    finally:
+        remove_benchmark_database(db_path)
+
+    latencies.sort()
+    return {
+        "import_s": elapsed,
+        "reads_per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99)],
+        "max_ms": latencies[-1],
+    }
+
+
+def main(num_games: int, num_readers: int):
+    logging.getLogger('src.database.bulk_import').setLevel(logging.WARNING)
+    handle, games_path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(handle)
+    try:
+        write_games(games_path, num_games, random.Random(42))
+
+        print(f"{num_games} games imported while {num_readers} threads read setup pages")
+        print(f"{'mode':>8} {'import (s)':>11} {'reads/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+        for mode in MODES:
+            stats = run(mode, games_path, num_readers)
+            print(f"{mode:>8} {stats['import_s']:>11.2f} {stats['reads_per_s']:>9.0f} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+    finally:
+        os.remove(games_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_GAMES,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_READERS)
@@ -0,0 +1,55 @@
+"""
+Benchmark duplicate detection: the TempSetup join against the indexed fingerprint lookup.
+
+Run from the project root (sizes can be passed as arguments):
+    python -m src.benchmarks.bench_duplicate_lookup 1000 10000 100000
+"""
+import random
+import sys
+
+from src.benchmarks.synthetic_data import create_benchmark_database, random_setup, remove_benchmark_database
+from src.benchmarks.timing import time_call
+from src.database.setup_encoding import setup_fingerprint
+from src.database.sqlite_database import StrategoDatabase, get_db_connection
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+TEMP_SETUP_ID = 1
+
+
+def stage_setup(db_path: str, setup) -> None:
+    with get_db_connection(db_path) as conn:
+        conn.execute("DELETE FROM TempSetup")
+        conn.executemany(
+            "INSERT INTO TempSetup (setup_id, row, col, piece) VALUES (?, ?, ?, ?)",
+            [(TEMP_SETUP_ID, int(row), index + 1, piece) for row, pieces in setup.items() for index, piece in enumerate(pieces)]
+        )
+        conn.commit()
+
+
+def main(sizes):
+    print(f"{'setups':>8} {'case':>10} {'join (ms)':>10} {'staging + join (ms)':>20} {'fingerprint (ms)':>17}")
+    for size in sizes:
+        db_path = create_benchmark_database(size)
+        try:
+            database = StrategoDatabase(db_path)
+            existing_setup = database.get_setups_with_setup_ids([size // 2])[0]
+            existing = {str(row): [piece for r, _, piece in existing_setup if r == row] for row in range(1, 5)}
+            cases = {"duplicate": existing, "new": random_setup(random.Random(size))}
+
+            for case, setup in cases.items():
+                fingerprint = setup_fingerprint(setup)
+
+                stage_setup(db_path, setup)
+                join_result = database.check_duplicate_setup()
+                assert join_result == database.find_setup_id_by_fingerprint(fingerprint)
+
+                join_ms = time_call(database.check_duplicate_setup)
+                staged_ms = time_call(lambda: (stage_setup(db_path, setup), database.check_duplicate_setup()))
+                lookup_ms = time_call(lambda: database.find_setup_id_by_fingerprint(setup_fingerprint(setup)))
+                print(f"{size:>8} {case:>10} {join_ms:>10.2f} {staged_ms:>20.2f} {lookup_ms:>17.3f}")
+        finally:
+            remove_benchmark_database(db_path)
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,45 @@
+"""
+Benchmark the batched get_setups_with_setup_ids against the previous one-connection-per-setup fetch.
+
+Run from the project root:
+    python -m src.benchmarks.bench_get_setups_with_setup_ids
+"""
+from typing import List
+
+from src.benchmarks.synthetic_data import create_benchmark_database, remove_benchmark_database
+from src.benchmarks.timing import time_call
+from src.database.sqlite_database import StrategoDatabase, get_db_connection
+
+SIZES = [10, 100, 1000, 5000]
+REPEAT = 3
+
+
+def legacy_get_setups_with_setup_ids(db_path: str, setup_ids: List[int]):
+    """The previous implementation: a new connection and a separate SELECT for every setup id."""
+    results = []
+    for setup_id in setup_ids:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT row, col, piece FROM GameSetups WHERE setup_id = ?", (setup_id,))
+            results.append(cursor.fetchall())
+    return results
+
+
+def main():
+    db_path = create_benchmark_database(max(SIZES))
+    try:
+        database = StrategoDatabase(db_path)
+        print(f"{'ids':>6} {'legacy (ms)':>12} {'batched (ms)':>13} {'speedup':>8}")
+        for size in SIZES:
+            setup_ids = list(range(size, 0, -1))
+            assert legacy_get_setups_with_setup_ids(db_path, setup_ids) == database.get_setups_with_setup_ids(setup_ids)
+
+            legacy_ms = time_call(legacy_get_setups_with_setup_ids, db_path, setup_ids, repeat=REPEAT)
+            batched_ms = time_call(database.get_setups_with_setup_ids, setup_ids, repeat=REPEAT)
+            print(f"{size:>6} {legacy_ms:>12.2f} {batched_ms:>13.2f} {legacy_ms / batched_ms:>7.1f}x")
+    finally:
+        remove_benchmark_database(db_path)
+
+
+if __name__ == "__main__":
+    main()
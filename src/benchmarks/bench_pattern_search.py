@@ -0,0 +1,70 @@
+"""
+Benchmark pattern queries on the in-memory bitboards against the stored bitboard columns and a
+Python scan over the (row, col, piece) squares of every setup.
+
+Run from the project root:
+    python -m src.benchmarks.bench_pattern_search
+"""
+import time
+
+from src.analysis.pattern_search import SetupBitboards, compile_pattern, find_matching_setups
+from src.benchmarks.synthetic_data import create_benchmark_database, remove_benchmark_database
+from src.benchmarks.timing import time_call
+from src.database.setup_encoding import PIECES, square_index
+from src.database.setup_matrix import SetupMatrix
+from src.database.sqlite_database import StrategoDatabase
+
+NUM_SETUPS = 100_000
+
+PATTERNS = {
+    'flag in corner, bombed in': {(4, 1): 'F', (3, 1): 'B', (4, 2): 'B'},
+    'bombs on middle lane': {(1, 5): 'B', (1, 6): 'B'},
+    'no bomb in front row': {'1': ['!B'] * 10},
+    'flag or bomb in corners': {(4, 1): 'F|B', (4, 10): 'F|B'},
+}
+
+
+def python_scan(setups, pattern):
+    """Match a compiled pattern square by square over (setup_id, [(row, col, piece), ...]) pairs."""
+    allowed = {
+        square: {PIECES[code] for code in codes}
+        for codes, mask in pattern.groups for square in range(40) if mask >> square & 1
+    }
+    return [
+        setup_id for setup_id, squares in setups
+        if all(piece in allowed[square_index(row, col)] for row, col, piece in squares
+               if square_index(row, col) in allowed)
+    ]
+
+
+def main():
+    db_path = create_benchmark_database(NUM_SETUPS)
+    try:
+        database = StrategoDatabase(db_path)
+        setup_matrix = SetupMatrix.from_database(database)
+
+        start = time.perf_counter()
+        bitboards = SetupBitboards(setup_matrix)
+        bitboards.boards
+        print(f"Computed bitboards of {len(bitboards)} setups in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        setup_ids = setup_matrix.setup_ids.tolist()
+        setups = list(zip(setup_ids, database.get_setups_with_setup_ids(setup_ids)))
+
+        print(f"{'pattern':>26} {'matches':>8} {'python (ms)':>12} {'sql (ms)':>9} {'bitboards (ms)':>15}")
+        for name, pattern in PATTERNS.items():
+            compiled = compile_pattern(pattern)
+            matches = find_matching_setups(pattern, bitboards)
+            assert matches == python_scan(setups, compiled)
+            assert matches == database.get_setup_ids_by_piece_masks(compiled.piece_masks)
+
+            python_ms = time_call(python_scan, setups, compiled, repeat=1)
+            sql_ms = time_call(database.get_setup_ids_by_piece_masks, compiled.piece_masks, repeat=1)
+            bitboard_ms = time_call(find_matching_setups, pattern, bitboards)
+            print(f"{name:>26} {len(matches):>8} {python_ms:>12.1f} {sql_ms:>9.1f} {bitboard_ms:>15.2f}")
+    finally:
+        remove_benchmark_database(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmark the vectorized similarity search over an in-memory SetupMatrix.
+
+Run from the project root:
+    python -m src.benchmarks.bench_similarity_search
+"""
+import random
+
+import numpy as np
+
+from src.benchmarks.synthetic_data import random_setup
+from src.benchmarks.timing import time_call
+from src.checks.similarity_check import (
+    find_most_similar_setups,
+    find_most_similar_setups_batch,
+    find_similar_setups_above_threshold,
+)
+from src.database.setup_encoding import encode_setup
+from src.database.setup_matrix import SetupMatrix
+
+SIZES = [1_000, 10_000, 100_000]
+BATCH_SIZE = 32
+
+
+def build_matrix(num_setups: int, rng: random.Random) -> SetupMatrix:
+    setup_matrix = SetupMatrix(capacity=num_setups)
+    encoded = np.stack([encode_setup(random_setup(rng)) for _ in range(num_setups)])
+    setup_matrix.extend(np.arange(1, num_setups + 1), encoded)
+    return setup_matrix
+
+
+def main():
+    rng = random.Random(42)
+    query = random_setup(rng)
+    batch = [random_setup(rng) for _ in range(BATCH_SIZE)]
+
+    print(f"{'setups':>8} {'top-10 (ms)':>12} {'>=36 (ms)':>10} {f'batch of {BATCH_SIZE} (ms)':>18}")
+    for size in SIZES:
+        setup_matrix = build_matrix(size, rng)
+        top_k_ms = time_call(find_most_similar_setups, query, 10, setup_matrix)
+        threshold_ms = time_call(find_similar_setups_above_threshold, query, 36, setup_matrix)
+        batch_ms = time_call(find_most_similar_setups_batch, batch, 10, setup_matrix)
+        print(f"{size:>8} {top_k_ms:>12.2f} {threshold_ms:>10.2f} {batch_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
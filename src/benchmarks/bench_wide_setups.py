@@ -0,0 +1,80 @@
+"""
+Benchmark reading setups from the one-row-per-setup Setups table against the 40 GameSetups rows.
+
+Compares the rows read and the time for a page of grids (get_setups_with_setup_ids) and for
+loading every setup for the similarity search (SetupMatrix.from_database).
+
+Run from the project root:
+    python -m src.benchmarks.bench_wide_setups
+"""
+from typing import List
+
+import numpy as np
+
+from src.benchmarks.synthetic_data import create_benchmark_database, remove_benchmark_database
+from src.benchmarks.timing import time_call
+from src.database.setup_encoding import PIECE_CODES, SQUARES
+from src.database.setup_matrix import SetupMatrix
+from src.database.sqlite_database import StrategoDatabase, get_db_connection
+
+NUM_SETUPS = 20000
+PAGE_SIZES = [10, 1000]
+REPEAT = 3
+
+
+def legacy_get_setups_with_setup_ids(db_path: str, setup_ids: List[int]):
+    """The previous implementation: 40 GameSetups rows per setup."""
+    squares_by_setup_id = {}
+    with get_db_connection(db_path) as conn:
+        placeholders = ", ".join("?" * len(setup_ids))
+        rows = conn.execute(f"""
+                            SELECT setup_id, row, col, piece
+                            FROM GameSetups
+                            WHERE setup_id IN ({placeholders})
+                            ORDER BY setup_id, row, col
+                            """, setup_ids).fetchall()
+    for setup_id, row, col, piece in rows:
+        squares_by_setup_id.setdefault(setup_id, []).append((row, col, piece))
+    return [squares_by_setup_id.get(setup_id, []) for setup_id in setup_ids], len(rows)
+
+
+def legacy_load_matrix(db_path: str):
+    """The previous SetupMatrix load: every GameSetups row, decoded piece by piece."""
+    with get_db_connection(db_path) as conn:
+        rows = conn.execute("SELECT setup_id, piece FROM GameSetups ORDER BY setup_id, row, col").fetchall()
+    setup_ids = np.fromiter((setup_id for setup_id, _ in rows[::SQUARES]), dtype=np.int64)
+    codes = np.fromiter((PIECE_CODES[piece] for _, piece in rows), dtype=np.uint8, count=len(rows))
+    return setup_ids, codes.reshape(-1, SQUARES), len(rows)
+
+
+def main():
+    db_path = create_benchmark_database(NUM_SETUPS)
+    try:
+        database = StrategoDatabase(db_path)
+        print(f"{'read':>22} {'rows before':>12} {'rows after':>11} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}")
+
+        for size in PAGE_SIZES:
+            setup_ids = list(range(NUM_SETUPS, NUM_SETUPS - size, -1))
+            legacy, legacy_rows = legacy_get_setups_with_setup_ids(db_path, setup_ids)
+            assert legacy == database.get_setups_with_setup_ids(setup_ids)
+
+            legacy_ms = time_call(legacy_get_setups_with_setup_ids, db_path, setup_ids, repeat=REPEAT)
+            wide_ms = time_call(database.get_setups_with_setup_ids, setup_ids, repeat=REPEAT)
+            print(f"{f'page of {size} grids':>22} {legacy_rows:>12} {size:>11} "
+                  f"{legacy_ms:>12.2f} {wide_ms:>11.2f} {legacy_ms / wide_ms:>7.1f}x")
+
+        legacy_ids, legacy_codes, legacy_rows = legacy_load_matrix(db_path)
+        setup_matrix = SetupMatrix.from_database(database)
+        assert np.array_equal(legacy_ids, setup_matrix.setup_ids)
+        assert np.array_equal(legacy_codes, setup_matrix.matrix)
+
+        legacy_ms = time_call(legacy_load_matrix, db_path, repeat=REPEAT)
+        wide_ms = time_call(SetupMatrix.from_database, database, repeat=REPEAT)
+        print(f"{'similarity matrix load':>22} {legacy_rows:>12} {len(setup_matrix):>11} "
+              f"{legacy_ms:>12.2f} {wide_ms:>11.2f} {legacy_ms / wide_ms:>7.1f}x")
+    finally:
+        remove_benchmark_database(db_path)
+
+
+if __name__ == "__main__":
+    main()
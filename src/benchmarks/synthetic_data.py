@@ -0,0 +1,85 @@
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from src.checks.staging_consistency_checks import correct_piece_configuration
+from src.database.migrations import apply_migrations
+from src.database.sqlite_database import close_thread_connections
+
+PIECE_POOL = [piece for piece, amount in correct_piece_configuration.items() for _ in range(amount)]
+RESULTS = ['win', 'draw', 'loss']
+
+
+def random_setup(rng: random.Random) -> Dict[str, List[str]]:
+    """Create a random but valid setup in the same format as the transcribed JSON."""
+    pieces = PIECE_POOL[:]
+    rng.shuffle(pieces)
+    return {str(row + 1): pieces[row * 10:(row + 1) * 10] for row in range(4)}
+
+
+def create_benchmark_database(num_setups: int, seed: int = 42, path: Optional[str] = None) -> str:
+    """
+    Create a database with the production schema filled with synthetic setups and game records.
+
+    The schema is built from src.database.migrations alone, so benchmarks never read or migrate
+    data/sqlite_database.db. The base schema is filled first and the later migrations run
+    afterwards, so derived tables are populated by the same backfill that runs on existing databases.
+
+    Args:
+        num_setups: Number of setups (and game records) to generate
+        seed: Seed for the random generator, so runs are comparable
+        path: Optional target path. If None, a temporary file is created.
+
+    Returns:
+        Path to the created database file.
+    """
+    if path is None:
+        handle, path = tempfile.mkstemp(prefix="stratego_bench_", suffix=".db")
+        os.close(handle)
+
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(path)
+    try:
+        apply_migrations(conn, target_version=1)
+
+        start_date = date(2024, 1, 1)
+        setup_rows = []
+        record_rows = []
+        for setup_id in range(1, num_setups + 1):
+            setup = random_setup(rng)
+            for row, pieces in setup.items():
+                for index, piece in enumerate(pieces):
+                    setup_rows.append((setup_id, int(row), index + 1, piece))
+            record_rows.append((
+                setup_id,
+                (start_date + timedelta(days=rng.randrange(700))).isoformat(),
+                f"opponent_{rng.randrange(200)}",
+                rng.choice(RESULTS),
+                rng.randrange(50, 1500),
+                int(rng.random() < 0.1),
+            ))
+
+        conn.executemany("INSERT INTO GameSetups (setup_id, row, col, piece) VALUES (?, ?, ?, ?)", setup_rows)
+        conn.executemany(
+            "INSERT INTO GameRecords (setup_id, date_played, opponent_name, result, moves, noob_killer) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            record_rows
+        )
+        conn.commit()
+        apply_migrations(conn)
+    finally:
+        conn.close()
+
+    return path
+
+
+def remove_benchmark_database(path: str) -> None:
+    """Close this thread's pooled connections to a benchmark database and delete its files."""
+    close_thread_connections(path)
+    for file_path in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
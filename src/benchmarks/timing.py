@@ -0,0 +1,11 @@
+import time
+
+
+def time_call(function, *args, repeat: int = 5) -> float:
+    """Return the best wall-clock time in milliseconds of function(*args) over a few runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
@@ -0,0 +1,326 @@
+"""
+Repair transcribed setups that fail check_piece_consistency.
+
+The vision model makes a few typical mistakes, listed in its system prompt: a missed piece
+shifts the rest of a row one square to the left and the row is filled up with a hallucinated
+piece, and some pieces are read as similar looking ones (3/5, 2/4, 2/6, 6/8, B/8, ...).
+
+For every hypothesis about shifted rows, the cheapest way to reach the required piece counts of
+correct_piece_configuration is found as an assignment problem. Only pieces in surplus are
+changed, into pieces that are missing. Each change costs less if the two pieces are known to be
+confused, or if the cell is uncertain. The valid setups are returned cheapest first.
+"""
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.checks.staging_consistency_checks import correct_piece_configuration
+from src.database.setup_encoding import COLUMNS, PIECE_CODES, PIECES, ROWS, SQUARES, decode_setup
+
+# (transcribed piece, actual piece) pairs the model is known to mix up, from the system prompt
+KNOWN_CONFUSIONS = {
+    ('4', '2'), ('6', '2'), ('5', '3'), ('2', '4'), ('3', '5'), ('4', '5'),
+    ('7', '5'), ('5', '6'), ('8', '6'), ('8', 'B'), ('3', 'B'), ('8', 'F'),
+}
+SUBSTITUTION_COST = 1.0
+CONFUSION_COST = 0.4
+# Cost of assuming a piece was missed or hallucinated in a row, which shifts the rest of it
+SHIFT_COST = 1.0
+MAX_SHIFTED_ROWS = 1
+# Setups needing more piece changes than this are not repaired
+MAX_CHANGES = 8
+# The cheapest repair is only applied without asking if the next one costs at least this much more
+AUTO_REPAIR_MARGIN = 0.3
+
+_UNAVAILABLE = 1e6
+WILDCARD = None
+
+
+class RepairSuggestion:
+    """A valid setup close to a transcription, with the cost and a description of the changes."""
+
+    def __init__(self, pieces: List[str], cost: float, changes: List[str], ambiguous: bool = False):
+        self.pieces = pieces
+        self.cost = cost
+        self.changes = changes
+        self.ambiguous = ambiguous
+
+    @property
+    def setup(self) -> Dict[str, List[str]]:
+        """The repaired pieces in the transcribed JSON format."""
+        return decode_setup(PIECE_CODES[piece] for piece in self.pieces)
+
+    def __repr__(self) -> str:
+        return f"RepairSuggestion(cost={self.cost:.2f}, changes={self.changes})"
+
+
+def substitution_costs(pieces: Sequence[Optional[str]], confidences: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    Cost of changing each transcribed cell into each piece type.
+
+    Args:
+        pieces: The 40 transcribed pieces in row-major order
+        confidences: Optional certainty of each cell between 0 and 1, e.g. from the local piece
+            classifier; changing a cell costs its confidence times the usual cost
+
+    Returns:
+        40 x 12 array in the piece code order of setup_encoding.PIECES.
+    """
+    costs = np.empty((len(pieces), len(PIECES)))
+    for cell, piece in enumerate(pieces):
+        for code, actual in enumerate(PIECES):
+            if piece == actual:
+                costs[cell, code] = 0.0
+            elif piece not in PIECE_CODES:
+                costs[cell, code] = CONFUSION_COST
+            else:
+                costs[cell, code] = CONFUSION_COST if (piece, actual) in KNOWN_CONFUSIONS else SUBSTITUTION_COST
+    if confidences is not None:
+        costs *= np.clip(np.asarray(confidences, dtype=float), 0.0, 1.0)[:, None]
+    return costs
+
+
+def _min_cost_assignment(cost: np.ndarray) -> np.ndarray:
+    """Solve a square assignment problem with the Hungarian method; returns the column of every row."""
+    n = cost.shape[0]
+    u = np.zeros(n + 1)
+    v = np.zeros(n + 1)
+    match = np.zeros(n + 1, dtype=int)  # match[column] = row, 1-based, 0 = free
+    way = np.zeros(n + 1, dtype=int)
+    for row in range(1, n + 1):
+        match[0] = row
+        column = 0
+        min_slack = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = match[column]
+            free = ~used[1:]
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = column
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_column = int(candidates.argmin()) + 1
+            delta = candidates[next_column - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            column = next_column
+            if match[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+    assignment = np.empty(n, dtype=int)
+    assignment[match[1:] - 1] = np.arange(n)
+    return assignment
+
+
+def _repair_counts(pieces: List[Optional[str]], change_costs: List[List[float]],
+                   keep_costs: List[float]) -> Optional[Tuple[float, List[str], bool]]:
+    """
+    Change the fewest cells, as cheaply as possible, so the piece counts are correct.
+
+    Only cells of pieces in surplus (and unknown cells) are changed, into the missing pieces.
+
+    Args:
+        pieces: 40 pieces, WILDCARD for squares that must be filled
+        change_costs: Cost of each square ending up as each piece type, if its piece changes
+        keep_costs: Cost of each square keeping its piece
+
+    Returns:
+        Tuple of (cost, repaired pieces, whether another choice of cells costs almost the same),
+        or None if more than MAX_CHANGES cells would change.
+    """
+    counts = Counter(pieces)
+    surplus = {piece: counts[piece] - correct_piece_configuration.get(piece, 0) for piece in counts}
+    missing = [piece for piece, required in correct_piece_configuration.items()
+               for _ in range(required - counts.get(piece, 0))]
+    if len(missing) > MAX_CHANGES:
+        return None
+    missing_codes = [PIECE_CODES[piece] for piece in dict.fromkeys(missing)]
+
+    def extra_cost(cell: int, code: int) -> float:
+        return change_costs[cell][code] - keep_costs[cell]
+
+    # At most len(missing) cells change, so a cell only matters if it is among the cheapest
+    # len(missing) cells of its piece for some missing piece
+    candidates = []
+    keep_slots = []
+    for piece, extra in surplus.items():
+        if extra <= 0:
+            continue
+        cells = [cell for cell, other in enumerate(pieces) if other == piece]
+        chosen = sorted({cell for code in missing_codes
+                         for cell in sorted(cells, key=lambda cell: extra_cost(cell, code))[:len(missing)]})
+        candidates.extend(chosen)
+        keep_slots.extend([piece] * (len(chosen) - extra))
+
+    # Rows: the cells that may change. Columns: the missing pieces, plus one slot per candidate
+    # cell that keeps its piece
+    matrix = np.full((len(candidates), len(missing) + len(keep_slots)), _UNAVAILABLE)
+    for row, cell in enumerate(candidates):
+        matrix[row, :len(missing)] = [extra_cost(cell, PIECE_CODES[piece]) for piece in missing]
+        matrix[row, len(missing):] = [0.0 if pieces[cell] == piece else _UNAVAILABLE for piece in keep_slots]
+    if matrix.shape[0] != matrix.shape[1] or (matrix.size and matrix.min(axis=1).max() >= _UNAVAILABLE):
+        return None
+
+    repaired = list(pieces)
+    total = sum(keep_costs)
+    if candidates:
+        for row, column in enumerate(_min_cost_assignment(matrix)):
+            if column < len(missing):
+                repaired[candidates[row]] = missing[column]
+                total += matrix[row, column]
+
+    # The choice is ambiguous if an unchanged cell of the same piece, or one changed into
+    # another piece, could take the change for about the same cost
+    ambiguous = False
+    for cell in candidates:
+        if repaired[cell] == pieces[cell]:
+            continue
+        target = PIECE_CODES[repaired[cell]]
+        for other, piece in enumerate(pieces):
+            if piece == pieces[cell] and other != cell and repaired[other] != repaired[cell] and \
+                    extra_cost(other, target) - extra_cost(cell, target) < AUTO_REPAIR_MARGIN:
+                ambiguous = True
+    return total, repaired, ambiguous
+
+
+def _row_hypotheses(row: List[str]) -> List[Tuple[float, List[Optional[int]], str]]:
+    """
+    Possible true layouts of one transcribed row.
+
+    Returns:
+        (cost, source column of every square or WILDCARD, description) tuples. The first entry is
+        the row as transcribed if it has 10 pieces.
+    """
+    length = len(row)
+    if length == COLUMNS:
+        hypotheses = [(0.0, list(range(COLUMNS)), "")]
+        for column in range(COLUMNS - 1):
+            # A missed piece: the transcription shifted left from here and ends with a made-up piece
+            sources = list(range(column)) + [WILDCARD] + list(range(column, COLUMNS - 1))
+            hypotheses.append((SHIFT_COST, sources, f"missed piece at column {column + 1}"))
+            # A made-up piece: the transcription shifted right from here and dropped the last piece
+            sources = list(range(column)) + list(range(column + 1, COLUMNS)) + [WILDCARD]
+            hypotheses.append((SHIFT_COST, sources, f"extra piece at column {column + 1}"))
+        return hypotheses
+    if length == COLUMNS - 1:
+        return [(SHIFT_COST, list(range(column)) + [WILDCARD] + list(range(column, length)),
+                 f"missed piece at column {column + 1}") for column in range(COLUMNS)]
+    if length == COLUMNS + 1:
+        return [(SHIFT_COST, list(range(column)) + list(range(column + 1, length)),
+                 f"extra piece at column {column + 1}") for column in range(length)]
+    return []
+
+
+def _layout_choices(rows: List[List[str]], row_options: List[List[Tuple[float, List[Optional[int]], str]]]):
+    """Yield one row hypothesis per row, with at most MAX_SHIFTED_ROWS shifted rows besides the incomplete ones."""
+    complete = [row_number for row_number, row in enumerate(rows) if len(row) == COLUMNS]
+    budget = max(0, MAX_SHIFTED_ROWS - (ROWS - len(complete)))
+    for shifted_count in range(min(budget, len(complete)) + 1):
+        for shifted in itertools.combinations(complete, shifted_count):
+            options = [
+                (row_options[row_number][1:] if row_number in shifted else row_options[row_number][:1])
+                if row_number in complete else row_options[row_number]
+                for row_number in range(ROWS)
+            ]
+            yield from itertools.product(*options)
+
+
+def repair_setup(setup: Dict[Any, Sequence[Any]], confidences: Optional[Sequence[float]] = None,
+                 square_costs: Optional[np.ndarray] = None, max_suggestions: int = 5) -> List[RepairSuggestion]:
+    """
+    Find the valid setups closest to a transcription.
+
+    Args:
+        setup: The transcribed JSON format ({'1': [...], ..., '4': [...]}); rows may have 9 or 11 pieces
+        confidences: Optional certainty of each of the 40 transcribed cells, see substitution_costs.
+            Ignored unless every row has 10 pieces.
+        square_costs: Optional 40 x 12 cost of each square holding each piece type, judged from
+            the screenshot, e.g. by the local piece classifier. Unlike the substitution costs,
+            these stay with the square when a row is shifted.
+        max_suggestions: Maximum number of suggestions
+
+    Returns:
+        Valid setups, cheapest first. A setup that is already valid is returned as the only
+        suggestion, with cost 0. The list is empty if the transcription is too far off.
+
+    Raises:
+        ValueError: If the setup does not have 4 rows
+    """
+    rows = [[str(piece) for piece in setup[key]] for key in sorted(setup, key=int)]
+    if len(rows) != ROWS:
+        raise ValueError(f"Setup must have {ROWS} rows, got {len(rows)}")
+    pieces = [piece for row in rows for piece in row]
+    if len(pieces) == SQUARES and Counter(pieces) == Counter(correct_piece_configuration):
+        return [RepairSuggestion(pieces, 0.0, [])]
+
+    if all(len(row) == COLUMNS for row in rows):
+        costs = substitution_costs(pieces, confidences)
+        row_costs = [costs[row_number * COLUMNS:(row_number + 1) * COLUMNS].tolist() for row_number in range(ROWS)]
+    else:
+        row_costs = [substitution_costs(row).tolist() for row in rows]
+    square_costs = square_costs.tolist() if square_costs is not None else [[0.0] * len(PIECES)] * SQUARES
+
+    row_options = [_row_hypotheses(row) for row in rows]
+    if any(not options for options in row_options):
+        return []
+
+    suggestions: Dict[Tuple[str, ...], RepairSuggestion] = {}
+    for choice in _layout_choices(rows, row_options):
+        pieces: List[Optional[str]] = []
+        change_costs = []
+        keep_costs = []
+        for row, row_cost, (_, sources, _) in zip(rows, row_costs, choice):
+            for source in sources:
+                square = square_costs[len(pieces)]
+                if source is WILDCARD:
+                    pieces.append(WILDCARD)
+                    change_costs.append(square)
+                    keep_costs.append(0.0)
+                else:
+                    pieces.append(row[source])
+                    change_costs.append([change + held for change, held in zip(row_cost[source], square)])
+                    keep_costs.append(square[PIECE_CODES[row[source]]] if row[source] in PIECE_CODES else 0.0)
+
+        result = _repair_counts(pieces, change_costs, keep_costs)
+        if result is None:
+            continue
+        change_cost, repaired, ambiguous = result
+        key = tuple(repaired)
+        total = sum(option[0] for option in choice) + change_cost
+        if key in suggestions and suggestions[key].cost <= total:
+            continue
+
+        changes = [f"Row {row_number + 1}: {option[2]}" for row_number, option in enumerate(choice) if option[2]]
+        changes.extend(
+            f"Row {cell // COLUMNS + 1}, column {cell % COLUMNS + 1}: "
+            f"{pieces[cell] if pieces[cell] is not WILDCARD else '?'} -> {repaired[cell]}"
+            for cell in range(SQUARES) if pieces[cell] != repaired[cell]
+        )
+        suggestions[key] = RepairSuggestion(repaired, round(total, 6), changes, ambiguous)
+
+    ranked = sorted(suggestions.values(), key=lambda suggestion: (suggestion.cost, len(suggestion.changes)))
+    return ranked[:max_suggestions]
+
+
+def auto_repair(setup: Dict[Any, Sequence[Any]], confidences: Optional[Sequence[float]] = None,
+                square_costs: Optional[np.ndarray] = None) -> Optional[RepairSuggestion]:
+    """
+    Return the cheapest repair if it is clearly better than any other, otherwise None.
+
+    Without confidences or square costs, changing one of several equal pieces is always
+    ambiguous, so only repairs whose position is certain are returned.
+    """
+    suggestions = repair_setup(setup, confidences, square_costs, max_suggestions=2)
+    if not suggestions or suggestions[0].ambiguous:
+        return None
+    if len(suggestions) > 1 and suggestions[1].cost - suggestions[0].cost < AUTO_REPAIR_MARGIN:
+        return None
+    return suggestions[0]
@@ -1,57 +1,87 @@
-from src.database.sqlite_database import get_all_setup_positions
-
-
-setup_positions = get_all_setup_positions()
-newly_added_setup = {(1, 1): '4', (1, 2): 'B', (1, 3): '4', (1, 4): '10', (1, 5): '4', (1, 6): '6', (1, 7): '2', (1, 8): '8', (1, 9): '5', (1, 10): '3', (2, 1): '6', (2, 2): '2', (2, 3): '7', (2, 4): '2', (2, 5): '7', (2, 6): '2', (2, 7): '2', (2, 8): '1', (2, 9): '9', (2, 10): '6', (3, 1): '8', (3, 2): '2', (3, 3): '5', (3, 4): 'B', (3, 5): '3', (3, 6): 'B', (3, 7): '4', (3, 8): '7', (3, 9): '2', (3, 10): '2', (4, 1): '3', (4, 2): '3', (4, 3): 'B', (4, 4): 'F', (4, 5): 'B', (4, 6): 'B', (4, 7): '5', (4, 8): '5', (4, 9): '3', (4, 10): '6'}
-
-
-def loop_setups(positions, new_setup):
-    if not positions:
-        return
-
-    previous_id = positions[0][1]
-    current_setup = []
-
-    for position in positions:
-        current_id = position[1]
-
-        if current_id != previous_id:
-            serialized_setup = serialize_setup(current_setup)
-            check_for_90_percent_similarity(serialized_setup, new_setup)
-
-            # print(f"Serialized setup with ID: {previous_id}")
-            # print(serialized_setup)
-            current_setup = []
-
-        current_setup.append(position)
-        previous_id = current_id
-
-    # Serialize the last group
-    if current_setup:
-        serialized_setup = serialize_setup(current_setup)
-        check_for_90_percent_similarity(serialized_setup, new_setup)
-
-        # print(f"Serialized setup with ID: {previous_id}")
-        # print(serialized_setup)
-
-
-def check_for_90_percent_similarity(old_setup, new_setup):
-    # if old_setup == new_setup:
-    #     print(f"The newly added setup is the same as the following old setup: {old_setup}")
-
-    similarity_counter = 0
-
-    for key in new_setup:
-        # old_setup[key] and new_setup[key] represent pieces at a specific position
-        if key in old_setup and old_setup[key] == new_setup[key]:
-            similarity_counter += 1
-
-    print(similarity_counter)
-
-
-def serialize_setup(setup_data):
-    """Convert setup data to a dictionary of (row, col) -> piece."""
-    return {(row, col): piece for _, _, row, col, piece in sorted(setup_data, key=lambda x: (x[2], x[3]))}
-
-
-loop_setups(setup_positions, newly_added_setup)
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.database.setup_encoding import SQUARES, SetupLike, encode_setup
+from src.database.setup_matrix import SetupMatrix, get_setup_matrix
+
+# A setup counts as "similar" when at least 90% of the squares hold the same piece.
+DEFAULT_SIMILARITY_THRESHOLD = 36
+
+# Limits the temporary K x N x 40 comparison array when scoring a batch of setups.
+_MAX_COMPARISONS_PER_CHUNK = 16_000_000
+
+
+def similarity_scores(setups: Sequence[SetupLike], setup_matrix: Optional[SetupMatrix] = None) -> np.ndarray:
+    """
+    Count the matching squares between each given setup and every stored setup.
+
+    Args:
+        setups: Setups to compare, in any format accepted by encode_setup
+        setup_matrix: Store to compare against. Defaults to the process-wide SetupMatrix.
+
+    Returns:
+        K x N array where entry (i, j) is the number of squares (0-40) on which setups[i]
+        and the j-th stored setup hold the same piece.
+    """
+    setup_matrix = setup_matrix if setup_matrix is not None else get_setup_matrix()
+    stored = setup_matrix.matrix
+    queries = np.stack([encode_setup(setup) for setup in setups]) if len(setups) else np.zeros((0, SQUARES), np.uint8)
+
+    scores = np.empty((len(queries), len(stored)), dtype=np.uint8)
+    chunk_size = max(1, _MAX_COMPARISONS_PER_CHUNK // max(1, len(stored) * SQUARES))
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start + chunk_size]
+        np.sum(stored[np.newaxis, :, :] == chunk[:, np.newaxis, :], axis=2, dtype=np.uint8, out=scores[start:start + chunk_size])
+    return scores
+
+
+def find_most_similar_setups(setup: SetupLike, top_k: int = 10,
+                             setup_matrix: Optional[SetupMatrix] = None) -> List[Tuple[int, int]]:
+    """
+    Find the stored setups that share the most squares with the given setup.
+
+    Returns:
+        Up to top_k (setup_id, matching_squares) tuples, most similar first.
+    """
+    return find_most_similar_setups_batch([setup], top_k, setup_matrix)[0]
+
+
+def find_most_similar_setups_batch(setups: Sequence[SetupLike], top_k: int = 10,
+                                   setup_matrix: Optional[SetupMatrix] = None) -> List[List[Tuple[int, int]]]:
+    """Run find_most_similar_setups for a batch of setups with a single comparison pass."""
+    setup_matrix = setup_matrix if setup_matrix is not None else get_setup_matrix()
+    scores = similarity_scores(setups, setup_matrix)
+    setup_ids = setup_matrix.setup_ids
+    top_k = min(top_k, scores.shape[1])
+
+    results = []
+    for row in scores:
+        if top_k <= 0:
+            results.append([])
+            continue
+        # argpartition leaves ties at the cutoff in no particular order, so keep every setup
+        # scoring at least the k-th best score and cut after sorting
+        cutoff = row[np.argpartition(row, -top_k)[-top_k]]
+        candidates = np.flatnonzero(row >= cutoff)
+        # Highest score first, ties broken by the most recent setup
+        ordered = candidates[np.lexsort((-setup_ids[candidates], -row[candidates].astype(np.int16)))][:top_k]
+        results.append([(int(setup_ids[i]), int(row[i])) for i in ordered])
+    return results
+
+
+def find_similar_setups_above_threshold(setup: SetupLike, threshold: int = DEFAULT_SIMILARITY_THRESHOLD,
+                                        setup_matrix: Optional[SetupMatrix] = None) -> List[Tuple[int, int]]:
+    """
+    Find all stored setups that share at least `threshold` squares with the given setup.
+
+    Returns:
+        (setup_id, matching_squares) tuples, most similar first.
+    """
+    setup_matrix = setup_matrix if setup_matrix is not None else get_setup_matrix()
+    row = similarity_scores([setup], setup_matrix)[0]
+    setup_ids = setup_matrix.setup_ids
+
+    matches = np.flatnonzero(row >= threshold)
+    ordered = matches[np.lexsort((-setup_ids[matches], -row[matches].astype(np.int16)))]
+    return [(int(setup_ids[i]), int(row[i])) for i in ordered]
@@ -16,6 +16,14 @@ def check_piece_consistency(pieces):
             raise Exception(f"Invalid piece type: {piece}")
 
 
+# Fragments of the messages raised for a wrongly transcribed setup, which the user can fix by editing the JSON
+SETUP_ERROR_KEYWORDS = ('piece', 'count', 'Incorrect count', 'Invalid piece type', 'Amount of pieces')
+
+
+def is_setup_configuration_error(error):
+    return any(keyword in str(error) for keyword in SETUP_ERROR_KEYWORDS)
+
+
 correct_piece_configuration = {
     '1': 1,
     '2': 8,
@@ -0,0 +1,263 @@
+"""
+Bulk import of historical games from CSV or JSONL files.
+
+Every row describes one game: date_played, opponent_name, result, moves, noob_killer, an
+optional opponent_id and the setup. The setup can be the transcribed JSON object
+({"1": [...], ..., "4": [...]}), a flat list of 40 pieces or a 40-character fingerprint.
+In CSV files the setup column holds either the fingerprint or the JSON text.
+
+Usage:
+    python -m src.database.bulk_import games.jsonl [--batch-size 5000] [--checkpoint name]
+
+Rows are validated with check_piece_consistency, setups are deduplicated against the database
+and within the file, and every batch is written in one transaction. The number of consumed rows
+is stored in ImportCheckpoints by the same transaction, so an interrupted import resumes exactly
+after the last committed batch instead of inserting the same games twice.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from src.checks.staging_consistency_checks import check_piece_consistency
+from src.database.setup_encoding import SQUARES, fingerprint_to_pieces, setup_fingerprint, setup_to_pieces
+from src.database.setup_to_sql import (
+    BUMP_CACHE_GENERATION_SQL,
+    INSERT_GAME_RECORD_SQL,
+    INSERT_SETUP_SQL,
+    INSERT_SETUP_SQUARE_SQL,
+    UPSERT_PIECE_HEATMAP_SQL,
+    game_record_row,
+    piece_heatmap_rows,
+    setup_square_rows,
+)
+from src.database.sqlite_database import StrategoDatabase, get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+VALID_RESULTS = ('win', 'draw', 'loss')
+
+
+def read_rows(path: str) -> Iterator[Union[Dict[str, Any], str]]:
+    """
+    Stream the rows of a CSV or JSONL file.
+
+    CSV rows are yielded as dictionaries and JSONL rows as their raw line, so a malformed line
+    is rejected by parse_row like any other invalid row. Blank JSONL lines are skipped.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield line
+
+
+def parse_setup_value(value: Any) -> List[str]:
+    """Convert the setup field of an import row to 40 pieces in row-major order."""
+    if isinstance(value, str):
+        value = value.strip()
+        if value[:1] in ('{', '['):
+            value = json.loads(value)
+        elif len(value) == SQUARES:
+            try:
+                return fingerprint_to_pieces(value)
+            except KeyError as e:
+                raise ValueError(f"Invalid piece type in fingerprint: {e.args[0]}") from None
+        else:
+            raise ValueError(f"Setup string must be a {SQUARES}-character fingerprint or JSON")
+
+    return setup_to_pieces(value)
+
+
+def parse_date(value: Any) -> str:
+    """Normalize the date of an import row, or a timestamp like 2024-06-01 18:30:05.123, to YYYY-MM-DD."""
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return datetime.fromisoformat(str(value).strip().replace('/', '-')).date().isoformat()
+
+
+def parse_row(row: Union[Dict[str, Any], str], opponent_ids: Dict[str, int]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Validate an import row, given as a dictionary or a JSON line.
+
+    Returns:
+        Tuple of (setup_details without the setup, 40 pieces)
+
+    Raises:
+        ValueError: If a field is missing or invalid
+        Exception: From check_piece_consistency if the piece counts are wrong
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+
+    for field in ('setup', 'date_played', 'opponent_name', 'result', 'moves', 'noob_killer'):
+        if row.get(field) in (None, ''):
+            raise ValueError(f"Missing required field: {field}")
+
+    result = str(row['result']).strip().lower()
+    if result not in VALID_RESULTS:
+        raise ValueError(f"Invalid result: {row['result']}")
+
+    opponent_name = str(row['opponent_name']).strip()
+    opponent_id = row.get('opponent_id')
+    opponent_id = int(opponent_id) if opponent_id not in (None, '') else opponent_ids.get(opponent_name)
+
+    pieces = parse_setup_value(row['setup'])
+    check_piece_consistency(pieces)
+
+    setup_details = {
+        'date_played': parse_date(row['date_played']),
+        'opponent_id': opponent_id,
+        'opponent_name': opponent_name,
+        'result': result,
+        'moves': int(row['moves']),
+        'noob_killer': int(row['noob_killer']),
+    }
+    return setup_details, pieces
+
+
+UPSERT_CHECKPOINT_SQL = (
+    "INSERT INTO ImportCheckpoints (source, rows_done, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+    "ON CONFLICT (source) DO UPDATE SET rows_done = excluded.rows_done, updated_at = excluded.updated_at"
+)
+
+
+def read_checkpoint(database: StrategoDatabase, checkpoint: str) -> int:
+    """Return the number of rows an earlier run of an import already committed."""
+    with get_db_connection(database.db_path) as conn:
+        row = conn.execute("SELECT rows_done FROM ImportCheckpoints WHERE source = ?", (checkpoint,)).fetchone()
+    return row[0] if row else 0
+
+
+class BulkImporter:
+    """Imports games in large batches, deduplicating setups on their fingerprint."""
+
+    def __init__(self, database: Optional[StrategoDatabase] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = database or StrategoDatabase()
+        self.batch_size = batch_size
+        self.setup_ids_by_fingerprint: Dict[str, int] = {}
+        self.max_setup_id = 0
+        self.stats = {'imported': 0, 'new_setups': 0, 'rejected': 0}
+
+    def import_file(self, path: str, checkpoint: Optional[str] = None) -> Dict[str, int]:
+        """
+        Import all rows of a CSV or JSONL file, resuming from the checkpoint if there is one.
+
+        Args:
+            path: CSV or JSONL file
+            checkpoint: Name of the checkpoint in ImportCheckpoints. Defaults to the absolute path
+                of the file.
+
+        Returns:
+            Counts of imported games, newly stored setups and rejected rows.
+        """
+        checkpoint = checkpoint or os.path.abspath(path)
+        rows_done = read_checkpoint(self.db, checkpoint)
+        if rows_done:
+            logger.info(f"Resuming {path} after {rows_done} rows")
+
+        with get_db_connection(self.db.db_path) as conn:
+            opponent_ids = {name: opponent_id for opponent_id, name in
+                            conn.execute("SELECT opponent_id, opponent_name FROM Opponents")}
+
+        start_time = time.perf_counter()
+        rows_seen = rows_done
+        batch = []
+        for line_number, row in enumerate(read_rows(path), start=1):
+            if line_number <= rows_done:
+                continue
+            rows_seen = line_number
+
+            try:
+                batch.append(parse_row(row, opponent_ids))
+            except Exception as e:
+                self.stats['rejected'] += 1
+                logger.warning(f"Skipping row {line_number}: {e}")
+
+            if rows_seen - rows_done >= self.batch_size:
+                self._write_batch(batch, checkpoint, rows_seen)
+                rows_done = rows_seen
+                batch = []
+                self._log_progress(rows_done, start_time)
+
+        if rows_seen > rows_done:
+            self._write_batch(batch, checkpoint, rows_seen)
+            rows_done = rows_seen
+            self._log_progress(rows_done, start_time)
+
+        return dict(self.stats)
+
+    def _write_batch(self, batch: List[Tuple[Dict[str, Any], List[str]]], checkpoint: str, rows_done: int) -> None:
+        """Write one batch of validated games and the checkpoint after it in a single transaction."""
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            self._refresh_known_setups(cursor)
+
+            setup_rows = []
+            fingerprint_rows = []
+            record_rows = []
+            heatmap_counts = Counter()
+            for setup_details, pieces in batch:
+                fingerprint = setup_fingerprint(pieces)
+                setup_id = self.setup_ids_by_fingerprint.get(fingerprint)
+                is_new_setup = setup_id is None
+                if is_new_setup:
+                    self.max_setup_id += 1
+                    setup_id = self.max_setup_id
+                    self.setup_ids_by_fingerprint[fingerprint] = setup_id
+                    setup_rows.extend(setup_square_rows(setup_id, pieces))
+                    fingerprint_rows.append((setup_id, fingerprint))
+                record_rows.append(game_record_row(setup_details, setup_id))
+                heatmap_counts.update(row[:4] for row in piece_heatmap_rows(
+                    pieces, setup_details['opponent_name'], setup_details['result'], is_new_setup))
+
+            cursor.executemany(INSERT_SETUP_SQUARE_SQL, setup_rows)
+            cursor.executemany(INSERT_SETUP_SQL, fingerprint_rows)
+            cursor.executemany(INSERT_GAME_RECORD_SQL, record_rows)
+            cursor.executemany(UPSERT_PIECE_HEATMAP_SQL, (key + (count,) for key, count in heatmap_counts.items()))
+            cursor.execute(BUMP_CACHE_GENERATION_SQL)
+            cursor.execute(UPSERT_CHECKPOINT_SQL, (checkpoint, rows_done))
+            conn.commit()
+
+        self.stats['imported'] += len(batch)
+        self.stats['new_setups'] += len(fingerprint_rows)
+
+    def _refresh_known_setups(self, cursor) -> None:
+        """Pick up setups stored since the last batch, including those written by other processes."""
+        cursor.execute("SELECT setup_id, fingerprint FROM Setups WHERE setup_id > ?", (self.max_setup_id,))
+        for setup_id, fingerprint in cursor.fetchall():
+            self.setup_ids_by_fingerprint[fingerprint] = setup_id
+            self.max_setup_id = max(self.max_setup_id, setup_id)
+
+    def _log_progress(self, rows_done: int, start_time: float) -> None:
+        elapsed = time.perf_counter() - start_time
+        rate = self.stats['imported'] / elapsed if elapsed > 0 else 0.0
+        logger.info(f"{rows_done} rows done: {self.stats['imported']} games imported, "
+                    f"{self.stats['new_setups']} new setups, {self.stats['rejected']} rejected ({rate:.0f} games/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import historical games from CSV or JSONL.")
+    parser.add_argument("path", help="CSV or JSONL file with one game per row")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction")
+    parser.add_argument("--checkpoint", help="Checkpoint name (default: absolute path of the file)")
+    parser.add_argument("--database", help="Database file (default: data/sqlite_database.db)")
+    args = parser.parse_args()
+
+    importer = BulkImporter(StrategoDatabase(args.database), batch_size=args.batch_size)
+    stats = importer.import_file(args.path, args.checkpoint)
+    print(f"Imported {stats['imported']} games ({stats['new_setups']} new setups), rejected {stats['rejected']} rows")
+
+
+if __name__ == "__main__":
+    main()
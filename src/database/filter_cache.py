@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_FILTERS = 128
+DEFAULT_MAX_PAGES_PER_FILTER = 32
+
+FilterKey = Tuple[Tuple[str, str], ...]
+
+
+def normalize_filter_params(filter_params: Dict[str, Any]) -> FilterKey:
+    """Turn the filter dictionary from build_filter_params into a hashable, order-independent key."""
+    return tuple(sorted((key, str(value)) for key, value in filter_params.items() if value not in (None, '')))
+
+
+class FilterResultCache:
+    """
+    LRU cache for filtered setup listings.
+
+    For every normalized filter dictionary it keeps the number of matching records and the
+    pages already rendered (setup IDs in order plus their grids). Entries are tagged with the
+    cache generation that SetupProcessor bumps on every insert; an entry from an older
+    generation is discarded on access, so an upload is visible on the next request.
+    """
+
+    def __init__(self, max_filters: int = DEFAULT_MAX_FILTERS, max_pages_per_filter: int = DEFAULT_MAX_PAGES_PER_FILTER):
+        self.max_filters = max_filters
+        self.max_pages_per_filter = max_pages_per_filter
+        self._entries: "OrderedDict[FilterKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_count(self, filter_params: Dict[str, Any], generation: int, load: Callable[[], int]) -> int:
+        """Return the cached number of matching records, calling load() on a miss."""
+        key = normalize_filter_params(filter_params)
+        with self._lock:
+            entry = self._get_entry(key, generation)
+            if entry is not None and entry['count'] is not None:
+                return entry['count']
+
+        count = load()
+        with self._lock:
+            self._store(key, generation)['count'] = count
+        return count
+
+    def get_page(self, filter_params: Dict[str, Any], generation: int, start: int, stop: int,
+                 load: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Return the cached setups in positions start:stop, calling load() on a miss."""
+        key = normalize_filter_params(filter_params)
+        with self._lock:
+            entry = self._get_entry(key, generation)
+            if entry is not None and (start, stop) in entry['pages']:
+                entry['pages'].move_to_end((start, stop))
+                return entry['pages'][(start, stop)]
+
+        page = load()
+        with self._lock:
+            pages = self._store(key, generation)['pages']
+            pages[(start, stop)] = page
+            while len(pages) > self.max_pages_per_filter:
+                pages.popitem(last=False)
+        return page
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _get_entry(self, key: FilterKey, generation: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['generation'] != generation:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: FilterKey, generation: int) -> Dict[str, Any]:
+        """Return the entry for key in this generation, creating it if needed. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None or entry['generation'] < generation:
+            entry = {'generation': generation, 'count': None, 'pages': OrderedDict()}
+            self._entries[key] = entry
+        elif entry['generation'] > generation:
+            # Loaded before a newer insert that another request has already seen; keep the newer entry
+            return {'generation': generation, 'count': None, 'pages': OrderedDict()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_filters:
+            self._entries.popitem(last=False)
+        return entry
+
+
+filter_result_cache = FilterResultCache()
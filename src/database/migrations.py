@@ -0,0 +1,366 @@
+"""
+Schema migrations for the Stratego database.
+
+Each migration runs once, in its own transaction, and the last applied version is stored in
+SQLite's `PRAGMA user_version`. Migrations are only applied by an explicit migrate step, either
+for a database file:
+    python -m src.database.migrations [path/to/database.db]
+or through Django's `python manage.py migrate`, whose analysis migrations run them.
+get_db_connection refuses to open a database that is behind.
+"""
+import logging
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+from src.database.setup_encoding import FINGERPRINT_CHARS, PIECES, SQUARES
+
+logger = logging.getLogger(__name__)
+
+
+_BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS GameSetups (
+        position_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        setup_id INTEGER NOT NULL,
+        row INT NOT NULL,
+        col INT NOT NULL,
+        piece VARCHAR(10) NOT NULL,
+        CONSTRAINT unique_position UNIQUE (setup_id, row, col)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_setup_row_col_piece
+        ON GameSetups (setup_id, row, col, piece)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Opponents (
+        opponent_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        opponent_name TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS GameRecords (
+        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        setup_id INTEGER NOT NULL REFERENCES GameSetups (setup_id),
+        date_played DATE,
+        opponent_name TEXT,
+        result TEXT,
+        moves INT,
+        noob_killer INTEGER DEFAULT 0,
+        opponent_id INTEGER CONSTRAINT opponent_id REFERENCES Opponents
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TempSetup (
+        position_id INTEGER CONSTRAINT pk_position_id PRIMARY KEY,
+        setup_id INTEGER,
+        row INT,
+        col INT,
+        piece VARCHAR(10)
+    )
+    """,
+]
+
+
+def _create_base_schema(conn: sqlite3.Connection) -> None:
+    """Create the original tables, for databases that do not have them yet."""
+    for statement in _BASE_SCHEMA:
+        conn.execute(statement)
+
+
+def _create_setups_table(conn: sqlite3.Connection) -> None:
+    """Add one row per setup with its canonical fingerprint, filled in for existing setups."""
+    conn.execute("""
+        CREATE TABLE Setups (
+            setup_id INTEGER PRIMARY KEY,
+            fingerprint TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX idx_setups_fingerprint ON Setups (fingerprint)")
+
+    rows = conn.execute("SELECT setup_id, piece FROM GameSetups ORDER BY setup_id, row, col").fetchall()
+    fingerprints = {}
+    for setup_id, piece in rows:
+        fingerprints.setdefault(setup_id, []).append(FINGERPRINT_CHARS[piece])
+
+    incomplete = [setup_id for setup_id, chars in fingerprints.items() if len(chars) != SQUARES]
+    if incomplete:
+        raise ValueError(f"Setups without exactly {SQUARES} squares: {incomplete}")
+
+    conn.executemany(
+        "INSERT INTO Setups (setup_id, fingerprint) VALUES (?, ?)",
+        ((setup_id, "".join(chars)) for setup_id, chars in fingerprints.items())
+    )
+
+
+def _create_piece_heatmap_table(conn: sqlite3.Connection) -> None:
+    """
+    Add the materialized per-square piece counts, computed from the existing data.
+
+    Scope 'all' counts every distinct stored setup once, like get_pieces_at_position.
+    Scopes 'opponent' and 'result' count every game record, like get_pieces_at_position_for_opponent.
+    Squares are 0-based row-major indexes.
+    """
+    conn.execute("""
+        CREATE TABLE PieceHeatmap (
+            scope TEXT NOT NULL,
+            scope_value TEXT NOT NULL,
+            square INTEGER NOT NULL,
+            piece TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (scope, scope_value, square, piece)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO PieceHeatmap (scope, scope_value, square, piece, count)
+        SELECT 'all', '', (row - 1) * 10 + (col - 1), piece, COUNT(*)
+        FROM GameSetups
+        GROUP BY row, col, piece
+    """)
+    for scope, column in (('opponent', 'opponent_name'), ('result', 'result')):
+        conn.execute(f"""
+            INSERT INTO PieceHeatmap (scope, scope_value, square, piece, count)
+            SELECT '{scope}', r.{column}, (s.row - 1) * 10 + (s.col - 1), s.piece, COUNT(*)
+            FROM GameSetups s
+                     INNER JOIN GameRecords r ON s.setup_id = r.setup_id
+            WHERE r.{column} IS NOT NULL
+            GROUP BY r.{column}, s.row, s.col, s.piece
+        """)
+
+
+def _create_cache_generation_table(conn: sqlite3.Connection) -> None:
+    """Add a single-row counter that every ingest bumps, so caches can tell when the data changed."""
+    conn.execute("""
+        CREATE TABLE CacheGeneration (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO CacheGeneration (id, generation) VALUES (1, 0)")
+
+
+def _create_upload_jobs_table(conn: sqlite3.Connection) -> None:
+    """Add the queue of uploaded screenshots waiting for transcription (see src.jobs.upload_jobs)."""
+    conn.execute("""
+        CREATE TABLE UploadJobs (
+            job_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            setup_details TEXT NOT NULL,
+            transcribed_setup TEXT,
+            setup_id INTEGER,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX idx_upload_jobs_status ON UploadJobs (status, job_id)")
+
+
+def _create_filter_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Add composite indexes for the game record filters and for looking up the pieces on a square.
+
+    GameRecords is rebuilt first, because its setup_id referenced GameSetups (setup_id), which is
+    not unique there. SQLite reports a foreign key mismatch for that reference as soon as foreign
+    keys are enforced, as they are on Django's connections; it now references Setups.
+
+    The columns of idx_game_records_filters follow the filters of build_conditions_and_params,
+    with setup_id last so the filtered setup ids are read from the index alone.
+    """
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'GameRecords'").fetchone()
+    conn.execute("""
+        CREATE TABLE GameRecords_new (
+            record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setup_id INTEGER NOT NULL REFERENCES Setups (setup_id),
+            date_played DATE,
+            opponent_name TEXT,
+            result TEXT,
+            moves INT,
+            noob_killer INTEGER DEFAULT 0,
+            opponent_id INTEGER CONSTRAINT opponent_id REFERENCES Opponents
+        )
+    """)
+    conn.execute("""
+        INSERT INTO GameRecords_new (record_id, setup_id, date_played, opponent_name, result, moves, noob_killer,
+                                     opponent_id)
+        SELECT record_id, setup_id, date_played, opponent_name, result, moves, noob_killer, opponent_id
+        FROM GameRecords
+    """)
+    conn.execute("DROP TABLE GameRecords")
+    conn.execute("ALTER TABLE GameRecords_new RENAME TO GameRecords")
+    if sequence:
+        # Keep ids of deleted records from being reused
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'GameRecords'", sequence)
+
+    conn.execute("""
+        CREATE INDEX idx_game_records_filters
+            ON GameRecords (opponent_name, result, moves, date_played, setup_id)
+    """)
+    conn.execute("CREATE INDEX idx_square_piece_setup ON GameSetups (row, col, piece, setup_id)")
+
+
+# Indexes on GameRecords for the filters of build_conditions_and_params. Every combination of
+# filters has an index led by one of its columns, so no filter falls back to a full table scan.
+# Each index holds all filter columns and setup_id (the rowid record_id is implicit), so it covers
+# the filter count and page queries without reading the table. Equality columns come before the
+# moves and date ranges, because an index can only seek past its first range.
+GAME_RECORD_FILTER_INDEXES = {
+    'idx_game_records_filters': ('opponent_name', 'result', 'noob_killer', 'moves', 'date_played', 'setup_id'),
+    'idx_game_records_result': ('result', 'noob_killer', 'moves', 'date_played', 'opponent_name', 'setup_id'),
+    'idx_game_records_noob_killer': ('noob_killer', 'moves', 'date_played', 'opponent_name', 'result', 'setup_id'),
+    'idx_game_records_moves': ('moves', 'date_played', 'opponent_name', 'result', 'noob_killer', 'setup_id'),
+    'idx_game_records_date': ('date_played', 'moves', 'opponent_name', 'result', 'noob_killer', 'setup_id'),
+    # The unfiltered page is read in setup_id order; also serves joins from Setups
+    'idx_game_records_setup': ('setup_id',),
+}
+
+
+def _create_covering_filter_indexes(conn: sqlite3.Connection) -> None:
+    """Replace idx_game_records_filters, which lacked noob_killer, with GAME_RECORD_FILTER_INDEXES."""
+    conn.execute("DROP INDEX IF EXISTS idx_game_records_filters")
+    for name, columns in GAME_RECORD_FILTER_INDEXES.items():
+        conn.execute(f"CREATE INDEX {name} ON GameRecords ({', '.join(columns)})")
+
+
+def _square_mask_sql(piece: str) -> str:
+    """SQL expression for the bit mask of the squares of a piece, computed from the Setups fingerprint."""
+    char = FINGERPRINT_CHARS[piece]
+    return " | ".join(f"((substr(fingerprint, {square + 1}, 1) = '{char}') << {square})" for square in range(SQUARES))
+
+
+def _add_setup_shape_columns(conn: sqlite3.Connection) -> None:
+    """
+    Add generated flag_square and bomb_mask columns to Setups, with an index over both.
+
+    Setups holds every setup in one row, so the flag position and the squares of the bombs can
+    be filtered without touching the 40 GameSetups rows of a setup. flag_square is the 0-based
+    square of the flag and bit i of bomb_mask is set when square i holds a bomb (see
+    setup_encoding.square_mask). Both are computed by SQLite from the fingerprint, so every writer
+    of Setups keeps them in sync.
+    """
+    flag = FINGERPRINT_CHARS['F']
+    conn.execute(f"ALTER TABLE Setups ADD COLUMN flag_square INTEGER GENERATED ALWAYS AS (instr(fingerprint, '{flag}') - 1)")
+    conn.execute(f"ALTER TABLE Setups ADD COLUMN bomb_mask INTEGER GENERATED ALWAYS AS ({_square_mask_sql('B')})")
+    conn.execute("CREATE INDEX idx_setups_flag_bombs ON Setups (flag_square, bomb_mask)")
+
+
+# Generated bitboard column of every piece type on Setups: bit i is set when square i holds the
+# piece. The bomb bitboard keeps the name bomb_mask from migration 8.
+PIECE_MASK_COLUMNS = {
+    **{piece: f'piece_{piece}_mask' for piece in PIECES if piece.isdigit()},
+    'B': 'bomb_mask',
+    'F': 'flag_mask',
+}
+
+
+def _store_setup_bitboards(conn: sqlite3.Connection) -> None:
+    """
+    Rebuild Setups with a stored generated bitboard for every piece type (see PIECE_MASK_COLUMNS).
+
+    The virtual columns of migration 8 are computed from the fingerprint on every read, which
+    makes a scan over the bitboards of many setups slow; stored columns are computed once when a
+    setup is inserted. SQLite cannot add stored columns to an existing table, so Setups is rebuilt
+    with the same setup_ids and fingerprints.
+    """
+    flag = FINGERPRINT_CHARS['F']
+    generated = [f"flag_square INTEGER GENERATED ALWAYS AS (instr(fingerprint, '{flag}') - 1) STORED"] + [
+        f"{column} INTEGER GENERATED ALWAYS AS ({_square_mask_sql(piece)}) STORED"
+        for piece, column in PIECE_MASK_COLUMNS.items()
+    ]
+    conn.execute(f"""
+        CREATE TABLE Setups_new (
+            setup_id INTEGER PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            {", ".join(generated)}
+        )
+    """)
+    conn.execute("INSERT INTO Setups_new (setup_id, fingerprint) SELECT setup_id, fingerprint FROM Setups")
+    conn.execute("DROP TABLE Setups")
+    conn.execute("ALTER TABLE Setups_new RENAME TO Setups")
+    conn.execute("CREATE UNIQUE INDEX idx_setups_fingerprint ON Setups (fingerprint)")
+    conn.execute("CREATE INDEX idx_setups_flag_bombs ON Setups (flag_square, bomb_mask)")
+
+
+def _create_import_checkpoints_table(conn: sqlite3.Connection) -> None:
+    """Add the resume points of bulk imports, written in the same transaction as each batch."""
+    conn.execute("""
+        CREATE TABLE ImportCheckpoints (
+            source TEXT PRIMARY KEY,
+            rows_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base schema", _create_base_schema),
+    (2, "setups table with fingerprints", _create_setups_table),
+    (3, "piece heatmap table", _create_piece_heatmap_table),
+    (4, "cache generation counter", _create_cache_generation_table),
+    (5, "upload job queue", _create_upload_jobs_table),
+    (6, "game record references and filter indexes", _create_filter_indexes),
+    (7, "covering game record filter indexes", _create_covering_filter_indexes),
+    (8, "generated flag and bomb columns on Setups", _add_setup_shape_columns),
+    (9, "stored piece bitboards on Setups", _store_setup_bitboards),
+    (10, "bulk import checkpoints", _create_import_checkpoints_table),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection, target_version: Optional[int] = None) -> List[int]:
+    """
+    Apply all pending migrations up to target_version.
+
+    Args:
+        conn: Open connection to the database
+        target_version: Last migration to apply. Defaults to the latest one.
+
+    Returns:
+        The versions of the migrations that were applied.
+    """
+    target_version = LATEST_VERSION if target_version is None else target_version
+    applied = []
+
+    # Manage the transactions explicitly, so DDL and data changes of a migration commit together
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, description, migrate in MIGRATIONS:
+            if version > target_version or version <= get_schema_version(conn):
+                continue
+
+            logger.info(f"Applying migration {version}: {description}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+
+    return applied
+
+
+if __name__ == "__main__":
+    import sys
+
+    from src.database.sqlite_database import DATABASE_PATH
+
+    logging.basicConfig(level=logging.INFO)
+    connection = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH)
+    try:
+        applied_versions = apply_migrations(connection)
+    finally:
+        connection.close()
+    print(f"Applied migrations: {applied_versions or 'none'}")
@@ -0,0 +1,123 @@
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+# Piece types in code order: '1'..'10' are encoded as 0..9, 'B' as 10 and 'F' as 11.
+PIECES = ('1', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'B', 'F')
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+
+ROWS = 4
+COLUMNS = 10
+SQUARES = ROWS * COLUMNS
+
+SetupLike = Union[Dict[Any, Any], Iterable[Tuple[int, int, str]], Iterable[str]]
+
+
+def square_index(row: int, col: int) -> int:
+    """Convert a 1-based (row, col) position to a 0-based square index in row-major order."""
+    return (row - 1) * COLUMNS + (col - 1)
+
+
+def setup_to_pieces(setup: SetupLike) -> List[str]:
+    """
+    Flatten a setup into its 40 pieces in row-major order.
+
+    Accepts the transcribed JSON format ({'1': [...10 pieces], ..., '4': [...]}),
+    a dictionary of (row, col) -> piece, a list of (row, col, piece) tuples as returned by
+    get_setups_with_setup_ids, or an already flattened sequence of 40 pieces.
+    """
+    if isinstance(setup, dict):
+        keys = list(setup.keys())
+        if keys and isinstance(keys[0], tuple):
+            return [str(setup[position]) for position in sorted(setup)]
+        return [str(piece) for row in sorted(setup, key=int) for piece in setup[row]]
+
+    items = list(setup)
+    if items and isinstance(items[0], tuple):
+        return [str(piece) for _, _, piece in sorted(items)]
+    return [str(piece) for piece in items]
+
+
+def encode_setup(setup: SetupLike) -> np.ndarray:
+    """
+    Encode a setup as an array of 40 uint8 piece codes.
+
+    Raises:
+        ValueError: If the setup does not have 40 squares or contains an unknown piece
+    """
+    pieces = setup_to_pieces(setup)
+    if len(pieces) != SQUARES:
+        raise ValueError(f"Setup must have exactly {SQUARES} squares, got {len(pieces)}")
+
+    try:
+        return np.fromiter((PIECE_CODES[piece] for piece in pieces), dtype=np.uint8, count=SQUARES)
+    except KeyError as e:
+        raise ValueError(f"Invalid piece type: {e.args[0]}") from None
+
+
+def decode_setup(codes: Iterable[int]) -> Dict[str, List[str]]:
+    """Decode 40 piece codes back into the transcribed JSON format."""
+    pieces = [PIECES[code] for code in codes]
+    return {str(row + 1): pieces[row * COLUMNS:(row + 1) * COLUMNS] for row in range(ROWS)}
+
+
+# One character per piece for the canonical fingerprint; '10' is the only piece that needs a substitute.
+FINGERPRINT_CHARS = {piece: ('X' if piece == '10' else piece) for piece in PIECES}
+FINGERPRINT_PIECES = {char: piece for piece, char in FINGERPRINT_CHARS.items()}
+
+
+def setup_fingerprint(setup: SetupLike) -> str:
+    """
+    Return the canonical 40-character fingerprint of a setup.
+
+    Squares are listed in row-major order with one character per piece ('1'-'9', 'X' for '10',
+    'B' and 'F'), so two setups are identical exactly when their fingerprints are equal.
+
+    Raises:
+        ValueError: If the setup does not have 40 squares or contains an unknown piece
+    """
+    pieces = setup_to_pieces(setup)
+    if len(pieces) != SQUARES:
+        raise ValueError(f"Setup must have exactly {SQUARES} squares, got {len(pieces)}")
+
+    try:
+        return "".join(FINGERPRINT_CHARS[piece] for piece in pieces)
+    except KeyError as e:
+        raise ValueError(f"Invalid piece type: {e.args[0]}") from None
+
+
+def fingerprint_to_pieces(fingerprint: str) -> List[str]:
+    """Expand a fingerprint back into its 40 pieces in row-major order."""
+    return [FINGERPRINT_PIECES[char] for char in fingerprint]
+
+
+# Piece code of every fingerprint character by its byte value; other bytes map to _INVALID_CODE
+_INVALID_CODE = 255
+_FINGERPRINT_CODE_TABLE = np.full(256, _INVALID_CODE, dtype=np.uint8)
+for _char, _piece in FINGERPRINT_PIECES.items():
+    _FINGERPRINT_CODE_TABLE[ord(_char)] = PIECE_CODES[_piece]
+
+
+def fingerprints_to_codes(fingerprints: Sequence[str]) -> np.ndarray:
+    """
+    Decode many fingerprints into a K x 40 array of piece codes in one vectorized pass.
+
+    Raises:
+        ValueError: If a fingerprint does not have 40 characters or contains an unknown one
+    """
+    if any(len(fingerprint) != SQUARES for fingerprint in fingerprints):
+        raise ValueError(f"Fingerprints must have exactly {SQUARES} characters")
+
+    data = "".join(fingerprints).encode("ascii", errors="replace")
+    codes = _FINGERPRINT_CODE_TABLE[np.frombuffer(data, dtype=np.uint8)]
+    if np.any(codes == _INVALID_CODE):
+        raise ValueError("Invalid fingerprint character")
+    return codes.reshape(-1, SQUARES)
+
+
+def square_mask(squares: Iterable[int]) -> int:
+    """Return the bit mask of 0-based square indexes, in the format of the Setups bomb_mask column."""
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from src.database.setup_encoding import SQUARES, SetupLike, encode_setup, fingerprints_to_codes
+from src.database.sqlite_database import StrategoDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class SetupMatrix:
+    """
+    Compact in-memory store of all setups.
+
+    Setups are kept in one contiguous N x 40 uint8 array of piece codes (see setup_encoding),
+    with a parallel array of setup IDs, so a stored setup costs 48 bytes instead of 40 Python
+    tuples. Appends grow the arrays geometrically. The matrix and setup_ids properties return
+    views that stay valid after later appends.
+
+    A matrix loaded from the database remembers the cache generation it was synced at; sync
+    appends the setups stored since then by any process.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        capacity = max(capacity, 1)
+        self._matrix = np.zeros((capacity, SQUARES), dtype=np.uint8)
+        self._setup_ids = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._ids_sorted = True
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.generation: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """N x 40 array of piece codes, one row per setup."""
+        return self._matrix[:self._size]
+
+    @property
+    def setup_ids(self) -> np.ndarray:
+        """Setup IDs, parallel to the rows of matrix."""
+        return self._setup_ids[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the stored setups and their IDs."""
+        return self.matrix.nbytes + self.setup_ids.nbytes
+
+    def append(self, setup_id: int, setup: SetupLike) -> None:
+        """Append a single setup in any format accepted by encode_setup."""
+        self.extend(np.array([setup_id], dtype=np.int64), encode_setup(setup)[np.newaxis, :])
+
+    def extend(self, setup_ids: Iterable[int], encoded_setups: np.ndarray) -> None:
+        """
+        Append many already encoded setups at once.
+
+        Args:
+            setup_ids: IDs of the setups, one per row of encoded_setups
+            encoded_setups: K x 40 array of piece codes
+        """
+        setup_ids = np.asarray(setup_ids, dtype=np.int64)
+        encoded_setups = np.asarray(encoded_setups, dtype=np.uint8).reshape(-1, SQUARES)
+        if len(setup_ids) != len(encoded_setups):
+            raise ValueError(f"Got {len(setup_ids)} setup IDs for {len(encoded_setups)} setups")
+
+        with self._lock:
+            needed = self._size + len(setup_ids)
+            if needed > len(self._setup_ids):
+                self._grow(needed)
+
+            if len(setup_ids):
+                previous_id = self._setup_ids[self._size - 1] if self._size else None
+                if (previous_id is not None and setup_ids[0] <= previous_id) or np.any(np.diff(setup_ids) <= 0):
+                    self._ids_sorted = False
+
+            self._matrix[self._size:needed] = encoded_setups
+            self._setup_ids[self._size:needed] = setup_ids
+            self._size = needed
+
+    def index_of(self, setup_id: int) -> Optional[int]:
+        """Return the row of a setup in the matrix, or None if it is not stored."""
+        setup_ids = self.setup_ids
+        if self._ids_sorted:
+            index = int(np.searchsorted(setup_ids, setup_id))
+            return index if index < len(setup_ids) and setup_ids[index] == setup_id else None
+
+        matches = np.flatnonzero(setup_ids == setup_id)
+        return int(matches[0]) if len(matches) else None
+
+    def get(self, setup_id: int) -> Optional[np.ndarray]:
+        """Return the encoded setup with the given ID, or None if it is not stored."""
+        index = self.index_of(setup_id)
+        return None if index is None else self.matrix[index]
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(needed, 2 * len(self._setup_ids))
+        matrix = np.zeros((capacity, SQUARES), dtype=np.uint8)
+        setup_ids = np.zeros(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        setup_ids[:self._size] = self._setup_ids[:self._size]
+        self._matrix = matrix
+        self._setup_ids = setup_ids
+
+    def sync(self, database: StrategoDatabase) -> int:
+        """
+        Append the setups stored since the matrix was loaded or last synced.
+
+        Every ingest bumps the cache generation in the same transaction as its inserts, in
+        whichever process it runs, so nothing is read while the generation is unchanged. Setup
+        IDs are allocated in increasing order, so the new setups are those above the highest
+        loaded ID.
+
+        Returns:
+            The number of appended setups.
+        """
+        with self._sync_lock:
+            # Read the generation first: a setup stored after this read is picked up next time
+            generation = database.get_cache_generation()
+            if generation == self.generation:
+                return 0
+
+            last_setup_id = int(self.setup_ids.max()) if len(self) else 0
+            rows = database.get_setup_fingerprints_after(last_setup_id)
+            if rows:
+                setup_ids = np.fromiter((setup_id for setup_id, _ in rows), dtype=np.int64, count=len(rows))
+                self.extend(setup_ids, fingerprints_to_codes([fingerprint for _, fingerprint in rows]))
+            self.generation = generation
+            return len(rows)
+
+    @classmethod
+    def from_database(cls, database: Optional[StrategoDatabase] = None) -> "SetupMatrix":
+        """Load every stored setup from the database."""
+        setup_matrix = cls()
+        setup_matrix.sync(database or StrategoDatabase())
+
+        logger.info(f"Loaded {len(setup_matrix)} setups into memory ({setup_matrix.nbytes} bytes)")
+        return setup_matrix
+
+
+_loaded_matrices: Dict[str, SetupMatrix] = {}
+_loaded_matrices_lock = threading.Lock()
+
+
+def get_setup_matrix(database: Optional[StrategoDatabase] = None) -> SetupMatrix:
+    """
+    Return the process-wide SetupMatrix for a database, loading it on first use.
+
+    The matrix is synced on every call, so setups stored by bulk imports, upload workers or
+    other web workers are visible to the next read.
+    """
+    database = database or StrategoDatabase()
+    key = os.path.abspath(database.db_path)
+
+    with _loaded_matrices_lock:
+        setup_matrix = _loaded_matrices.get(key)
+        if setup_matrix is None:
+            setup_matrix = _loaded_matrices[key] = SetupMatrix.from_database(database)
+
+    setup_matrix.sync(database)
+    return setup_matrix
+
+
+def reset_setup_matrices() -> None:
+    """Forget all loaded matrices, so the next get_setup_matrix call reloads from the database."""
+    with _loaded_matrices_lock:
+        _loaded_matrices.clear()
@@ -1,13 +1,67 @@
+import json
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 from src.database.sqlite_database import StrategoDatabase, get_db_connection
+from src.database.setup_encoding import setup_fingerprint, setup_to_pieces
 from src.checks.staging_consistency_checks import check_piece_consistency
+from src.jobs.upload_jobs import STATUS_DONE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+INSERT_SETUP_SQUARE_SQL = "INSERT INTO GameSetups (setup_id, row, col, piece) VALUES (?, ?, ?, ?)"
+INSERT_SETUP_SQL = "INSERT INTO Setups (setup_id, fingerprint) VALUES (?, ?)"
+INSERT_GAME_RECORD_SQL = (
+    "INSERT INTO GameRecords (setup_id, date_played, opponent_id, opponent_name, result, moves, noob_killer) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+UPSERT_PIECE_HEATMAP_SQL = (
+    "INSERT INTO PieceHeatmap (scope, scope_value, square, piece, count) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (scope, scope_value, square, piece) DO UPDATE SET count = count + excluded.count"
+)
+BUMP_CACHE_GENERATION_SQL = "UPDATE CacheGeneration SET generation = generation + 1 WHERE id = 1"
+SELECT_STORED_UPLOAD_SQL = "SELECT setup_id FROM UploadJobs WHERE job_id = ? AND status = ?"
+FINISH_STORED_UPLOAD_SQL = (
+    "UPDATE UploadJobs SET status = ?, setup_id = ?, transcribed_setup = ?, error = NULL, "
+    "updated_at = CURRENT_TIMESTAMP WHERE job_id = ?"
+)
+
+
+def setup_square_rows(setup_id: int, pieces: List[str]) -> List[Tuple[int, int, int, str]]:
+    """Build the GameSetups rows for a setup given as 40 pieces in row-major order."""
+    return [(setup_id, index // 10 + 1, index % 10 + 1, piece) for index, piece in enumerate(pieces)]
+
+
+def game_record_row(setup_details: Dict[str, Any], setup_id: int) -> Tuple:
+    """Build the GameRecords row for a game. opponent_id is optional."""
+    return (setup_id,
+            setup_details["date_played"],
+            setup_details.get('opponent_id'),
+            setup_details["opponent_name"],
+            setup_details["result"],
+            setup_details["moves"],
+            setup_details['noob_killer'])
+
+
+def piece_heatmap_rows(pieces: List[str], opponent_name: Optional[str], result: Optional[str],
+                       is_new_setup: bool) -> List[Tuple[str, str, int, str, int]]:
+    """
+    Build the PieceHeatmap increments for one game.
+
+    Every game counts towards its opponent and result scope; the overall scope counts
+    distinct setups, so it is only incremented when the setup is new.
+    """
+    scopes = [('opponent', opponent_name), ('result', result)]
+    if is_new_setup:
+        scopes.append(('all', ''))
+    return [(scope, scope_value, square, piece, 1)
+            for scope, scope_value in scopes if scope_value is not None
+            for square, piece in enumerate(pieces)]
+
+
 class SetupProcessor:
     """Processes Stratego game setups and stores them in the database."""
     
@@ -19,14 +73,23 @@ class SetupProcessor:
             database: Optional database instance. If None, creates a new one.
         """
         self.db = database or StrategoDatabase()
-        self.temp_setup_id = 1
     
-    def process_setup(self, setup_details: Dict[str, Any]) -> int:
+    def process_setup(self, setup_details: Dict[str, Any], upload_job_id: Optional[int] = None) -> int:
         """
         Process a complete game setup and store it in the database.
         
+        The piece counts are validated in memory. Everything else happens in a single transaction
+        that holds the write lock from the start, so concurrent uploads cannot allocate the same
+        setup_id: resolving a duplicate or allocating a new setup_id, writing GameSetups, Setups,
+        GameRecords and the PieceHeatmap counts, and bumping the cache generation.
+        
+        For an upload job, the job is marked done with its setup_id in the same transaction, so a
+        worker that dies afterwards leaves no running job to be retried. A job that is already
+        done stores nothing and returns its setup_id.
+        
         Args:
             setup_details: Dictionary containing game details including setup, date, opponent, etc.
+            upload_job_id: The UploadJobs job the setup was transcribed for, if any
             
         Returns:
             The setup_id that was used for storing the game record.
@@ -41,42 +104,43 @@ class SetupProcessor:
             # Validate input
             self._validate_setup_details(setup_details)
             
-            new_setup_id = self.db.determine_new_setup_id_from_game_setups()
-            json_setup = setup_details["setup"]
-            
-            # Process setup through staging
-            self._stage_setup(json_setup)
-            self._check_consistency()
+            pieces = setup_to_pieces(setup_details["setup"])
+            check_piece_consistency(pieces)
+            fingerprint = setup_fingerprint(pieces)
             
-            # Check for duplicates
-            duplicate_setup_id = self.db.check_duplicate_setup()
+            with get_db_connection(self.db.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                if upload_job_id is not None:
+                    cursor.execute(SELECT_STORED_UPLOAD_SQL, (upload_job_id, STATUS_DONE))
+                    stored = cursor.fetchone()
+                    if stored:
+                        conn.commit()
+                        logger.info(f"Upload job {upload_job_id} was already stored with setup_id {stored[0]}")
+                        return stored[0]
+                
+                used_setup_id, is_new_setup = self._store_setup(cursor, pieces, fingerprint)
+                cursor.execute(INSERT_GAME_RECORD_SQL, game_record_row(setup_details, used_setup_id))
+                cursor.executemany(UPSERT_PIECE_HEATMAP_SQL, piece_heatmap_rows(
+                    pieces, setup_details["opponent_name"], setup_details["result"], is_new_setup))
+                cursor.execute(BUMP_CACHE_GENERATION_SQL)
+                if upload_job_id is not None:
+                    cursor.execute(FINISH_STORED_UPLOAD_SQL, (STATUS_DONE, used_setup_id,
+                                                              json.dumps(setup_details["setup"]), upload_job_id))
+                
+                conn.commit()
             
-            if duplicate_setup_id is None:
-                # New unique setup
-                self._save_new_setup(json_setup, new_setup_id)
-                used_setup_id = new_setup_id
-                logger.info(f"Created new setup with ID: {new_setup_id}")
+            if is_new_setup:
+                logger.info(f"Created new setup with ID: {used_setup_id}")
             else:
-                # Existing setup found
-                used_setup_id = duplicate_setup_id
-                logger.info(f"Using existing setup with ID: {duplicate_setup_id}")
-            
-            # Save game record
-            self._save_game_record(setup_details, used_setup_id)
-            
-            # Clean up staging
-            self.db.delete_from_temp_setup()
+                logger.info(f"Using existing setup with ID: {used_setup_id}")
             
             logger.info(f"Successfully processed setup, used setup_id: {used_setup_id}")
             return used_setup_id
             
         except Exception as e:
             logger.error(f"Error processing setup: {e}")
-            # Clean up staging on error
-            try:
-                self.db.delete_from_temp_setup()
-            except:
-                pass
             raise
     
     def _validate_setup_details(self, setup_details: Dict[str, Any]) -> None:
@@ -98,74 +162,47 @@ class SetupProcessor:
         
         # Validate each row has 10 pieces
         for row_num, pieces in setup.items():
+            if str(row_num) not in ('1', '2', '3', '4'):
+                raise ValueError(f"Invalid row number: {row_num}")
             if len(pieces) != 10:
                 raise ValueError(f"Row {row_num} must have exactly 10 pieces, got {len(pieces)}")
     
-    def _stage_setup(self, json_setup: Dict[str, List[str]]) -> None:
-        """Stage the setup in the temporary table."""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            for row, values in json_setup.items():
-                for index, value in enumerate(values):
-                    cursor.execute(
-                        "INSERT INTO TempSetup (setup_id, row, col, piece) VALUES (?, ?, ?, ?)",
-                        (self.temp_setup_id, int(row), index + 1, str(value))
-                    )
-            conn.commit()
-    
-    def _check_consistency(self) -> None:
-        """Check the staged setup for piece consistency."""
-        pieces = self.db.select_pieces_from_staging_setup(self.temp_setup_id)
-        check_piece_consistency(pieces)
-    
-    def _save_new_setup(self, json_setup: Dict[str, List[str]], setup_id: int) -> None:
-        """Save a new setup to the GameSetups table."""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            for row, values in json_setup.items():
-                for index, value in enumerate(values):
-                    cursor.execute(
-                        "INSERT INTO GameSetups (setup_id, row, col, piece) VALUES (?, ?, ?, ?)",
-                        (setup_id, int(row), index + 1, str(value))
-                    )
-            conn.commit()
-    
-    def _save_game_record(self, setup_details: Dict[str, Any], setup_id: int) -> None:
-        """Save the game record to the GameRecords table."""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Handle optional fields
-            opponent_id = setup_details.get('opponent_id')
-            noob_killer = setup_details['noob_killer']
-            
-            cursor.execute(
-                "INSERT INTO GameRecords (setup_id, date_played, opponent_id, opponent_name, result, moves, noob_killer) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (setup_id,
-                 setup_details["date_played"],
-                 opponent_id,
-                 setup_details["opponent_name"],
-                 setup_details["result"],
-                 setup_details["moves"],
-                 noob_killer)
-            )
-            conn.commit()
-
-
-def process_game_setup(setup_details: Dict[str, Any]) -> int:
+    def _store_setup(self, cursor, pieces: List[str], fingerprint: str) -> Tuple[int, bool]:
+        """
+        Return the ID of the identical stored setup, or store the setup under a new ID.
+        
+        Must run inside the ingest transaction.
+        
+        Returns:
+            Tuple of (setup_id, whether the setup was newly stored)
+        """
+        cursor.execute("SELECT setup_id FROM Setups WHERE fingerprint = ?", (fingerprint,))
+        duplicate = cursor.fetchone()
+        if duplicate:
+            return duplicate[0], False
+        
+        cursor.execute("SELECT MAX(setup_id) FROM Setups")
+        max_setup_id = cursor.fetchone()[0]
+        setup_id = max_setup_id + 1 if max_setup_id is not None else 1
+        
+        cursor.executemany(INSERT_SETUP_SQUARE_SQL, setup_square_rows(setup_id, pieces))
+        cursor.execute(INSERT_SETUP_SQL, (setup_id, fingerprint))
+        return setup_id, True
+
+
+def process_game_setup(setup_details: Dict[str, Any], upload_job_id: Optional[int] = None) -> int:
     """
     Convenience function to process a game setup.
     
     Args:
         setup_details: Dictionary containing game details
+        upload_job_id: The upload job to mark done in the same transaction, if any
         
     Returns:
         The setup_id used for the game record
     """
     processor = SetupProcessor()
-    return processor.process_setup(setup_details)
+    return processor.process_setup(setup_details, upload_job_id)
 
 
 # Example usage (for testing purposes only)
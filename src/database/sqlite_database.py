@@ -1,13 +1,27 @@
+import json
 import sqlite3
 from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Dict, List, Sequence, Tuple, Optional
 from src.database.append_conditions_params import build_conditions_and_params
+from src.database.migrations import LATEST_VERSION, PIECE_MASK_COLUMNS, get_schema_version
+from src.database.setup_encoding import COLUMNS, FINGERPRINT_PIECES, setup_fingerprint
 import logging
 import os
+import threading
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'sqlite_database.db')
 
+# Stay well below SQLite's default limit of 999 bound parameters per statement.
+MAX_QUERY_PARAMETERS = 500
+
+# ORDER BY clauses of get_setup_results_page; ties go to the newest setup.
+SETUP_RESULT_ORDERINGS = {
+    'games': "games DESC, s.setup_id DESC",
+    'win_rate': "CAST(wins AS REAL) / games DESC NULLS LAST, games DESC, s.setup_id DESC",
+    'newest': "s.setup_id DESC",
+}
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -17,46 +31,180 @@ class DatabaseError(Exception):
     pass
 
 
+# Connection settings, overridable through the environment. WAL lets readers continue while an
+# ingest holds the write lock; synchronous=NORMAL is durable across application crashes in WAL mode.
+SQLITE_JOURNAL_MODE = os.getenv("STRATEGO_SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("STRATEGO_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("STRATEGO_SQLITE_CACHE_SIZE", "-16000"))  # negative: KiB
+SQLITE_MMAP_SIZE = int(os.getenv("STRATEGO_SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("STRATEGO_SQLITE_BUSY_TIMEOUT", "30"))
+
+# Idle connections kept per thread and database; nested get_db_connection calls open extra ones.
+MAX_IDLE_CONNECTIONS = 4
+
+_checked_paths = set()
+_thread_local = threading.local()
+
+
+def _check_schema_version(conn: sqlite3.Connection, db_path: str) -> None:
+    """
+    Refuse to work on a database whose schema is older than this code.
+
+    Migrations are never applied implicitly; run python -m src.database.migrations or
+    python manage.py migrate. Checked until the first connection of this process succeeds.
+    """
+    key = os.path.abspath(db_path)
+    if key in _checked_paths:
+        return
+    version = get_schema_version(conn)
+    if version < LATEST_VERSION:
+        raise DatabaseError(
+            f"Database schema of {db_path} is at version {version}, expected {LATEST_VERSION}. "
+            f"Run python -m src.database.migrations or python manage.py migrate first."
+        )
+    _checked_paths.add(key)
+
+
+def _idle_connections() -> Dict[str, List[sqlite3.Connection]]:
+    if not hasattr(_thread_local, "idle"):
+        _thread_local.idle = {}
+    return _thread_local.idle
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """Open a connection with the configured pragmas, after checking the schema version."""
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        # Before the pragmas: switching to WAL already writes to an outdated database
+        _check_schema_version(conn, db_path)
+    except BaseException:
+        conn.close()
+        raise
+    conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    return conn
+
+
+def close_thread_connections(db_path: Optional[str] = None) -> None:
+    """
+    Close the idle pooled connections of the calling thread.
+
+    Args:
+        db_path: Only close connections to this database. Defaults to all databases.
+    """
+    idle = _idle_connections()
+    keys = [os.path.abspath(db_path)] if db_path else list(idle)
+    for key in keys:
+        for conn in idle.pop(key, []):
+            conn.close()
+
+
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections."""
+def get_db_connection(db_path: Optional[str] = None):
+    """Context manager for database connections.
+
+    Connections are pooled per thread and reused across calls. Changes must be committed inside
+    the block: a transaction that is still open when the block exits is rolled back, as is the
+    transaction of a block that raises.
+
+    Args:
+        db_path: Optional path to the database file. Defaults to DATABASE_PATH.
+    """
     conn = None
+    db_path = db_path or DATABASE_PATH
+    key = os.path.abspath(db_path)
+    idle = _idle_connections().setdefault(key, [])
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = idle.pop() if idle else _open_connection(db_path)
         yield conn
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
         if conn:
             conn.rollback()
         raise DatabaseError(f"Database operation failed: {e}")
+    except BaseException:
+        if conn:
+            conn.rollback()
+        raise
     finally:
         if conn:
-            conn.close()
+            if conn.in_transaction:
+                conn.rollback()
+            if len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(conn)
+            else:
+                conn.close()
 
 
 class StrategoDatabase:
     """Database operations for Stratego game analysis."""
 
-    def __init__(self):
-        self.db_path = DATABASE_PATH
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DATABASE_PATH
 
     def get_all_setup_positions(self) -> List[Tuple]:
         """Retrieve all setup positions from the database."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM GameSetups")
             return cursor.fetchall()
 
+    def get_all_setup_pieces(self) -> List[Tuple[int, str]]:
+        """Retrieve (setup_id, piece) for every square, ordered by setup and then row-major position."""
+        return [
+            (setup_id, FINGERPRINT_PIECES[char])
+            for setup_id, fingerprint in self.get_all_setup_fingerprints()
+            for char in fingerprint
+        ]
+
+    def get_all_setup_fingerprints(self) -> List[Tuple[int, str]]:
+        """Retrieve (setup_id, fingerprint) for every stored setup, one row per setup, ordered by setup_id."""
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT setup_id, fingerprint FROM Setups ORDER BY setup_id")
+            return cursor.fetchall()
+
+    def get_setup_fingerprints_after(self, setup_id: int) -> List[Tuple[int, str]]:
+        """Retrieve (setup_id, fingerprint) for the setups with a higher ID, ordered by setup_id."""
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT setup_id, fingerprint FROM Setups WHERE setup_id > ? ORDER BY setup_id", (setup_id,))
+            return cursor.fetchall()
+
+    def get_setup_ids_by_flag_and_bombs(self, flag_square: int, bomb_mask: int = 0) -> List[int]:
+        """
+        Find the setups with the flag on a square and bombs on at least the squares of a mask.
+
+        Args:
+            flag_square: 0-based square index of the flag (see setup_encoding.square_index)
+            bomb_mask: Bit mask of the squares that must hold a bomb (see setup_encoding.square_mask)
+
+        Returns:
+            The matching setup IDs in ascending order.
+        """
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           SELECT setup_id
+                           FROM Setups
+                           WHERE flag_square = ?
+                             AND (bomb_mask & ?) = ?
+                           ORDER BY setup_id
+                           """, (flag_square, bomb_mask, bomb_mask))
+            return [row[0] for row in cursor.fetchall()]
+
     def get_pieces_at_position(self, row: int, col: int) -> List[Tuple[str]]:
         """Get all pieces at a specific position across all setups."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT piece FROM GameSetups WHERE row = ? AND col = ?", (row, col))
             return cursor.fetchall()
 
     def get_pieces_at_position_for_opponent(self, opponent: str, row: int, col: int) -> List[Tuple[str]]:
         """Get pieces at a specific position for games against a specific opponent."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                            SELECT s.piece
@@ -68,89 +216,293 @@ class StrategoDatabase:
                            """, (opponent, row, col))
             return cursor.fetchall()
 
+    def get_setup_ids_by_piece_masks(self, piece_masks: Sequence[Tuple[Sequence[str], int]],
+                                     indexed_square: Optional[Tuple[int, Sequence[str]]] = None) -> List[int]:
+        """
+        Find the setups whose squares hold given pieces, using the generated bitboard columns of Setups.
+
+        Args:
+            piece_masks: (pieces, squares mask) pairs; every square of a mask must hold one of
+                the pieces of its pair (see pattern_search.SetupPattern.piece_masks)
+            indexed_square: Optional (0-based square, pieces) that the matching setups hold on one
+                of their squares. Its setups are looked up in idx_square_piece_setup first, so only
+                they are read from Setups and checked against the masks; without it, every setup is
+                checked (see pattern_search.SetupPattern.indexed_square).
+
+        Returns:
+            The matching setup IDs in ascending order.
+        """
+        conditions, params = [], []
+        if indexed_square is not None:
+            square, pieces = indexed_square
+            row, col = divmod(square, COLUMNS)
+            conditions.append(f"g.row = ? AND g.col = ? AND g.piece IN ({', '.join('?' * len(pieces))})")
+            params.extend([row + 1, col + 1, *pieces])
+        for pieces, mask in piece_masks:
+            board = " | ".join(f"s.{PIECE_MASK_COLUMNS[piece]}" for piece in pieces)
+            conditions.append(f"(({board}) & ?) = ?")
+            params.extend([mask, mask])
+
+        source = "GameSetups g JOIN Setups s ON s.setup_id = g.setup_id" if indexed_square is not None else "Setups s"
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                           SELECT s.setup_id
+                           FROM {source}
+                           WHERE {" AND ".join(conditions) if conditions else "1=1"}
+                           ORDER BY s.setup_id
+                           """, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_piece_heatmap_counts(self, scope: str, scope_value: str = '') -> List[Tuple[int, str, int]]:
+        """Get the materialized (square, piece, count) rows of one PieceHeatmap scope."""
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           SELECT square, piece, count
+                           FROM PieceHeatmap
+                           WHERE scope = ?
+                             AND scope_value = ?
+                           """, (scope, scope_value))
+            return cursor.fetchall()
+
+    def get_opponent_setup_results(self, opponent: str) -> List[Tuple[int, str, str, int]]:
+        """
+        Aggregate all games against an opponent in one query.
+
+        Returns:
+            (setup_id, fingerprint, result, games) for every setup and result played against the opponent.
+        """
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           SELECT r.setup_id, s.fingerprint, r.result, COUNT(*)
+                           FROM GameRecords r
+                                    INNER JOIN Setups s ON s.setup_id = r.setup_id
+                           WHERE r.opponent_name = ?
+                           GROUP BY r.setup_id, r.result
+                           """, (opponent,))
+            return cursor.fetchall()
+
+    def get_setup_results_page(self, setup_ids: Sequence[int], limit: int, offset: int = 0,
+                               order_by: str = 'games') -> List[Tuple[int, str, int, int, int, int]]:
+        """
+        Aggregate the games of a set of setups and return one page of them.
+
+        The ids are bound as a single JSON array and joined through json_each, so any number of
+        setups takes one statement; every setup is then found by its primary key and its games
+        through idx_game_records_setup.
+
+        Args:
+            setup_ids: Setup IDs to aggregate, e.g. the matches of pattern_search.find_matching_setups
+            limit: Maximum number of setups to return
+            offset: Number of setups to skip
+            order_by: One of SETUP_RESULT_ORDERINGS
+
+        Returns:
+            (setup_id, fingerprint, games, wins, draws, losses) for the setups on the requested page.
+
+        Raises:
+            ValueError: If order_by is unknown
+        """
+        if order_by not in SETUP_RESULT_ORDERINGS:
+            raise ValueError(f"Unknown setup result ordering: {order_by!r}")
+
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                           SELECT s.setup_id,
+                                  s.fingerprint,
+                                  COUNT(r.record_id)                   AS games,
+                                  COALESCE(SUM(r.result = 'win'), 0)  AS wins,
+                                  COALESCE(SUM(r.result = 'draw'), 0) AS draws,
+                                  COALESCE(SUM(r.result = 'loss'), 0) AS losses
+                           FROM json_each(?) m
+                                    INNER JOIN Setups s ON s.setup_id = m.value
+                                    LEFT JOIN GameRecords r ON r.setup_id = s.setup_id
+                           GROUP BY s.setup_id
+                           ORDER BY {SETUP_RESULT_ORDERINGS[order_by]}
+                           LIMIT ? OFFSET ?
+                           """, (json.dumps(list(setup_ids)), limit, offset))
+            return cursor.fetchall()
+
+    def get_setup_result_totals(self, setup_ids: Sequence[int]) -> Tuple[int, int, int, int]:
+        """
+        Count the games of a set of setups, see get_setup_results_page.
+
+        Returns:
+            (games, wins, draws, losses) over all setups.
+        """
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           SELECT COUNT(*),
+                                  COALESCE(SUM(r.result = 'win'), 0),
+                                  COALESCE(SUM(r.result = 'draw'), 0),
+                                  COALESCE(SUM(r.result = 'loss'), 0)
+                           FROM json_each(?) m
+                                    INNER JOIN GameRecords r ON r.setup_id = m.value
+                           """, (json.dumps(list(setup_ids)),))
+            return cursor.fetchone()
+
+    def get_cache_generation(self) -> int:
+        """Get the counter that is bumped by every ingest, used to invalidate cached query results."""
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT generation FROM CacheGeneration WHERE id = 1")
+            return cursor.fetchone()[0]
+
     def determine_new_setup_id_from_game_setups(self) -> int:
         """Determine the next available setup ID."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT MAX(setup_id) FROM GameSetups")
+            cursor.execute("SELECT MAX(setup_id) FROM Setups")
             result = cursor.fetchone()
             return result[0] + 1 if result and result[0] is not None else 1
 
     def select_opponent_id_and_name(self, opponent: str) -> Optional[Tuple]:
         """Get opponent ID and name from the database."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT opponent_id, opponent_name FROM Opponents WHERE opponent_name = ?", (opponent,))
             return cursor.fetchone()
 
     def select_everything_from_staging_setup(self, setup_id: int) -> List[Tuple]:
         """Get all data from temporary setup table for a specific setup ID."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM TempSetup WHERE setup_id = ?", (setup_id,))
             return cursor.fetchall()
 
     def select_pieces_from_staging_setup(self, setup_id: int) -> List[str]:
         """Get pieces from temporary setup table for a specific setup ID."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT piece FROM TempSetup WHERE setup_id = ?", (setup_id,))
             return [row[0] for row in cursor.fetchall()]
 
     def delete_from_temp_setup(self) -> None:
         """Clear all data from temporary setup table."""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM TempSetup")
             conn.commit()
 
-    def check_duplicate_setup(self) -> Optional[int]:
-        """Check if the current temporary setup matches an existing setup."""
-        with get_db_connection() as conn:
+    def find_setup_id_by_fingerprint(self, fingerprint: str) -> Optional[int]:
+        """Return the ID of the stored setup with the given fingerprint, if any."""
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                           SELECT gs.setup_id
-                           FROM GameSetups gs
-                                    JOIN TempSetup ts ON gs.row = ts.row AND gs.col = ts.col AND gs.piece = ts.piece
-                           GROUP BY gs.setup_id
-                           HAVING COUNT(*) = 40
-                           """)
+            cursor.execute("SELECT setup_id FROM Setups WHERE fingerprint = ?", (fingerprint,))
             result = cursor.fetchone()
             return result[0] if result else None
 
-    def get_setup_id_with_game_record_filters(self, **kwargs) -> List[Tuple[str]]:
+    def check_duplicate_setup(self) -> Optional[int]:
+        """Check if the current temporary setup matches an existing setup."""
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT row, col, piece FROM TempSetup")
+            squares = cursor.fetchall()
+        try:
+            fingerprint = setup_fingerprint(squares)
+        except ValueError:
+            # An incomplete or invalid staged setup cannot match a stored one
+            return None
+        return self.find_setup_id_by_fingerprint(fingerprint)
+
+    def get_setup_id_with_game_record_filters(self, **kwargs) -> List[int]:
         """Return all setups that satisfy the filters that are applied."""
 
-        conditions, params = build_conditions_and_params(kwargs)
-
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        where_clause, params = self._game_record_where_clause(kwargs)
 
         query = f"""
                 SELECT setup_id
                 FROM GameRecords
                 WHERE {where_clause}
-                ORDER BY setup_id DESC
+                ORDER BY setup_id DESC, record_id DESC
             """
 
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             return [result[0] for result in cursor.fetchall()]
 
-    def get_setups_with_setup_ids(self, setup_ids: List[int]):
-        """Get all setups that have specified ids. Complementary method to get_setup_id_with_game_record_filters."""
-        results = []
-        for setup_id in setup_ids:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                                   SELECT row, col, piece
-                                   FROM GameSetups 
-                                   WHERE setup_id = ?
-                                   """,(setup_id,))
-                result = cursor.fetchall()
-                results.append(result)
-        return results
+    def count_setups_with_game_record_filters(self, **kwargs) -> int:
+        """Count the game records that satisfy the filters that are applied."""
+
+        where_clause, params = self._game_record_where_clause(kwargs)
+
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM GameRecords WHERE {where_clause}", params)
+            return cursor.fetchone()[0]
+
+    def get_setup_id_page_with_game_record_filters(self, limit: int, offset: int = 0, **kwargs) -> List[int]:
+        """
+        Return one page of the setups that satisfy the filters that are applied.
+
+        Uses the same ordering as get_setup_id_with_game_record_filters, so consecutive pages
+        concatenate to the full result.
+
+        Args:
+            limit: Maximum number of setup IDs to return
+            offset: Number of matching records to skip
+            **kwargs: Filters accepted by build_conditions_and_params
+
+        Returns:
+            The setup IDs on the requested page.
+        """
+
+        where_clause, params = self._game_record_where_clause(kwargs)
+
+        query = f"""
+                SELECT setup_id
+                FROM GameRecords
+                WHERE {where_clause}
+                ORDER BY setup_id DESC, record_id DESC
+                LIMIT ? OFFSET ?
+            """
+
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params + [limit, offset])
+            return [result[0] for result in cursor.fetchall()]
+
+    @staticmethod
+    def _game_record_where_clause(filters: dict) -> Tuple[str, list]:
+        """Build the WHERE clause and its parameters for the GameRecords filters."""
+        conditions, params = build_conditions_and_params(filters)
+        return (" AND ".join(conditions) if conditions else "1=1"), params
+
+    def get_setups_with_setup_ids(self, setup_ids: List[int]) -> List[List[Tuple[int, int, str]]]:
+        """
+        Get all setups that have specified ids. Complementary method to get_setup_id_with_game_record_filters.
+
+        The setups are read from Setups, one row per setup instead of 40 GameSetups rows, over a
+        single connection in as few queries as the parameter limit allows.
+
+        Args:
+            setup_ids: Setup IDs to fetch. May contain duplicates.
+
+        Returns:
+            One list of (row, col, piece) tuples per requested id, in the same order as setup_ids.
+            Unknown ids yield an empty list.
+        """
+        squares_by_setup_id: Dict[int, List[Tuple[int, int, str]]] = {}
+        unique_ids = list(dict.fromkeys(setup_ids))
+
+        with get_db_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(unique_ids), MAX_QUERY_PARAMETERS):
+                chunk = unique_ids[start:start + MAX_QUERY_PARAMETERS]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(f"SELECT setup_id, fingerprint FROM Setups WHERE setup_id IN ({placeholders})", chunk)
+                for setup_id, fingerprint in cursor.fetchall():
+                    squares_by_setup_id[setup_id] = [
+                        (square // COLUMNS + 1, square % COLUMNS + 1, FINGERPRINT_PIECES[char])
+                        for square, char in enumerate(fingerprint)
+                    ]
+
+        return [squares_by_setup_id.get(setup_id, []) for setup_id in setup_ids]
 
 
 db = StrategoDatabase()
@@ -170,6 +522,40 @@ def get_pieces_at_position_for_opponent(opponent: str, row: int, col: int) -> Li
     return db.get_pieces_at_position_for_opponent(opponent, row, col)
 
 
+def get_setup_fingerprints_after(setup_id: int) -> List[Tuple[int, str]]:
+    return db.get_setup_fingerprints_after(setup_id)
+
+
+def get_setup_ids_by_flag_and_bombs(flag_square: int, bomb_mask: int = 0) -> List[int]:
+    return db.get_setup_ids_by_flag_and_bombs(flag_square, bomb_mask)
+
+
+def get_setup_ids_by_piece_masks(piece_masks: Sequence[Tuple[Sequence[str], int]],
+                                 indexed_square: Optional[Tuple[int, Sequence[str]]] = None) -> List[int]:
+    return db.get_setup_ids_by_piece_masks(piece_masks, indexed_square)
+
+
+def get_piece_heatmap_counts(scope: str, scope_value: str = '') -> List[Tuple[int, str, int]]:
+    return db.get_piece_heatmap_counts(scope, scope_value)
+
+
+def get_opponent_setup_results(opponent: str) -> List[Tuple[int, str, str, int]]:
+    return db.get_opponent_setup_results(opponent)
+
+
+def get_setup_results_page(setup_ids: Sequence[int], limit: int, offset: int = 0,
+                           order_by: str = 'games') -> List[Tuple[int, str, int, int, int, int]]:
+    return db.get_setup_results_page(setup_ids, limit, offset, order_by)
+
+
+def get_setup_result_totals(setup_ids: Sequence[int]) -> Tuple[int, int, int, int]:
+    return db.get_setup_result_totals(setup_ids)
+
+
+def get_cache_generation() -> int:
+    return db.get_cache_generation()
+
+
 def determine_new_setup_id_from_game_setups() -> int:
     return db.determine_new_setup_id_from_game_setups()
 
@@ -194,10 +580,22 @@ def check_duplicate_setup() -> Optional[int]:
     return db.check_duplicate_setup()
 
 
-def get_setup_id_with_game_record_filters(**kwargs):
+def find_setup_id_by_fingerprint(fingerprint: str) -> Optional[int]:
+    return db.find_setup_id_by_fingerprint(fingerprint)
+
+
+def get_setup_id_with_game_record_filters(**kwargs) -> List[int]:
     return db.get_setup_id_with_game_record_filters(**kwargs)
 
 
-def get_setups_with_setup_ids(setup_ids: List[int]) -> Optional[List[int]]:
+def count_setups_with_game_record_filters(**kwargs) -> int:
+    return db.count_setups_with_game_record_filters(**kwargs)
+
+
+def get_setup_id_page_with_game_record_filters(limit: int, offset: int = 0, **kwargs) -> List[int]:
+    return db.get_setup_id_page_with_game_record_filters(limit, offset, **kwargs)
+
+
+def get_setups_with_setup_ids(setup_ids: List[int]) -> List[List[Tuple[int, int, str]]]:
     return db.get_setups_with_setup_ids(setup_ids)
 
@@ -0,0 +1,134 @@
+"""
+Locate the 4 x 10 setup grid in a screenshot.
+
+The board renders every piece on a bright tile, separated from its neighbours by thin dark
+lines. Projecting a mask of bright pixels onto the x and y axes therefore gives 10 runs of
+bright columns and 4 runs of bright rows, whose bounds are the cells of the grid.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from src.database.setup_encoding import COLUMNS, ROWS
+
+# A pixel belongs to a tile if its brightest channel exceeds this value
+TILE_THRESHOLD = 150
+# Share of bright pixels a row or column of pixels needs to count as part of a tile
+MIN_TILE_DENSITY = 0.25
+# Runs shorter than this share of the median run are noise, e.g. text next to the board
+MIN_RUN_RATIO = 0.5
+
+Box = Tuple[int, int, int, int]
+
+
+class BoardNotFoundError(ValueError):
+    """Raised when a screenshot does not contain a recognizable 4 x 10 grid."""
+    pass
+
+
+class BoardGrid:
+    """Pixel bounds of the rows and columns of the setup grid in a screenshot."""
+
+    def __init__(self, row_bounds: List[Tuple[int, int]], column_bounds: List[Tuple[int, int]]):
+        self.row_bounds = row_bounds
+        self.column_bounds = column_bounds
+
+    @property
+    def box(self) -> Box:
+        """(left, top, right, bottom) of the whole grid."""
+        return self.column_bounds[0][0], self.row_bounds[0][0], self.column_bounds[-1][1], self.row_bounds[-1][1]
+
+    def cell_box(self, row: int, col: int) -> Box:
+        """(left, top, right, bottom) of a cell, with 0-based row and column."""
+        top, bottom = self.row_bounds[row]
+        left, right = self.column_bounds[col]
+        return left, top, right, bottom
+
+    def cell_boxes(self) -> List[Box]:
+        """The boxes of all 40 cells in row-major order, matching setup_encoding.square_index."""
+        return [self.cell_box(row, col) for row in range(ROWS) for col in range(COLUMNS)]
+
+    def offset(self, dx: int, dy: int) -> "BoardGrid":
+        """Return the grid shifted by (dx, dy), e.g. to map it into a cropped image."""
+        return BoardGrid([(top + dy, bottom + dy) for top, bottom in self.row_bounds],
+                         [(left + dx, right + dx) for left, right in self.column_bounds])
+
+
+def tile_mask(image: Image.Image, threshold: int = TILE_THRESHOLD) -> np.ndarray:
+    """Boolean mask of the pixels that are bright enough to belong to a tile."""
+    # Taking the brightest channel band by band is far faster than a numpy max over the channel axis
+    red, green, blue = image.convert('RGB').split()
+    return np.asarray(ImageChops.lighter(ImageChops.lighter(red, green), blue)) > threshold
+
+
+def _runs(profile: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """Return the [start, end) ranges where profile is above threshold."""
+    above = np.concatenate(([False], profile > threshold, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def _select_runs(runs: List[Tuple[int, int]], count: int, axis_name: str) -> List[Tuple[int, int]]:
+    """
+    Pick the count consecutive runs that look most like a row of equal cells.
+
+    Raises:
+        BoardNotFoundError: If there are fewer than count plausible runs
+    """
+    if runs:
+        median_length = float(np.median([end - start for start, end in runs]))
+        runs = [run for run in runs if run[1] - run[0] >= MIN_RUN_RATIO * median_length]
+    if len(runs) < count:
+        raise BoardNotFoundError(f"Found {len(runs)} {axis_name} of tiles, expected {count}")
+
+    best, best_spread = None, None
+    for first in range(len(runs) - count + 1):
+        window = runs[first:first + count]
+        lengths = np.array([end - start for start, end in window], dtype=float)
+        starts = np.array([start for start, _ in window], dtype=float)
+        pitches = np.diff(starts) if count > 1 else np.zeros(1)
+        spread = lengths.std() / lengths.mean() + (pitches.std() / pitches.mean() if count > 1 else 0.0)
+        if best_spread is None or spread < best_spread:
+            best, best_spread = window, spread
+    return best
+
+
+def find_board(image: Image.Image, threshold: int = TILE_THRESHOLD) -> BoardGrid:
+    """
+    Find the setup grid in a screenshot.
+
+    Raises:
+        BoardNotFoundError: If no 4 x 10 grid of tiles is found
+    """
+    mask = tile_mask(image, threshold)
+
+    rows = _select_runs(_runs(mask.mean(axis=1), MIN_TILE_DENSITY * mask.mean(axis=1).max(initial=0)), ROWS, "rows")
+    board_rows = mask[rows[0][0]:rows[-1][1]]
+    column_profile = board_rows.mean(axis=0)
+    columns = _select_runs(_runs(column_profile, MIN_TILE_DENSITY * column_profile.max(initial=0)), COLUMNS, "columns")
+
+    # Measure the rows again within the board columns, so elements beside the board do not widen them
+    board_columns = mask[:, columns[0][0]:columns[-1][1]]
+    row_profile = board_columns.mean(axis=1)
+    rows = _select_runs(_runs(row_profile, MIN_TILE_DENSITY * row_profile.max(initial=0)), ROWS, "rows")
+
+    return BoardGrid(rows, columns)
+
+
+def crop_board(image: Image.Image, grid: Optional[BoardGrid] = None) -> Tuple[Image.Image, BoardGrid]:
+    """
+    Crop a screenshot to the setup grid.
+
+    Returns:
+        Tuple of (cropped image, grid in the coordinates of the cropped image)
+    """
+    grid = grid or find_board(image)
+    left, top, _, _ = grid.box
+    return image.crop(grid.box), grid.offset(-left, -top)
+
+
+def tile_board(image: Image.Image, grid: Optional[BoardGrid] = None) -> List[Image.Image]:
+    """Cut a screenshot into the 40 cell images of the setup, in row-major order."""
+    grid = grid or find_board(image)
+    return [image.crop(box) for box in grid.cell_boxes()]
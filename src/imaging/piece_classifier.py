@@ -0,0 +1,396 @@
+"""
+Offline classifier for the pieces on a setup screenshot.
+
+The board draws every piece type with the same glyph, so each cell of the grid found by
+find_board is reduced to a small normalized grayscale template and compared with the mean
+template of every piece type. A board is only accepted if every cell matches one piece type
+clearly and the pieces pass check_piece_consistency; otherwise the caller falls back to the
+vision model. Until every piece type has MIN_EXAMPLES_PER_PIECE confirmed examples, the
+classifier is not used at all.
+
+The templates are learned from confirmed setups: the few-shot examples, uploads whose setup a
+person confirmed, uploads the vision model transcribed the same way the classifier reads them,
+and transcribed screenshots whose setup is already in the database:
+    python -m src.imaging.piece_classifier [setups.jsonl ...] [--reset]
+where setups.jsonl holds {"image": ..., "setup": {...}} rows, e.g. from src.api.batch_transcribe.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.checks.setup_repair import RepairSuggestion, auto_repair
+from src.checks.staging_consistency_checks import check_piece_consistency
+from src.database.setup_encoding import PIECE_CODES, PIECES, SQUARES, decode_setup, setup_to_pieces
+from src.imaging.board import BoardGrid, BoardNotFoundError, tile_board
+from src.imaging.preprocess import ImageSource, load_image
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv(
+    "STRATEGO_PIECE_MODEL",
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'piece_templates.npz')
+)
+
+# Side of the square template a cell is reduced to
+FEATURE_SIZE = 24
+# Share of each cell side cut away, so the tile borders do not dominate the template
+CELL_MARGIN = 0.12
+# Every cell must be at least this similar to its piece type...
+MIN_SIMILARITY = 0.85
+# ...and this much more similar to it than to any other piece type
+MIN_MARGIN = 0.1
+# Confirmed cells every piece type needs before the classifier is used; the marshal, general, spy
+# and flag appear once per setup, so this is the number of confirmed screenshots
+MIN_EXAMPLES_PER_PIECE = 10
+# Weight of the template similarities in the cost of repairing a transcription
+REPAIR_SIMILARITY_WEIGHT = 2.0
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def cell_features(cell: Image.Image) -> np.ndarray:
+    """Reduce a cell image to a zero-mean, unit-length grayscale template."""
+    width, height = cell.size
+    inner = cell.convert('L').crop((int(width * CELL_MARGIN), int(height * CELL_MARGIN),
+                                    int(width * (1 - CELL_MARGIN)), int(height * (1 - CELL_MARGIN))))
+    features = np.asarray(inner.resize((FEATURE_SIZE, FEATURE_SIZE), Image.BILINEAR), dtype=np.float32).ravel()
+    features -= features.mean()
+    norm = np.linalg.norm(features)
+    return features / norm if norm else features
+
+
+class BoardClassification:
+    """The pieces predicted for the 40 cells of a board, with how sure each prediction is."""
+
+    def __init__(self, scores: np.ndarray):
+        self.scores = scores
+        ranked = np.sort(scores, axis=1)
+        self.pieces = [PIECES[code] for code in scores.argmax(axis=1)]
+        self.similarities = ranked[:, -1]
+        self.margins = ranked[:, -1] - ranked[:, -2]
+
+    @property
+    def setup(self) -> Dict[str, List[str]]:
+        """The pieces in the transcribed JSON format."""
+        return decode_setup(PIECE_CODES[piece] for piece in self.pieces)
+
+    @property
+    def is_confident(self) -> bool:
+        return bool(self.similarities.min() >= MIN_SIMILARITY and self.margins.min() >= MIN_MARGIN)
+
+    def square_costs(self) -> np.ndarray:
+        """Cost of every cell holding every piece type, for setup_repair: 0 for the best match."""
+        return REPAIR_SIMILARITY_WEIGHT * (self.similarities[:, None] - self.scores)
+
+
+def image_hash(image: Image.Image) -> str:
+    """Hash of the pixels of a screenshot, the same for every file and encoding of it."""
+    digest = hashlib.sha256(f"{image.mode} {image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PieceClassifier:
+    """
+    Nearest-centroid classifier over the cell templates of every piece type.
+
+    The hashes of the learned screenshots are kept with the templates, so a screenshot learned
+    again, by a repeated review or another run of the command line, is not counted twice.
+    """
+
+    def __init__(self, sums: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None,
+                 image_hashes: Iterable[str] = ()):
+        self.sums = sums if sums is not None else np.zeros((len(PIECES), FEATURE_SIZE * FEATURE_SIZE), dtype=np.float64)
+        self.counts = counts if counts is not None else np.zeros(len(PIECES), dtype=np.int64)
+        self.image_hashes: Set[str] = set(image_hashes)
+        self._centroids: Optional[np.ndarray] = None
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "PieceClassifier":
+        """Load the templates, or return an untrained classifier if there are none yet."""
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as model:
+            if model['sums'].shape[1] != FEATURE_SIZE * FEATURE_SIZE:
+                logger.warning(f"Piece templates in {path} have another size, starting over")
+                return cls()
+            if 'image_hashes' not in model.files:
+                logger.warning(f"Piece templates in {path} may count screenshots twice, starting over")
+                return cls()
+            return cls(model['sums'], model['counts'], model['image_hashes'].tolist())
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, sums=self.sums, counts=self.counts,
+                 image_hashes=np.array(sorted(self.image_hashes), dtype=str))
+        os.replace(temp_path, path)
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether every piece type has been seen in at least MIN_EXAMPLES_PER_PIECE confirmed cells."""
+        return bool(self.counts.min() >= MIN_EXAMPLES_PER_PIECE)
+
+    def add_example(self, image: Image.Image, setup: Any, grid: Optional[BoardGrid] = None) -> bool:
+        """
+        Learn the cells of a screenshot whose setup is known.
+
+        Returns:
+            Whether the screenshot was learned; False if it was learned before.
+
+        Raises:
+            BoardNotFoundError: If the screenshot has no recognizable grid
+            ValueError: If the setup does not have 40 known pieces
+        """
+        pieces = setup_to_pieces(setup)
+        if len(pieces) != SQUARES or any(piece not in PIECE_CODES for piece in pieces):
+            raise ValueError(f"Setup must have {SQUARES} known pieces")
+        digest = image_hash(image)
+        if digest in self.image_hashes:
+            return False
+
+        features = np.stack([cell_features(cell) for cell in tile_board(image, grid)])
+        codes = np.array([PIECE_CODES[piece] for piece in pieces])
+        np.add.at(self.sums, codes, features)
+        np.add.at(self.counts, codes, 1)
+        self.image_hashes.add(digest)
+        self._centroids = None
+        return True
+
+    def classify(self, image: Image.Image, grid: Optional[BoardGrid] = None) -> BoardClassification:
+        """
+        Predict the piece on every cell of a screenshot.
+
+        Raises:
+            BoardNotFoundError: If the screenshot has no recognizable grid
+        """
+        if self._centroids is None:
+            centroids = self.sums / np.maximum(self.counts, 1)[:, None]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            self._centroids = np.divide(centroids, norms, out=np.zeros_like(centroids), where=norms > 0)
+
+        features = np.stack([cell_features(cell) for cell in tile_board(image, grid)])
+        return BoardClassification(features @ self._centroids.T)
+
+
+def get_piece_classifier() -> PieceClassifier:
+    """Return the process-wide classifier, loaded on first use and learned from the few-shot examples if new."""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = _load_classifier()
+        return _classifier
+
+
+def _load_classifier(path: str = MODEL_PATH) -> PieceClassifier:
+    classifier = PieceClassifier.load(path)
+    if not classifier.counts.any():
+        for image_path, setup in few_shot_training_examples():
+            try:
+                classifier.add_example(load_image(image_path), setup)
+            except (BoardNotFoundError, ValueError) as e:
+                logger.warning(f"Skipping few-shot example {image_path}: {e}")
+    return classifier
+
+
+@contextmanager
+def _locked_model_file(path: str = MODEL_PATH):
+    """Hold an exclusive lock on the templates file, shared by every process that learns."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def classify_screenshot(source: ImageSource) -> Optional[Dict[str, List[str]]]:
+    """
+    Transcribe a screenshot locally, if the classifier is sure of the setup.
+
+    A classification that would need repairing is not guessed at: the vision model reads the
+    screenshot instead, and its transcription is repaired with the classifier's square costs.
+
+    Returns:
+        The setup in the transcribed JSON format, or None if the classifier is untrained, no grid
+        is found, or the setup is uncertain.
+    """
+    classifier = get_piece_classifier()
+    if not classifier.is_trained:
+        return None
+
+    try:
+        classification = classifier.classify(load_image(source))
+    except BoardNotFoundError as e:
+        logger.info(f"Local classifier skipped: {e}")
+        return None
+    if not classification.is_confident:
+        logger.info("Local classifier is not sure of every cell")
+        return None
+    try:
+        check_piece_consistency(classification.pieces)
+    except Exception as e:
+        logger.info(f"Local classification is inconsistent: {e}")
+        return None
+    return classification.setup
+
+
+def transcription_square_costs(source: ImageSource) -> Optional[np.ndarray]:
+    """
+    Judge from a screenshot how well every piece type fits every cell, for setup_repair.
+
+    Returns:
+        The square costs, or None if the classifier is untrained or cannot read the screenshot.
+    """
+    classifier = get_piece_classifier()
+    if not classifier.is_trained:
+        return None
+    try:
+        return classifier.classify(load_image(source)).square_costs()
+    except (BoardNotFoundError, OSError) as e:
+        logger.info(f"Cannot judge the cells of the screenshot: {e}")
+        return None
+
+
+def repair_transcription(source: ImageSource, setup: Dict[Any, List[str]]) -> Optional[RepairSuggestion]:
+    """
+    Repair a transcription that fails check_piece_consistency, using the screenshot to decide which cells change.
+
+    Returns:
+        The repair if it is unambiguous, otherwise None.
+    """
+    return auto_repair(setup, square_costs=transcription_square_costs(source))
+
+
+def learn_confirmed_setup(source: ImageSource, setup: Any) -> bool:
+    """
+    Add a screenshot whose setup a person confirmed to the shared classifier and save it.
+
+    The example is added to the templates saved on disk while holding the file lock, so examples
+    learned meanwhile by other workers are kept, and the process-wide classifier is replaced by
+    the result. Failures are logged and not raised, so storing a setup never fails because of
+    the classifier.
+
+    Returns:
+        Whether the screenshot was learned; False if it failed or was learned before.
+    """
+    global _classifier
+    try:
+        image = load_image(source)
+        with _classifier_lock, _locked_model_file():
+            classifier = _load_classifier()
+            if not classifier.add_example(image, setup):
+                logger.info("Screenshot of the confirmed setup was learned before")
+                return False
+            classifier.save()
+            _classifier = classifier
+        return True
+    except Exception as e:
+        logger.warning(f"Could not learn the pieces of a confirmed setup: {e}")
+        return False
+
+
+def learn_agreeing_transcription(source: ImageSource, setup: Any) -> bool:
+    """
+    Learn a screenshot transcribed by the vision model, if the classifier reads the same pieces.
+
+    Screenshots the classifier is already sure of are skipped: they are the ones it transcribed
+    itself, and learning its own output would only reinforce its mistakes.
+
+    Returns:
+        Whether the screenshot was learned.
+    """
+    try:
+        image = load_image(source)
+        classification = get_piece_classifier().classify(image)
+    except Exception as e:
+        logger.warning(f"Could not compare a transcription with the classifier: {e}")
+        return False
+    if classification.is_confident or classification.pieces != setup_to_pieces(setup):
+        return False
+    return learn_confirmed_setup(image, setup)
+
+
+def few_shot_training_examples() -> Iterable[Tuple[str, Dict[str, List[str]]]]:
+    """The bundled few-shot screenshots with their hand-checked setups."""
+    from src.api.few_shot import IMAGES_DIR, MANIFEST_PATH
+
+    with open(MANIFEST_PATH, encoding='utf-8') as file:
+        manifest = json.load(file)
+    for example in manifest['examples']:
+        image_path = os.path.join(IMAGES_DIR, example['image'])
+        if os.path.exists(image_path):
+            yield image_path, {row: ast.literal_eval(pieces) for row, pieces in example['output'].items()}
+
+
+def confirmed_training_examples(jsonl_path: str) -> Iterable[Tuple[str, Any]]:
+    """Rows of a {"image", "setup"} JSONL file whose setup is stored in the database."""
+    from src.database.setup_encoding import setup_fingerprint
+    from src.database.sqlite_database import StrategoDatabase
+
+    database = StrategoDatabase()
+    with open(jsonl_path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            try:
+                confirmed = database.find_setup_id_by_fingerprint(setup_fingerprint(row['setup'])) is not None
+            except ValueError:
+                confirmed = False
+            if confirmed and os.path.exists(row['image']):
+                yield row['image'], row['setup']
+            else:
+                logger.info(f"Skipping {row['image']}: setup not confirmed or screenshot missing")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn the piece templates from confirmed setups.")
+    parser.add_argument("jsonl", nargs="*", help='JSONL files with {"image": ..., "setup": {...}} rows')
+    parser.add_argument("--reset", action="store_true", help="Forget the templates learned so far")
+    args = parser.parse_args()
+
+    examples = list(few_shot_training_examples())
+    for path in args.jsonl:
+        examples.extend(confirmed_training_examples(path))
+
+    # Held throughout, so examples learned by upload workers meanwhile are not overwritten
+    with _locked_model_file():
+        classifier = PieceClassifier() if args.reset else PieceClassifier.load()
+        learned = 0
+        for image_path, setup in examples:
+            try:
+                learned += classifier.add_example(load_image(image_path), setup)
+            except (BoardNotFoundError, ValueError) as e:
+                logger.warning(f"Skipping {image_path}: {e}")
+        classifier.save()
+
+    missing = [piece for piece, count in zip(PIECES, classifier.counts) if count < MIN_EXAMPLES_PER_PIECE]
+    print(f"Learned {learned} new screenshots, {len(classifier.image_hashes)} screenshots and "
+          f"{int(classifier.counts.sum())} cells in total")
+    if missing:
+        print(f"Fewer than {MIN_EXAMPLES_PER_PIECE} examples for: {', '.join(missing)}; "
+              f"the vision model is used until there are")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
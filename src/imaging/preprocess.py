@@ -0,0 +1,111 @@
+"""
+In-memory preprocessing of setup screenshots before transcription.
+
+A screenshot is decoded once, optionally cropped to the setup grid and downscaled, enhanced
+with a single lookup table pass that combines the brightness and contrast adjustments, and
+encoded once. The encoded buffer is what the model receives and what the JSON editor shows as
+the enhanced image.
+"""
+import base64
+import io
+from typing import Optional, Tuple, Union
+
+from PIL import Image
+
+from src.imaging.board import BoardNotFoundError, find_board
+
+DEFAULT_BRIGHTNESS = 1.2
+DEFAULT_CONTRAST = 1.3
+JPEG_QUALITY = 95
+
+ImageSource = Union[bytes, str, Image.Image]
+
+
+class PreprocessedImage:
+    """An encoded, enhanced screenshot."""
+
+    def __init__(self, data: bytes, mime_type: str, size: Tuple[int, int],
+                 crop_box: Optional[Tuple[int, int, int, int]] = None):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.crop_box = crop_box
+        self._base64: Optional[str] = None
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+def load_image(source: ImageSource) -> Image.Image:
+    """Decode a screenshot given as encoded bytes, a path or an already opened image, as RGB."""
+    if isinstance(source, Image.Image):
+        image = source
+    elif isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+    else:
+        with Image.open(source) as opened:
+            opened.load()
+            image = opened.copy()
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def enhancement_lut(image: Image.Image, brightness: float, contrast: float) -> list:
+    """
+    Build one RGB lookup table equivalent to ImageEnhance.Brightness followed by ImageEnhance.Contrast.
+
+    Contrast blends towards the mean gray level of the brightened image. That mean is taken from
+    the gray histogram of the original image, mapped through the brightness step, so the image
+    is only traversed once more when the table is applied.
+    """
+    brightened = [min(255, max(0, int(value * brightness + 0.5))) for value in range(256)]
+
+    histogram = image.convert('L').histogram()
+    pixels = sum(histogram)
+    mean = int(sum(count * brightened[value] for value, count in enumerate(histogram)) / pixels + 0.5) if pixels else 0
+
+    lut = [min(255, max(0, int(mean + (value - mean) * contrast + 0.5))) for value in brightened]
+    return lut * 3
+
+
+def preprocess_image(source: ImageSource, brightness: float = DEFAULT_BRIGHTNESS, contrast: float = DEFAULT_CONTRAST,
+                     crop_box: Optional[Tuple[int, int, int, int]] = None, crop_to_board: bool = False,
+                     max_side: Optional[int] = None) -> PreprocessedImage:
+    """
+    Enhance a screenshot for transcription, entirely in memory.
+
+    Args:
+        source: Encoded image bytes, a path or a PIL image
+        brightness: Brightness factor (1.0 = no change, >1.0 = brighter)
+        contrast: Contrast factor (1.0 = no change, >1.0 = higher contrast)
+        crop_box: Optional (left, top, right, bottom) box to keep
+        crop_to_board: Crop to the setup grid found by find_board; the whole image is kept
+            if no grid is found. Ignored if crop_box is given.
+        max_side: Optional maximum width and height; larger images are downscaled
+
+    Returns:
+        The enhanced image, encoded once as JPEG.
+    """
+    image = load_image(source)
+    if crop_box is None and crop_to_board:
+        try:
+            crop_box = find_board(image).box
+        except BoardNotFoundError:
+            pass
+    if crop_box is not None:
+        image = image.crop(crop_box)
+    if max_side is not None and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    image = image.point(enhancement_lut(image, brightness, contrast))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+    return PreprocessedImage(buffer.getvalue(), 'image/jpeg', image.size, crop_box)
@@ -0,0 +1,352 @@
+"""
+Queue of uploaded setup screenshots, processed by a pool of worker threads.
+
+The add-setup view stores the screenshot, creates a job and returns right away. A worker then
+transcribes the image, with the local piece classifier or else the vision model, and stores the
+setup through process_game_setup. Jobs live in the UploadJobs table, so their status can be
+polled from any process and survives restarts.
+
+The web process starts a pool on its first upload. Workers can also run in their own process:
+    python -m src.jobs.upload_jobs [--workers 4]
+
+Job statuses:
+    queued        waiting for a worker
+    running       claimed by a worker, or by the review that stores the corrected setup
+    done          stored, setup_id is set
+    needs_review  transcribed, but the setup failed the piece checks; the user corrects the JSON
+    failed        transcription or storing failed with another error
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.checks.staging_consistency_checks import is_setup_configuration_error
+from src.database.sqlite_database import StrategoDatabase, get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_NEEDS_REVIEW = 'needs_review'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_DONE, STATUS_NEEDS_REVIEW, STATUS_FAILED)
+
+DEFAULT_WORKERS = int(os.getenv("STRATEGO_UPLOAD_WORKERS", "4"))
+# How often idle workers look for jobs queued by other processes
+POLL_INTERVAL = 2.0
+# Running jobs not updated for this long belong to a worker that died and are queued again
+STALE_JOB_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+UPLOAD_JOB_COLUMNS = ('job_id', 'status', 'image_path', 'setup_details', 'transcribed_setup', 'setup_id',
+                      'error', 'attempts', 'created_at', 'updated_at')
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class UploadJobQueue:
+    """Database operations on the UploadJobs table."""
+
+    def __init__(self, database: Optional[StrategoDatabase] = None):
+        self.db = database or StrategoDatabase()
+
+    def create_job(self, image_path: str, setup_details: Dict[str, Any]) -> int:
+        """
+        Queue an uploaded screenshot.
+
+        Args:
+            image_path: Path of the stored screenshot
+            setup_details: Game details for process_game_setup, without the setup
+
+        Returns:
+            The job_id of the new job.
+        """
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO UploadJobs (status, image_path, setup_details) VALUES (?, ?, ?)",
+                (STATUS_QUEUED, image_path, json.dumps(setup_details, default=_json_default))
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return a job with its JSON columns decoded, or None if it does not exist."""
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(UPLOAD_JOB_COLUMNS)} FROM UploadJobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+        return self._decode(row) if row else None
+
+    def claim_next_job(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running and return it, or None if the queue is empty."""
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f"""
+                           UPDATE UploadJobs
+                           SET status = ?, attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                           WHERE job_id = (SELECT job_id FROM UploadJobs WHERE status = ? ORDER BY job_id LIMIT 1)
+                           RETURNING {', '.join(UPLOAD_JOB_COLUMNS)}
+                           """, (STATUS_RUNNING, STATUS_QUEUED))
+            row = cursor.fetchone()
+            conn.commit()
+        return self._decode(row) if row else None
+
+    def claim_review_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Mark a job that needs review as running while the corrected setup is stored.
+
+        Returns:
+            The job, or None if it does not need review, e.g. because the same correction was
+            already submitted.
+        """
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                           UPDATE UploadJobs SET status = ?, updated_at = CURRENT_TIMESTAMP
+                           WHERE job_id = ? AND status = ?
+                           RETURNING {', '.join(UPLOAD_JOB_COLUMNS)}
+                           """, (STATUS_RUNNING, job_id, STATUS_NEEDS_REVIEW))
+            row = cursor.fetchone()
+            conn.commit()
+        return self._decode(row) if row else None
+
+    def finish_job(self, job_id: int, status: str, setup_id: Optional[int] = None,
+                   transcribed_setup: Optional[Dict[str, List[str]]] = None, error: Optional[str] = None) -> None:
+        """Record the outcome of a job."""
+        with get_db_connection(self.db.db_path) as conn:
+            conn.execute("""
+                         UPDATE UploadJobs
+                         SET status = ?, setup_id = ?, transcribed_setup = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                         WHERE job_id = ?
+                         """, (status, setup_id, json.dumps(transcribed_setup) if transcribed_setup is not None else None,
+                               error, job_id))
+            conn.commit()
+
+    def requeue_stale_jobs(self, older_than_seconds: int = STALE_JOB_SECONDS) -> int:
+        """Queue running jobs again whose worker stopped updating them; give up after MAX_ATTEMPTS."""
+        with get_db_connection(self.db.db_path) as conn:
+            cursor = conn.cursor()
+            stale = "status = ? AND updated_at < datetime('now', ?)"
+            cutoff = f"-{older_than_seconds} seconds"
+            cursor.execute(f"""
+                           UPDATE UploadJobs SET status = ?, error = 'Worker stopped', updated_at = CURRENT_TIMESTAMP
+                           WHERE {stale} AND attempts >= ?
+                           """, (STATUS_FAILED, STATUS_RUNNING, cutoff, MAX_ATTEMPTS))
+            cursor.execute(f"UPDATE UploadJobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE {stale}",
+                           (STATUS_QUEUED, STATUS_RUNNING, cutoff))
+            conn.commit()
+            return cursor.rowcount
+
+    @staticmethod
+    def _decode(row) -> Dict[str, Any]:
+        job = dict(zip(UPLOAD_JOB_COLUMNS, row))
+        job['setup_details'] = json.loads(job['setup_details'])
+        if job['transcribed_setup'] is not None:
+            job['transcribed_setup'] = json.loads(job['transcribed_setup'])
+        return job
+
+
+def transcribe_image(image_path: str) -> Dict[str, List[str]]:
+    """Enhance a screenshot in memory and transcribe it with the vision model."""
+    # Imported here, so the queue itself can be used without the image and model dependencies
+    from src.api.grok_api import transcribe_screenshot
+
+    return transcribe_screenshot(image_path)
+
+
+def store_transcribed_setup(setup_details: Dict[str, Any], transcribed_setup: Dict[str, List[str]], job_id: int) -> int:
+    """Store the setup of a job and mark the job done in the same transaction."""
+    from src.database.setup_to_sql import process_game_setup
+
+    return process_game_setup({**setup_details, 'setup': transcribed_setup}, upload_job_id=job_id)
+
+
+def repair_transcribed_setup(image_path: str, transcribed_setup: Dict[str, List[str]]) -> Optional[Dict[str, List[str]]]:
+    """Return the unambiguous repair of a setup that failed the piece checks, or None."""
+    from src.imaging.piece_classifier import repair_transcription
+
+    try:
+        repair = repair_transcription(image_path, transcribed_setup)
+    except Exception as e:
+        logger.warning(f"Could not repair the transcription of {image_path}: {e}")
+        return None
+    if repair is None:
+        return None
+    logger.info(f"Repaired transcription of {image_path}: {'; '.join(repair.changes)}")
+    return repair.setup
+
+
+def learn_confirmed_image(image_path: str, setup: Dict[str, List[str]]) -> None:
+    """Teach the local piece classifier a screenshot whose setup a person confirmed."""
+    from src.imaging.piece_classifier import learn_confirmed_setup
+
+    learn_confirmed_setup(image_path, setup)
+
+
+def learn_transcribed_image(image_path: str, setup: Dict[str, List[str]]) -> None:
+    """Teach the local piece classifier a screenshot transcribed by the vision model, if the two agree."""
+    from src.imaging.piece_classifier import learn_agreeing_transcription
+
+    learn_agreeing_transcription(image_path, setup)
+
+
+def process_upload_job(queue: UploadJobQueue, job: Dict[str, Any],
+                       transcribe: Callable[[str], Dict[str, List[str]]] = transcribe_image,
+                       store: Callable[[Dict[str, Any], Dict[str, List[str]], int], int] = store_transcribed_setup,
+                       repair: Callable[[str, Dict[str, List[str]]], Optional[Dict[str, List[str]]]] = repair_transcribed_setup,
+                       learn: Callable[[str, Dict[str, List[str]]], None] = learn_transcribed_image) -> str:
+    """
+    Transcribe and store the setup of a claimed job and record the outcome.
+
+    A transcription that fails the piece checks is repaired automatically if the repair is
+    unambiguous; otherwise the job needs review. A stored transcription that needed no repair is
+    offered to the piece classifier, which only learns it if it reads the screenshot the same
+    way. The screenshot is deleted once the job is done or failed. It is kept while the job
+    needs review, so the JSON editor can show it next to the transcription.
+
+    store marks the job done in the transaction that stores the game, so a worker that dies after
+    the commit leaves no running job behind, and storing a job that is already done is a no-op.
+    If recording a failure raises, the job stays running until requeue_stale_jobs retries it.
+
+    Returns:
+        The final status of the job.
+    """
+    transcribed_setup = None
+    repaired = False
+    try:
+        transcribed_setup = transcribe(job['image_path'])
+        try:
+            store(job['setup_details'], transcribed_setup, job['job_id'])
+        except Exception as e:
+            repaired_setup = repair(job['image_path'], transcribed_setup) if is_setup_configuration_error(e) else None
+            if repaired_setup is None:
+                raise
+            transcribed_setup = repaired_setup
+            repaired = True
+            store(job['setup_details'], transcribed_setup, job['job_id'])
+    except Exception as e:
+        if transcribed_setup is not None and is_setup_configuration_error(e):
+            status = STATUS_NEEDS_REVIEW
+        else:
+            status = STATUS_FAILED
+            logger.error(f"Upload job {job['job_id']} failed: {e}")
+        queue.finish_job(job['job_id'], status, transcribed_setup=transcribed_setup, error=str(e))
+    else:
+        status = STATUS_DONE
+        if not repaired:
+            learn(job['image_path'], transcribed_setup)
+
+    if status != STATUS_NEEDS_REVIEW:
+        remove_job_image(job)
+    return status
+
+
+def remove_job_image(job: Dict[str, Any]) -> None:
+    try:
+        os.remove(job['image_path'])
+    except OSError:
+        pass
+
+
+class UploadWorkerPool:
+    """Threads that take jobs from the queue until stopped."""
+
+    def __init__(self, queue: Optional[UploadJobQueue] = None, num_workers: int = DEFAULT_WORKERS,
+                 poll_interval: float = POLL_INTERVAL):
+        self.queue = queue or UploadJobQueue()
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "UploadWorkerPool":
+        self.queue.requeue_stale_jobs()
+        for number in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"upload-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def notify(self) -> None:
+        """Wake up idle workers after a job was queued."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim_next_job()
+            except Exception as e:
+                logger.error(f"Could not claim an upload job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            logger.info(f"Processing upload job {job['job_id']}")
+            try:
+                process_upload_job(self.queue, job)
+            except Exception as e:
+                logger.error(f"Could not record the outcome of upload job {job['job_id']}: {e}")
+
+
+_worker_pools: Dict[str, UploadWorkerPool] = {}
+_worker_pools_lock = threading.Lock()
+
+
+def get_upload_worker_pool(database: Optional[StrategoDatabase] = None) -> UploadWorkerPool:
+    """Return the process-wide worker pool for a database, starting it on first use."""
+    queue = UploadJobQueue(database)
+    key = os.path.abspath(queue.db.db_path)
+
+    with _worker_pools_lock:
+        if key not in _worker_pools:
+            _worker_pools[key] = UploadWorkerPool(queue).start()
+        return _worker_pools[key]
+
+
+def submit_upload(image_path: str, setup_details: Dict[str, Any], database: Optional[StrategoDatabase] = None) -> int:
+    """Queue a stored screenshot for transcription and return the job_id."""
+    pool = get_upload_worker_pool(database)
+    job_id = pool.queue.create_job(image_path, setup_details)
+    pool.notify()
+    return job_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued setup uploads.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of worker threads")
+    parser.add_argument("--database", help="Database file (default: data/sqlite_database.db)")
+    args = parser.parse_args()
+
+    pool = UploadWorkerPool(UploadJobQueue(StrategoDatabase(args.database)), num_workers=args.workers).start()
+    logger.info(f"Started {args.workers} upload workers")
+    try:
+        while True:
+            threading.Event().wait(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,297 @@
-import json
-import ast
+"""
+Parse the setup JSON answered by the vision model.
 
+The model is asked for {"1": "['6', '2', ...]", ..., "4": [...]}, but its answers vary: rows as
+strings, with or without brackets, or as JSON arrays, pieces quoted or bare, keys in single
+quotes, missing commas between rows, and prose or code fences around the object. The setup
+starts at the first brace followed by a row number, so braces in the prose before it are
+skipped. SetupStreamParser reads all of these in a single pass over the characters, without
+regular expressions or eval, and raises a SetupParseError with the line and column of the first
+problem. It can be fed the answer chunk by chunk while it streams in, so a malformed answer is
+rejected as soon as the problem arrives.
+"""
+from typing import Dict, Iterable, List, Optional
 
-def string_to_json(string):
-    import re
-    
-    # Find JSON content between first { and last }
-    json_match = re.search(r'\{.*\}', string, re.DOTALL)
-    if not json_match:
-        raise ValueError("No JSON object found in response")
-    
-    json_string = json_match.group(0)
-    setup = json.loads(json_string)
+from src.database.setup_encoding import COLUMNS, PIECE_CODES, PIECES, ROWS, SQUARES
 
-    for key in setup:
-        setup[key] = ast.literal_eval(setup[key])
+# Characters that separate or quote the pieces of a row; backslashes come from escaped quotes
+_ROW_SEPARATORS = frozenset(" \t\r\n,'\"\\")
+# Characters that quote a row number or a row given as a string
+_QUOTES = frozenset("'\"")
 
-    return setup
+# Parser states
+_BEFORE_OBJECT = 'before_object'
+_BEFORE_KEY = 'before_key'
+_IN_KEY = 'in_key'
+_BEFORE_COLON = 'before_colon'
+_BEFORE_ROW = 'before_row'
+_IN_ROW = 'in_row'
+_AFTER_ROW = 'after_row'
+_DONE = 'done'
 
 
+class SetupParseError(ValueError):
+    """Raised for a model answer that is not a valid setup, with the position of the problem."""
 
+    def __init__(self, message: str, position: int, line: int, column: int):
+        super().__init__(f"{message} at line {line}, column {column}")
+        self.position = position
+        self.line = line
+        self.column = column
 
+
+class ParsedSetup:
+    """The rows of a parsed setup, with the pieces as compact piece codes."""
+
+    def __init__(self, rows: Dict[str, bytes]):
+        self.rows = rows
+
+    @property
+    def setup(self) -> Dict[str, List[str]]:
+        """The setup in the transcribed JSON format."""
+        return {key: [PIECES[code] for code in self.rows[key]] for key in sorted(self.rows, key=int)}
+
+    @property
+    def codes(self) -> bytes:
+        """The piece codes of all squares in row-major order, see setup_encoding.PIECES."""
+        return b"".join(self.rows[key] for key in sorted(self.rows, key=int))
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.rows) == ROWS and len(self.codes) == SQUARES
+
+
+class SetupStreamParser:
+    """
+    Incremental parser for the setup JSON of a model answer.
+
+    Args:
+        exact_rows: Require 10 pieces in every row. Without it, rows of other lengths are
+            accepted, so setup_repair can deal with a missed or hallucinated piece.
+    """
+
+    def __init__(self, exact_rows: bool = True):
+        self.exact_rows = exact_rows
+        self.rows: Dict[str, bytes] = {}
+        self._state = _BEFORE_OBJECT
+        self._position = 0
+        self._line = 1
+        self._column = 1
+        self._key: List[str] = []
+        self._key_start = (0, 1, 1)
+        self._row = bytearray()
+        self._row_start = (0, 1, 1)
+        self._token: List[str] = []
+        self._token_start = (0, 1, 1)
+        # The quote the current key or string row opened with, if any
+        self._key_quote = '"'
+        self._row_quote: Optional[str] = None
+        # Whether the current row is a string of pieces without brackets
+        self._bare_row = False
+        # Until the colon after the first row number, a brace may just be part of the prose
+        self._tentative = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the closing brace has been read; anything fed afterwards is ignored."""
+        return self._state == _DONE
+
+    def feed(self, text: str) -> None:
+        """
+        Parse the next chunk of the answer.
+
+        Raises:
+            SetupParseError: As soon as the answer cannot be a valid setup
+        """
+        for char in text:
+            if self._state == _DONE:
+                return
+            if self._tentative:
+                self._step_tentatively(char)
+            else:
+                self._step(char)
+            self._position += 1
+            if char == "\n":
+                self._line += 1
+                self._column = 1
+            else:
+                self._column += 1
+
+    def close(self) -> ParsedSetup:
+        """
+        Finish parsing and return the setup.
+
+        Raises:
+            SetupParseError: If the answer ended before the setup was complete
+        """
+        if self._state == _BEFORE_OBJECT:
+            self._fail("No JSON object found in response", self._here())
+        if self._state != _DONE:
+            self._fail("Response ended inside the setup", self._here())
+        return ParsedSetup(dict(self.rows))
+
+    def _step_tentatively(self, char: str) -> None:
+        """Step into what may be the setup; on the first mismatch, look for the next brace instead."""
+        try:
+            self._step(char)
+        except SetupParseError:
+            self._tentative = False
+            self._state = _BEFORE_OBJECT
+            self._step(char)
+
+    def _step(self, char: str) -> None:
+        state = self._state
+        if state == _IN_ROW:
+            if self._bare_row and char == self._row_quote:
+                self._end_token()
+                self._end_row()
+                self._row_quote = None
+            elif char.isalnum():
+                if not self._token:
+                    self._token_start = self._here()
+                self._token.append(char)
+            elif char in _ROW_SEPARATORS:
+                self._end_token()
+            elif char == "]":
+                self._end_token()
+                self._end_row()
+            else:
+                self._fail(f"Unexpected {char!r} in row {self._key_text()}", self._here())
+        elif state == _BEFORE_OBJECT:
+            if char == "{":
+                self._state = _BEFORE_KEY
+                self._tentative = True
+        elif state == _BEFORE_KEY:
+            if char in _QUOTES:
+                self._open_key(char)
+            elif char == "}":
+                self._check_rows()
+                self._state = _DONE
+            elif not (char.isspace() or char == ","):
+                self._fail(f"Expected a row number, found {char!r}", self._here())
+        elif state == _IN_KEY:
+            if char == self._key_quote:
+                self._start_key()
+            else:
+                self._key.append(char)
+        elif state == _BEFORE_COLON:
+            if char == ":":
+                self._state = _BEFORE_ROW
+                self._row_quote = None
+                self._tentative = False
+            elif not char.isspace():
+                self._fail(f"Expected ':' after row {self._key_text()}, found {char!r}", self._here())
+        elif state == _BEFORE_ROW:
+            if char == "[":
+                self._start_row(bare=False)
+            elif char in _QUOTES and self._row_quote is None:
+                self._row_quote = char
+            elif self._row_quote is not None and char.isalnum():
+                # A string of pieces without brackets
+                self._start_row(bare=True)
+                self._step(char)
+            elif not char.isspace():
+                self._fail(f"Expected a list of pieces for row {self._key_text()}, found {char!r}", self._here())
+        elif state == _AFTER_ROW:
+            if char == self._row_quote:
+                self._row_quote = None
+            elif char == "}" and self._row_quote is None:
+                self._check_rows()
+                self._state = _DONE
+            elif char == "," and self._row_quote is None:
+                self._state = _BEFORE_KEY
+            elif char in _QUOTES:
+                # A missing comma between two rows
+                self._open_key(char)
+            elif not char.isspace():
+                self._fail(f"Unexpected {char!r} after row {self._key_text()}", self._here())
+
+    def _open_key(self, quote: str) -> None:
+        self._key = []
+        self._key_start = self._here()
+        self._key_quote = quote
+        self._state = _IN_KEY
+
+    def _start_key(self) -> None:
+        key = self._key_text()
+        if key not in {str(row) for row in range(1, ROWS + 1)}:
+            self._fail(f"Unknown row {key!r}, expected 1 to {ROWS}", self._key_start)
+        if key in self.rows:
+            self._fail(f"Row {key} appears twice", self._key_start)
+        self._state = _BEFORE_COLON
+
+    def _start_row(self, bare: bool) -> None:
+        self._row = bytearray()
+        self._row_start = self._here()
+        self._bare_row = bare
+        self._state = _IN_ROW
+
+    def _end_token(self) -> None:
+        if not self._token:
+            return
+        piece = "".join(self._token).upper()
+        self._token = []
+        if piece not in PIECE_CODES:
+            self._fail(f"Invalid piece type {piece!r} in row {self._key_text()}", self._token_start)
+        self._row.append(PIECE_CODES[piece])
+
+    def _end_row(self) -> None:
+        if self.exact_rows and len(self._row) != COLUMNS:
+            self._fail(f"Row {self._key_text()} has {len(self._row)} pieces instead of {COLUMNS}", self._row_start)
+        self.rows[self._key_text()] = bytes(self._row)
+        self._state = _AFTER_ROW
+
+    def _check_rows(self) -> None:
+        missing = [str(row) for row in range(1, ROWS + 1) if str(row) not in self.rows]
+        if missing:
+            self._fail(f"Missing row {', '.join(missing)}", self._here())
+
+    def _key_text(self) -> str:
+        return "".join(self._key).strip()
+
+    def _here(self):
+        return self._position, self._line, self._column
+
+    @staticmethod
+    def _fail(message: str, where) -> None:
+        raise SetupParseError(message, *where)
+
+
+def parse_setup(text: str, exact_rows: bool = True) -> ParsedSetup:
+    """
+    Parse a complete model answer.
+
+    Raises:
+        SetupParseError: If the answer does not contain a valid setup
+    """
+    parser = SetupStreamParser(exact_rows)
+    parser.feed(text)
+    return parser.close()
+
+
+def parse_setup_stream(chunks: Iterable[str], exact_rows: bool = True) -> ParsedSetup:
+    """
+    Parse a model answer while it streams in, stopping at the end of the setup.
+
+    Raises:
+        SetupParseError: As soon as a chunk makes the answer invalid
+    """
+    parser = SetupStreamParser(exact_rows)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser.close()
+
+
+def string_to_json(string: str, exact_rows: bool = False) -> Dict[str, List[str]]:
+    """
+    Parse a model answer into the transcribed JSON format ({'1': [...10 pieces], ..., '4': [...]}).
+
+    Rows with the wrong number of pieces are kept unless exact_rows is set, so the piece checks
+    and setup_repair can deal with them.
+
+    Raises:
+        SetupParseError: If the answer does not contain a valid setup
+    """
+    return parse_setup(string, exact_rows).setup
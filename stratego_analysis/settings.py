@@ -12,6 +12,14 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 
+from src.database.sqlite_database import (
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -74,10 +82,25 @@ WSGI_APPLICATION = 'stratego_analysis.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Django's own tables live next to the game data, so the app uses a single database. The
+# connection settings match the connections of src.database.sqlite_database.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / 'data' / 'sqlite_database.db',
+        # Keep one connection per thread open across requests instead of reconnecting every time
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE};'
+                f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS};'
+                f'PRAGMA cache_size = {SQLITE_CACHE_SIZE};'
+                f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE};'
+            ),
+        },
     }
 }
 